@@ -1,7 +1,7 @@
 from datetime import timedelta
 from pathlib import Path
 from django.conf import settings
-from decouple import config
+from decouple import Csv, config
 from django.conf.urls.static import static
 import os
 import environ
@@ -19,6 +19,20 @@ SECRET_KEY = config('SECRET_KEY')
 
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
+# Run tasks inline (no broker needed), e.g. for local development with the locmem/console email backends
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_BEAT_SCHEDULE = {
+    # Sweep the email outbox for rows whose task was never published or whose worker died
+    'deliver-outbound-email': {
+        'task': 'myapp.tasks.deliver_outbound_email',
+        'schedule': 60.0,
+    },
+    # Create next months' message partitions and archive cold months (myapp.archive)
+    'maintain-message-partitions': {
+        'task': 'myapp.tasks.maintain_message_partitions',
+        'schedule': 6 * 3600.0,
+    },
+}
 
 REST_AUTH = {
     'SIGNUP_FIELDS': {
@@ -70,7 +84,13 @@ INSTALLED_APPS = [
    
 ]
 
+# List endpoints (myapp.pagination): default and largest page size
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=20, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=100, cast=int)
+
 REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'myapp.pagination.BoundedLimitOffsetPagination',
+    'PAGE_SIZE': API_PAGE_SIZE,
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
@@ -83,8 +103,9 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'myapp.metrics.MetricsMiddleware',  # First, so its timings cover the whole stack
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'myapp.middleware.TokenAwareSessionMiddleware',  # Skips sessions for JWT requests
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -117,9 +138,9 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
-SESSION_ENGINE = "django.contrib.sessions.backends.db"  # Default: database-backed sessions
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"  # Reads from the cache, writes through to the database
 SESSION_COOKIE_AGE = 60 * 60 * 24  # Cookie lifespan: 1 day (in seconds)
-SESSION_SAVE_EVERY_REQUEST = True  # Renew session expiration with every request
+SESSION_SAVE_EVERY_REQUEST = False  # Only write sessions that changed; JWT requests never write
 SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', default=False, cast=bool)  # Use only on HTTPS
 SESSION_COOKIE_HTTPONLY = True # Use True in production if using HTTPS
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Session persists after closing the browser
@@ -168,7 +189,33 @@ DATABASES = {
     }
 }
 
-DATABASES["default"]=dj_database_url.parse(config("DATABASE_URL"))
+# Connection lifecycle. Requests are served through ASGI, where Django's
+# persistent connections don't work (each request may run in a different
+# thread, and the connections it leaves open are never reused), so on
+# PostgreSQL the default is Django's psycopg connection pool and
+# DB_CONN_MAX_AGE defaults to 0.
+#   DB_POOL=False       no pool: connections are opened per request, or kept for
+#                       DB_CONN_MAX_AGE seconds under a sync server
+#   DB_PGBOUNCER=True   running behind pgbouncer in transaction mode: no server-side
+#                       cursors (usually with DB_POOL=False, pgbouncer being the pool)
+DATABASES["default"] = dj_database_url.parse(
+    config("DATABASE_URL"),
+    conn_max_age=config('DB_CONN_MAX_AGE', default=0, cast=int),
+    conn_health_checks=config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+)
+if DATABASES["default"]["ENGINE"] == 'django.db.backends.postgresql':
+    DATABASES["default"].setdefault("OPTIONS", {})
+    DATABASES["default"]["OPTIONS"]["application_name"] = config('DB_APPLICATION_NAME', default='ispani')
+    if config('DB_POOL', default=True, cast=bool):
+        # The pool owns the connections, so they can't also be persistent
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+    if config('DB_PGBOUNCER', default=False, cast=bool):
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -194,7 +241,7 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 # Email Configuration
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'mail.ispani.net'  # Or your hosting provider's SMTP server
 EMAIL_PORT = 587  # Commonly 587 for TLS, 465 for SSL
 EMAIL_USE_TLS = True  # False if using SSL (port 465)
@@ -202,6 +249,11 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='info@ispani.net')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='Oculus@2025')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='info@ispani.net')
 SERVER_EMAIL = 'info@ispani.net'  # For admin emails
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)  # Seconds; SMTP has no timeout otherwise
+# Outbox retries back off exponentially from EMAIL_OUTBOX_RETRY_BASE seconds, capped at EMAIL_OUTBOX_RETRY_MAX
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+EMAIL_OUTBOX_RETRY_BASE = config('EMAIL_OUTBOX_RETRY_BASE', default=30, cast=int)
+EMAIL_OUTBOX_RETRY_MAX = config('EMAIL_OUTBOX_RETRY_MAX', default=3600, cast=int)
 
 SITE_ID = 1  # Required by allauth
 
@@ -235,43 +287,129 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 ASGI_APPLICATION = "backend.asgi.application"
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-# FIXED: Channel Layers Configuration
-# Use InMemoryChannelLayer for development to avoid Redis version compatibility issues
+# Cache: Redis is shared by all workers, so OTP, registration and password reset
+# entries survive a request landing on another process. myapp.cache adds a short
+# in-process L1 for read-mostly data. Set CACHE_BACKEND to LocMemCache for local
+# runs without Redis.
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': config('CACHE_LOCATION', default=REDIS_URL),
+        'KEY_PREFIX': 'ispani',
+        'TIMEOUT': 300,
+        'OPTIONS': {},
+    }
+}
+if 'redis' in CACHES['default']['BACKEND'].lower():
+    CACHES['default']['OPTIONS'] = {'socket_connect_timeout': 2, 'socket_timeout': 2}
+CACHE_SHARED_TTL = config('CACHE_SHARED_TTL', default=3600, cast=int)  # Seconds in Redis
+CACHE_LOCAL_TTL = config('CACHE_LOCAL_TTL', default=30, cast=int)  # Seconds in the per-process L1
+
+# Request instrumentation (myapp.metrics). Fraction of HTTP requests and consumer
+# events to record, 0 disables it; /metrics only answers METRICS_ALLOWED_IPS.
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.0, cast=float)
+METRICS_DUPLICATE_THRESHOLD = config('METRICS_DUPLICATE_THRESHOLD', default=5, cast=int)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+
+# Presence (myapp.presence). A user is online while a socket of theirs was heard
+# from within PRESENCE_TTL seconds; each socket writes at most once per interval,
+# so clients should ping more often than PRESENCE_TTL - PRESENCE_HEARTBEAT_INTERVAL.
+PRESENCE_TTL = config('PRESENCE_TTL', default=60, cast=int)
+PRESENCE_HEARTBEAT_INTERVAL = config('PRESENCE_HEARTBEAT_INTERVAL', default=20, cast=int)
+PRESENCE_MAX_BATCH = config('PRESENCE_MAX_BATCH', default=500, cast=int)
+
+# Typing indicators (myapp.typing_indicators): seconds without a typing frame
+# before a stop is broadcast; a continuing start is repeated at most this often.
+TYPING_WINDOW = config('TYPING_WINDOW', default=3.0, cast=float)
+
+# Multiplexed WebSocket (ws/multiplex/): rooms and private chats one socket
+# may subscribe to at once.
+MULTIPLEX_MAX_SUBSCRIPTIONS = config('MULTIPLEX_MAX_SUBSCRIPTIONS', default=200, cast=int)
+
+# Resume on reconnect (?last_id=): most missed messages replayed per stream;
+# clients further behind page the rest from the messages endpoints.
+RESUME_MAX_MESSAGES = config('RESUME_MAX_MESSAGES', default=100, cast=int)
+
+# Message search (chat/search/): results per page by default and at most.
+SEARCH_PAGE_SIZE = config('SEARCH_PAGE_SIZE', default=20, cast=int)
+SEARCH_MAX_PAGE_SIZE = config('SEARCH_MAX_PAGE_SIZE', default=50, cast=int)
+
+# Message partitions and archive (myapp.partitions, myapp.archive): monthly
+# partitions are created this many months ahead, and months older than
+# MESSAGE_ARCHIVE_AFTER_MONTHS move to segment files under
+# MESSAGE_ARCHIVE_ROOT. Every server that serves history must see that
+# directory.
+MESSAGE_PARTITION_MONTHS_AHEAD = config('MESSAGE_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+MESSAGE_ARCHIVE_AFTER_MONTHS = config('MESSAGE_ARCHIVE_AFTER_MONTHS', default=12, cast=int)
+MESSAGE_ARCHIVE_ROOT = config('MESSAGE_ARCHIVE_ROOT', default=os.path.join(BASE_DIR, 'archive'))
+
+# WebSocket limits (myapp.ratelimit). Every frame draws from a per-connection
+# bucket; messages and files also draw from a per-user bucket shared through
+# Redis. Rates are tokens per second, bursts the bucket size.
+WS_MAX_FRAME_BYTES = config('WS_MAX_FRAME_BYTES', default=512 * 1024, cast=int)  # Inline files included
+WS_MAX_MESSAGE_LENGTH = config('WS_MAX_MESSAGE_LENGTH', default=4000, cast=int)
+WS_CONNECTION_RATE = config('WS_CONNECTION_RATE', default=5.0, cast=float)
+WS_CONNECTION_BURST = config('WS_CONNECTION_BURST', default=20, cast=int)
+WS_USER_RATE = config('WS_USER_RATE', default=1.0, cast=float)
+WS_USER_BURST = config('WS_USER_BURST', default=10, cast=int)
+WS_MAX_VIOLATIONS = config('WS_MAX_VIOLATIONS', default=20, cast=int)  # Rejected frames in a row before closing
+
+# Channel layer: group_send has to reach sockets on every web and ws worker
+# process, so groups live in Redis. CHANNEL_LAYER_BACKEND=
+# channels.layers.InMemoryChannelLayer is only for a single-process dev server
+# without Redis; tests pin it themselves.
+CHANNEL_LAYER_BACKEND = config('CHANNEL_LAYER_BACKEND', default='channels_redis.core.RedisChannelLayer')
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': CHANNEL_LAYER_BACKEND,
     }
 }
-
-# Alternative: If you want to use Redis but with older version compatibility
-# Uncomment the section below and comment out the InMemoryChannelLayer above
-# CHANNEL_LAYERS = {
-#     'default': {
-#         'BACKEND': 'channels_redis.core.RedisChannelLayer',
-#         'CONFIG': {
-#             "hosts": [('127.0.0.1', 6379)],
-#             "capacity": 1500,
-#             "expiry": 10,
-#             # These settings help with older Redis versions
-#             "group_expiry": 86400,
-#             "prefix": "django-channels:",
-#         },
-#     },
-# }
+if 'redis' in CHANNEL_LAYER_BACKEND.lower():
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'hosts': [config('CHANNEL_LAYER_URL', default=REDIS_URL)],
+        'capacity': config('CHANNEL_LAYER_CAPACITY', default=1500, cast=int),
+        'expiry': 10,
+        'group_expiry': 86400,
+        'prefix': 'ispani-channels:',
+    }
 
 # Add logging configuration
+# Logging (myapp.log): records go through a bounded queue to a writer thread,
+# as JSON lines by default (LOG_FORMAT=text for plain lines). High-volume
+# events such as per-frame consumer logs keep LOG_SAMPLE_RATE of calls.
+LOG_FORMAT = config('LOG_FORMAT', default='json')
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=0.01, cast=float)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)  # Records; more are dropped, not waited for
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'myapp.log.JsonFormatter',
+        },
+        'text': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'myapp.log.QueueingHandler',
+            'target': 'logging.StreamHandler',
+            'queue_size': LOG_QUEUE_SIZE,
+            'formatter': LOG_FORMAT,
         },
     },
     'loggers': {
+        'myapp': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
         'myapp.consumers': {
             'handlers': ['console'],
             'level': 'INFO',
+            'propagate': False,
         },
     },
 }
@@ -4,6 +4,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 
+from myapp.metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,6 +26,8 @@ urlpatterns = [
     
     # Tutoring system
     path('tutoring/', include('myapp.urls.tutoring')),
-    
+
+    # Prometheus scrape endpoint, local clients only
+    path('metrics', metrics_view, name='metrics'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
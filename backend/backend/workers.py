@@ -0,0 +1,19 @@
+"""Gunicorn worker classes (see gunicorn.conf.py)."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from uvicorn_worker import UvicornWorker
+
+
+class ThreadedUvicornWorker(UvicornWorker):
+    """
+    UvicornWorker whose event loop runs ``sync_to_async(thread_sensitive=False)``
+    calls in a pool of gunicorn's ``threads`` threads, instead of asyncio's
+    default of min(32, cores + 4).
+    """
+
+    async def _serve(self):
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.cfg.threads, thread_name_prefix='asgi')
+        )
+        await super()._serve()
@@ -0,0 +1,48 @@
+# Gunicorn settings for serving backend.asgi:application with uvicorn workers.
+#
+# Two process types share this file (see Procfile), selected by GUNICORN_ROLE:
+#   web  HTTP API: short requests, CPU-bound workers, recycled periodically
+#   ws   WebSocket traffic (/ws/...): long-lived connections, fewer workers,
+#        never recycled by request count, long drain on reload
+# The reverse proxy routes /ws/ to the ws pool and everything else to web.
+#
+# Graceful reload: `kill -HUP <master pid>` starts new workers on fresh code
+# and lets old ones finish within graceful_timeout.
+import multiprocessing
+import os
+
+role = os.environ.get('GUNICORN_ROLE', 'web')
+cores = multiprocessing.cpu_count()
+
+worker_class = 'backend.workers.ThreadedUvicornWorker'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000' if role == 'web' else '8001')}"
+proc_name = f'ispani-{role}'
+
+if role == 'ws':
+    # Async workers hold thousands of idle sockets each; one per core is plenty
+    workers = int(os.environ.get('WS_CONCURRENCY', cores))
+    timeout = int(os.environ.get('WS_TIMEOUT', 120))
+    graceful_timeout = int(os.environ.get('WS_GRACEFUL_TIMEOUT', 60))
+    max_requests = 0
+else:
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+    timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+    graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+    # Recycle workers to bound memory growth; jitter avoids restarting all at once
+    max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 2000))
+    max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 200))
+
+keepalive = int(os.environ.get('KEEPALIVE', 5))
+
+# Threads per worker for blocking calls made with
+# sync_to_async(thread_sensitive=False), e.g. presence and rate-limit Redis
+# calls. Sync Django views don't use them: each request gets its own thread.
+threads = int(os.environ.get('WORKER_THREADS', 8))
+
+# Load the app in each worker, not the master, so HUP reloads pick up new code
+preload_app = False
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
@@ -14,6 +14,7 @@ from .models import (
     PrivateMessage,
     GroupMembership,
     MessageAttachment,
+    OutboundEmail,
 )
 from django.conf import settings
 
@@ -132,9 +133,11 @@ class GroupChatAdmin(admin.ModelAdmin):
 
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'chat_type', 'created_at']
+    list_display = ['id', 'name', 'chat_type', 'group', 'created_at']
     list_filter = ['chat_type', 'created_at']
     search_fields = ['name']
+    raw_id_fields = ['group']
+    # Only rooms without a group use this; group rooms take GroupMembership
     filter_horizontal = ['members']
 
 @admin.register(ChatMessage)
@@ -176,4 +179,10 @@ class GroupMembershipAdmin(admin.ModelAdmin):
 class MessageAttachmentAdmin(admin.ModelAdmin):
     list_display = ('message', 'attachment_type', 'file')
     search_fields = ('message__content',)
-    raw_id_fields = ('message',)
\ No newline at end of file
+    raw_id_fields = ('message',)
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    search_fields = ('subject', 'to')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'sent_at')
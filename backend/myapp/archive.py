@@ -0,0 +1,274 @@
+"""
+Archive of cold message months in compressed segment files.
+
+Once a month is older than ``MESSAGE_ARCHIVE_AFTER_MONTHS``,
+``archive_cold_messages`` writes its room or private messages to one
+segment file under ``MESSAGE_ARCHIVE_ROOT`` and records it as a
+``MessageArchiveSegment``. In the same transaction, with the month locked
+since the export began, it drops the month's partition (see
+``myapp.partitions``), or deletes the rows where there is no such
+partition. The history endpoints page into archived messages once the live
+ones run out (see ``myapp.pagination``), so clients see one continuous
+history.
+
+A segment holds messages sorted by (room or chat, id), in blocks of up to
+``BLOCK_ROWS`` messages of a single room or chat. Each block is a
+zlib-compressed JSON list of rows. After the blocks comes a fixed-size
+index entry per block (key, first id, last id, offset, length), then a
+footer. Readers map the file with ``mmap``, find a room's blocks by binary
+search over the index, and decompress only those blocks. Reading one room's
+history therefore never reads or inflates the rest of the month.
+
+Attachment rows are not archived. Their foreign key has no database
+constraint, so they outlive the message row and are still found by id.
+Archived messages are read-only, and full-text search only covers live
+messages.
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min, prefetch_related_objects
+
+from .cache import ARCHIVE_SEGMENTS_CACHE_KEY, cached_lookup
+from .models import ChatMessage, CustomUser, MessageArchiveSegment, PrivateMessage
+from .partitions import add_months, drop_partition, month_partition, month_start
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MSGSEG01'
+BLOCK_ROWS = 256
+# Per block: key (room or chat id), first id, last id, offset, compressed length
+INDEX_ENTRY = struct.Struct('<qqqQI')
+# Index offset, block count, magic
+FOOTER = struct.Struct('<QI8s')
+
+# Columns stored per message, in order; the second one is the segment key
+COLUMNS = {
+    'room': ('id', 'room_id', 'sender_id', 'text', 'created_at'),
+    'private': ('id', 'chat_id', 'sender_id', 'content', 'is_read', 'created_at'),
+}
+MODELS = {'room': ChatMessage, 'private': PrivateMessage}
+
+
+# Segment files ---------------------------------------------------------------
+
+def write_segment(path, rows):
+    """
+    Write ``rows`` (tuples in ``COLUMNS`` order, sorted by key then id) to a
+    segment at ``path``. The file appears under its name only once complete.
+    Returns (message count, first id, last id).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    index = []
+    count, first_id, last_id = 0, None, None
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        block = []
+
+        def flush():
+            data = zlib.compress(json.dumps(block, separators=(',', ':')).encode())
+            index.append(INDEX_ENTRY.pack(block[0][1], block[0][0], block[-1][0], f.tell(), len(data)))
+            f.write(data)
+            block.clear()
+
+        for row in rows:
+            if block and (len(block) == BLOCK_ROWS or row[1] != block[0][1]):
+                flush()
+            row = [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            block.append(row)
+            count += 1
+            first_id = row[0] if first_id is None else min(first_id, row[0])
+            last_id = row[0] if last_id is None else max(last_id, row[0])
+        if block:
+            flush()
+
+        index_offset = f.tell()
+        f.writelines(index)
+        f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return count, first_id, last_id
+
+
+class Segment:
+    """Read-only view of a segment file; safe to share between threads"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, count, magic = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        if magic != MAGIC or self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a message segment")
+        self._blocks = list(INDEX_ENTRY.iter_unpack(self._map[index_offset:index_offset + count * INDEX_ENTRY.size]))
+        # (key, first id) and (key, last id) of each block, for bisect
+        self._starts = [(key, first_id) for key, first_id, _, _, _ in self._blocks]
+        self._ends = [(key, last_id) for key, _, last_id, _, _ in self._blocks]
+
+    def rows(self, key, after_id=None, before_id=None, newest_first=False):
+        """Rows of ``key`` with ids between ``after_id`` and ``before_id``, oldest first by default"""
+        start = bisect.bisect_right(self._ends, (key, after_id if after_id is not None else -1))
+        stop = bisect.bisect_left(self._starts, (key, before_id) if before_id is not None else (key + 1, -1))
+        blocks = self._blocks[start:stop]
+        for block_key, _, _, offset, length in (reversed(blocks) if newest_first else blocks):
+            if block_key != key:
+                continue
+            rows = json.loads(zlib.decompress(self._map[offset:offset + length]))
+            for row in (reversed(rows) if newest_first else rows):
+                if (after_id is None or row[0] > after_id) and (before_id is None or row[0] < before_id):
+                    yield row
+
+
+_segments = {}
+_segments_lock = threading.Lock()
+
+
+def open_segment(path):
+    """The process-wide ``Segment`` for ``path``; segment files never change once written"""
+    with _segments_lock:
+        segment = _segments.get(path)
+        if segment is None:
+            segment = _segments[path] = Segment(path)
+        return segment
+
+
+def segment_path(kind, month):
+    return f'{kind}/{month:%Y-%m}.seg'
+
+
+def full_path(path):
+    return os.path.join(settings.MESSAGE_ARCHIVE_ROOT, path)
+
+
+# Archival --------------------------------------------------------------------
+
+def archive_cold_messages(now=None, keep_months=None):
+    """
+    Archive every month older than ``keep_months`` (default
+    ``MESSAGE_ARCHIVE_AFTER_MONTHS``) that still has messages in the
+    database. Returns the segments written.
+    """
+    keep_months = settings.MESSAGE_ARCHIVE_AFTER_MONTHS if keep_months is None else keep_months
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -keep_months)
+    segments = []
+    for kind, model in MODELS.items():
+        oldest = model.objects.filter(created_at__lt=cutoff).aggregate(oldest=Min('created_at'))['oldest']
+        month = month_start(oldest) if oldest else cutoff
+        while month < cutoff:
+            segment = archive_month(kind, month)
+            if segment is not None:
+                segments.append(segment)
+            month = add_months(month, 1)
+    return segments
+
+
+def archive_month(kind, month):
+    """Move one month of ``kind`` messages to a segment; None if there was nothing to move"""
+    model = MODELS[kind]
+    table = model._meta.db_table
+    end = add_months(month, 1)
+    # One transaction with the month locked from export to drop, so no
+    # update or delete made in between is lost or brought back
+    with transaction.atomic():
+        if MessageArchiveSegment.objects.filter(kind=kind, month=month.date()).exists():
+            # Rows written into an archived month after the fact stay live
+            logger.warning("%s messages of %s are already archived", kind, f'{month:%Y-%m}')
+            return None
+
+        messages = model.objects.filter(created_at__gte=month, created_at__lt=end)
+        partition = month_partition(table, month)
+        if partition:
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE "{partition}" IN SHARE MODE')
+        else:
+            messages = messages.select_for_update()
+        if not messages.exists():
+            if partition:
+                drop_partition(table, partition)
+            return None
+
+        rows = messages.order_by(COLUMNS[kind][1], 'id').values_list(*COLUMNS[kind]).iterator(chunk_size=2000)
+        path = segment_path(kind, month)
+        count, first_id, last_id = write_segment(full_path(path), rows)
+
+        segment = MessageArchiveSegment.objects.create(
+            kind=kind, month=month.date(), path=path, message_count=count,
+            first_id=first_id, last_id=last_id, size_bytes=os.path.getsize(full_path(path)),
+        )
+        if partition:
+            drop_partition(table, partition)
+        else:
+            # Raw SQL: no per-row signals, and attachments are kept (see above).
+            # Only the exported id range, should a row have slipped in anyway.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM "{table}" WHERE created_at >= %s AND created_at < %s AND id BETWEEN %s AND %s',
+                    [month, end, first_id, last_id],
+                )
+    logger.info(
+        "Archived %s %s messages of %s to %s", count, kind, f'{month:%Y-%m}', path,
+        extra={'kind': kind, 'message_count': count, 'size_bytes': segment.size_bytes},
+    )
+    return segment
+
+
+# Reading ---------------------------------------------------------------------
+
+def archived_segments():
+    """(kind, path, last id) of every segment, from the two-tier cache"""
+    return cached_lookup(
+        ARCHIVE_SEGMENTS_CACHE_KEY,
+        lambda: list(MessageArchiveSegment.objects.order_by('month').values_list('kind', 'path', 'last_id')),
+    )
+
+
+def archived_messages(kind, key, after_id=None, before_id=None, limit=None, newest_first=False):
+    """
+    Up to ``limit`` archived messages of one room (``kind='room'``) or
+    private chat with ids between ``after_id`` and ``before_id``, oldest
+    first unless ``newest_first``. They come back as unsaved model instances
+    with their senders loaded and, for room messages, attachments
+    prefetched, ready for the history serializers.
+    """
+    # Segments are in month order, and ids grow with time
+    segments = [
+        path for segment_kind, path, last_id in archived_segments()
+        if segment_kind == kind and (after_id is None or last_id > after_id)
+    ]
+    rows = chain.from_iterable(
+        open_segment(full_path(path)).rows(key, after_id, before_id, newest_first)
+        for path in (reversed(segments) if newest_first else segments)
+    )
+
+    model, columns = MODELS[kind], COLUMNS[kind]
+    messages = []
+    while limit is None or len(messages) < limit:
+        batch = list(islice(rows, None if limit is None else limit - len(messages)))
+        if not batch:
+            break
+        senders = CustomUser.objects.in_bulk({row[2] for row in batch})
+        for row in batch:
+            values = dict(zip(columns, row))
+            if values['sender_id'] not in senders:
+                # The sender's account was deleted; live rows would be gone too
+                continue
+            values['created_at'] = datetime.fromisoformat(values['created_at'])
+            message = model(**values)
+            message._state.adding = False
+            message.sender = senders[message.sender_id]
+            messages.append(message)
+        if limit is None:
+            break
+    if kind == 'room' and messages:
+        prefetch_related_objects(messages, 'attachments')
+    return messages
@@ -0,0 +1,186 @@
+"""
+Two-tier cache for hot, read-mostly data.
+
+L2 is Django's default cache (Redis in production), shared by every worker.
+L1 is a small in-process dict with a short TTL in front of it, so hot lookups
+such as the subject list skip the network entirely. ``invalidate`` deletes the
+L2 entry and publishes the key on a Redis channel. Every process runs a
+listener thread that drops the key from its own L1, so stale L1 entries last
+only until the publish arrives, or at most one L1 TTL if Redis is unreachable.
+
+Shared short-lived state (OTPs, registration and reset tokens) uses Django's
+``cache`` directly. It only needs the Redis backend configured in settings.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'ispani:cache:invalidate'
+MISSING = object()
+
+# Keys of the read-mostly data cached here; invalidated by myapp.signals
+SUBJECTS_CACHE_KEY = 'subjects:all'
+POPULAR_TAGS_CACHE_KEY = 'event_tags:popular'
+HOBBY_IDS_CACHE_KEY = 'hobbies:ids'
+ARCHIVE_SEGMENTS_CACHE_KEY = 'messages:archive_segments'
+
+
+class LocalCache:
+    """Thread-safe in-process cache with per-entry expiry and a size bound"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                self._evict()
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self._data.items() if expires <= now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            # Still full: drop the entries closest to expiry
+            for key, _ in sorted(self._data.items(), key=lambda item: item[1][0])[: self.max_entries // 10 or 1]:
+                del self._data[key]
+
+
+local_cache = LocalCache()
+
+_redis = None
+_redis_lock = threading.Lock()
+_listener_pid = None
+
+
+def get_redis():
+    """Return a process-wide redis client, or None when no REDIS_URL is configured"""
+    global _redis
+    url = getattr(settings, 'REDIS_URL', None)
+    if not url:
+        return None
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                import redis
+                _redis = redis.Redis.from_url(url, socket_connect_timeout=2, health_check_interval=30)
+    return _redis
+
+
+def _listen():
+    backoff = 1
+    while True:
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            backoff = 1
+            for message in pubsub.listen():
+                key = message.get('data')
+                if isinstance(key, bytes):
+                    key = key.decode()
+                local_cache.delete(key)
+        except Exception as e:
+            # Invalidations may have been missed while disconnected
+            local_cache.clear()
+            logger.warning("Cache invalidation listener lost Redis, retrying in %ss: %s", backoff, e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+def _ensure_listener():
+    """Start the invalidation listener once per process (again after a fork)"""
+    global _listener_pid
+    if not _uses_redis():
+        return
+    pid = os.getpid()
+    if _listener_pid == pid:
+        return
+    with _redis_lock:
+        if _listener_pid == pid:
+            return
+        _listener_pid = pid
+        threading.Thread(target=_listen, name='cache-invalidation', daemon=True).start()
+
+
+def _uses_redis():
+    return 'redis' in settings.CACHES.get('default', {}).get('BACKEND', '').lower()
+
+
+def cached_lookup(key, loader, ttl=None, local_ttl=None):
+    """
+    Return the value for ``key`` from L1, then L2, then ``loader()``, filling
+    the tiers on the way back. Values must be picklable.
+    """
+    ttl = settings.CACHE_SHARED_TTL if ttl is None else ttl
+    local_ttl = settings.CACHE_LOCAL_TTL if local_ttl is None else local_ttl
+
+    value = local_cache.get(key)
+    if value is not MISSING:
+        return value
+
+    _ensure_listener()
+    try:
+        value = cache.get(key, MISSING)
+    except Exception as e:
+        logger.warning("Shared cache read failed for %s: %s", key, e)
+        value = MISSING
+
+    if value is MISSING:
+        value = loader()
+        try:
+            cache.set(key, value, ttl)
+        except Exception as e:
+            logger.warning("Shared cache write failed for %s: %s", key, e)
+
+    local_cache.set(key, value, local_ttl)
+    return value
+
+
+def invalidate(*keys):
+    """Drop ``keys`` from the shared cache and from every process's L1"""
+    for key in keys:
+        local_cache.delete(key)
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning("Shared cache delete failed for %s: %s", keys, e)
+
+    if _uses_redis():
+        client = get_redis()
+        try:
+            for key in keys:
+                client.publish(INVALIDATION_CHANNEL, key)
+        except Exception as e:
+            logger.warning("Cache invalidation publish failed for %s: %s", keys, e)
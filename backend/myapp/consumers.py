@@ -7,15 +7,166 @@ from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from django.conf import settings
 from django.db.models import Q
 
 from .models.authentication import ConnectionRequest
 from .models import ChatRoom, ChatMessage,PrivateChat, PrivateMessage
+from .membership import is_room_member, rooms_for_user
+from .frames import broadcast_event, encode_frame, frame_text, with_stream
+from .log import log_sampled
+from .metrics import MetricsConsumerMixin
+from .presence import PresenceConsumerMixin
+from .ratelimit import RateLimitConsumerMixin
+from .typing_indicators import TypingConsumerMixin
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
-class ChatConsumer(AsyncWebsocketConsumer):
+
+def are_connected(user_id, other_user_id):
+    return ConnectionRequest.objects.filter(
+        Q(from_user_id=user_id, to_user_id=other_user_id) | Q(from_user_id=other_user_id, to_user_id=user_id),
+        status='accepted'
+    ).exists()
+
+
+def connected_user_ids(user_id, other_user_ids):
+    """The subset of ``other_user_ids`` with an accepted connection to ``user_id``"""
+    pairs = ConnectionRequest.objects.filter(
+        Q(from_user_id=user_id, to_user_id__in=other_user_ids) | Q(to_user_id=user_id, from_user_id__in=other_user_ids),
+        status='accepted'
+    ).values_list('from_user_id', 'to_user_id')
+    return {to_id if from_id == user_id else from_id for from_id, to_id in pairs}
+
+
+def private_chat_between(user_id, other_user_id):
+    """Get existing chat or create new one"""
+    try:
+        # Try to find existing chat (either direction)
+        chat = PrivateChat.objects.filter(
+            Q(user1_id=user_id, user2_id=other_user_id) | Q(user1_id=other_user_id, user2_id=user_id)
+        ).first()
+
+        if not chat:
+            # Create new chat with consistent ordering (smaller ID as user1)
+            low, high = sorted([user_id, other_user_id])
+            chat = PrivateChat.objects.create(user1_id=low, user2_id=high)
+
+        return chat
+    except Exception as e:
+        logger.error("Error getting or creating chat: %s", e)
+        return None
+
+
+def private_group_name(user_id, other_user_id):
+    # Consistent name based on user IDs (smaller ID first)
+    low, high = sorted([user_id, other_user_id])
+    return f'private_chat_{low}_{high}'
+
+
+def room_message_data(message, user, room_id):
+    return {
+        'type': 'message',  # Changed from 'chat_message' to match Flutter expectation
+        'id': message.id,
+        'text': message.text,
+        'sender': {
+            'id': user.id,
+            'username': user.username,
+        },
+        'created_at': message.created_at.isoformat(),
+        'room_id': room_id
+    }
+
+
+def private_message_data(message, user, **extra):
+    return {
+        'type': 'message',
+        'id': message.id,
+        'content': message.content,
+        **extra,
+        'sender': {
+            'id': user.id,
+            'username': user.username
+        },
+        'created_at': message.created_at.isoformat(),
+        'chat_id': message.chat_id
+    }
+
+
+def last_seen_id(scope):
+    """The ``last_id`` a reconnecting client sends in the query string, or None"""
+    values = parse_qs(scope.get('query_string', b'').decode('utf-8')).get('last_id')
+    return parse_last_id(values[0] if values else None)
+
+
+def parse_last_id(value):
+    try:
+        return max(int(value), 0) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _capped(queryset):
+    # One row past the cap tells us whether the client is still behind
+    cap = settings.RESUME_MAX_MESSAGES
+    messages = list(queryset.select_related('sender').order_by('id')[:cap + 1])
+    return messages[:cap], len(messages) > cap
+
+
+def missed_room_messages(room_id, last_id):
+    """Messages after ``last_id``, oldest first and capped, and whether more remain"""
+    return _capped(ChatMessage.objects.filter(room_id=room_id, id__gt=last_id))
+
+
+def missed_private_messages(user_id, other_user_id, last_id):
+    return _capped(PrivateMessage.objects.filter(
+        Q(chat__user1_id=user_id, chat__user2_id=other_user_id) | Q(chat__user1_id=other_user_id, chat__user2_id=user_id),
+        id__gt=last_id
+    ))
+
+
+class ResumeMixin:
+    """
+    Replays what a reconnecting client missed. The client passes the id of
+    the last message it received; ``resume`` sends the messages after it,
+    oldest first and at most ``RESUME_MAX_MESSAGES`` of them, then a
+    ``resume_complete`` frame. ``truncated`` in that frame means the client
+    is further behind than the cap and should page the rest from the
+    messages endpoint with ``?after=<last_id>``.
+
+    The socket joins its group before replaying and group events wait until
+    the replay is sent, so nothing falls between the two; live messages the
+    replay already covered are dropped with ``already_replayed``.
+
+    Needs ``missed_messages(last_id)`` (sync, returns messages and the
+    truncated flag) and ``replay_data(message)``.
+    """
+    replayed_through = 0
+
+    async def resume(self, last_id, **extra):
+        if last_id is None:
+            return
+        messages, truncated = await database_sync_to_async(self.missed_messages)(last_id)
+        for message in messages:
+            await self.send_replayed(self.replay_data(message), **extra)
+        self.replayed_through = messages[-1].id if messages else last_id
+        await self.send_replayed({
+            'type': 'resume_complete',
+            'last_id': self.replayed_through,
+            'replayed': len(messages),
+            'truncated': truncated
+        }, **extra)
+
+    async def send_replayed(self, payload, **extra):
+        await self.send(text_data=encode_frame({**payload, **extra}))
+
+    def already_replayed(self, event):
+        # Only message events carry an id; typing and the like always pass
+        return event.get('id') is not None and event['id'] <= self.replayed_through
+
+
+class ChatConsumer(MetricsConsumerMixin, RateLimitConsumerMixin, PresenceConsumerMixin, TypingConsumerMixin, ResumeMixin, AsyncWebsocketConsumer):
     async def connect(self):
         try:
             # Get room ID from URL
@@ -35,13 +186,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 access_token = AccessToken(token)
                 user_id = access_token['user_id']
                 self.user = await database_sync_to_async(User.objects.get)(id=user_id)
-                logger.info(f"User {self.user.username} authenticated successfully")
+                logger.debug("User %s authenticated successfully", self.user.username)
             except (InvalidToken, TokenError) as e:
-                logger.error(f"Invalid token: {e}")
+                logger.error("Invalid token: %s", e)
                 await self.close(code=4002)
                 return
             except User.DoesNotExist:
-                logger.error(f"User with id {user_id} does not exist")
+                logger.error("User with id %s does not exist", user_id)
                 await self.close(code=4003)
                 return
             
@@ -50,17 +201,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.room = await database_sync_to_async(ChatRoom.objects.get)(id=self.room_id)
                 
                 # Check if user is a member of the room
-                is_member = await database_sync_to_async(
-                    lambda: self.room.members.filter(id=self.user.id).exists()
-                )()
+                is_member = await database_sync_to_async(is_room_member)(self.room, self.user)
                 
                 if not is_member:
-                    logger.error(f"User {self.user.username} is not a member of room {self.room_id}")
+                    logger.error("User %s is not a member of room %s", self.user.username, self.room_id)
                     await self.close(code=4004)
                     return
                     
             except ChatRoom.DoesNotExist:
-                logger.error(f"Room {self.room_id} does not exist")
+                logger.error("Room %s does not exist", self.room_id)
                 await self.close(code=4005)
                 return
             
@@ -72,7 +221,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             
             # Accept the connection
             await self.accept()
-            logger.info(f"User {self.user.username} connected to room {self.room_id}")
+            await self.presence_connect(self.user.id, self.room.id)
+            logger.info(
+                "User %s connected to room %s", self.user.username, self.room_id,
+                extra={'user_id': self.user.id, 'room_id': self.room_id}
+            )
             
             # Send connection confirmation
             await self.send(text_data=json.dumps({
@@ -83,9 +236,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'username': self.user.username
                 }
             }))
+            # Messages missed since the client's last connection, before any live ones
+            await self.resume(last_seen_id(self.scope))
             
         except Exception as e:
-            logger.error(f"Error in connect: {e}")
+            logger.error("Error in connect: %s", e)
             await self.close(code=4000)
 
     async def get_token(self):
@@ -99,7 +254,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 if token:
                     return token
             except Exception as e:
-                logger.error(f"Error parsing query string: {e}")
+                logger.error("Error parsing query string: %s", e)
         
         # Try headers
         headers = dict(self.scope.get('headers', []))
@@ -112,6 +267,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Called when the WebSocket closes for any reason."""
         try:
+            await self.presence_disconnect()
+            await self.typing_disconnect()
+
             # Leave room group
             if hasattr(self, 'room_group_name'):
                 await self.channel_layer.group_discard(
@@ -120,37 +278,46 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 )
             
             if hasattr(self, 'user') and hasattr(self, 'room_id'):
-                logger.info(f"User {self.user.username} disconnected from room {self.room_id} with code: {close_code}")
+                logger.info(
+                    "User %s disconnected from room %s with code: %s", self.user.username, self.room_id, close_code,
+                    extra={'user_id': self.user.id, 'room_id': self.room_id, 'close_code': close_code}
+                )
             else:
-                logger.info(f"Client disconnected with code: {close_code}")
+                logger.info("Client disconnected with code: %s", close_code)
                 
         except Exception as e:
-            logger.error(f"Error in disconnect: {e}")
+            logger.error("Error in disconnect: %s", e)
 
     async def receive(self, text_data):
         """Handle incoming WebSocket messages"""
         try:
             data = json.loads(text_data)
-            logger.info(f"Received message: {data}")
 
             # Ensure data is a dict
             if not isinstance(data, dict):
                 raise ValueError("Expected JSON object")
 
             message_type = data.get('type', 'message')
+            log_sampled(
+                logger, logging.INFO, "Received %s frame in room %s", message_type, self.room_id,
+                extra={'user_id': self.user.id, 'room_id': self.room_id, 'frame_type': message_type}
+            )
 
+            await self.presence_heartbeat()
             if message_type == 'ping':
                 await self.send(text_data=json.dumps({'type': 'pong'}))
             elif message_type == 'message':
                 await self.handle_chat_message(data)
+            elif message_type == 'typing':
+                await self.typing_frame(data)
             else:
-                logger.warning(f"Unknown message type: {message_type}")
+                logger.warning("Unknown message type: %s", message_type)
 
         except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Invalid message format: {e}")
+            logger.error("Invalid message format: %s", e)
             await self.send_error("Invalid message format. Please send JSON with type and content.")
         except Exception as e:
-            logger.error(f"Error in receive: {e}")
+            logger.error("Error in receive: %s", e)
             await self.send_error("An error occurred while processing your message.")
 
     async def handle_chat_message(self, data):
@@ -161,6 +328,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not message_text:
             await self.send_error("Message content cannot be empty")
             return
+        if not await self.allow_write(message_text):
+            return
         
         try:
             # Create message in database
@@ -170,36 +339,36 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 text=message_text  
             )
             
-            logger.info(f"Message created in database: {message.id}")
-            
-            # Prepare message data to send to group
-            message_data = {
-                'type': 'message',  # Changed from 'chat_message' to match Flutter expectation
-                'id': message.id,
-                'text': message.text,  
-                'sender': {
-                    'id': self.user.id,
-                    'username': self.user.username,
-                },
-                'created_at': message.created_at.isoformat(), 
-                'room_id': self.room_id
-            }
-            
             # Send message to room group
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'chat_message',  # This is the method name to call
-                    'message': message_data
-                }
+                broadcast_event(
+                    'chat_message', self.room_group_name,
+                    room_message_data(message, self.user, self.room_id),
+                    id=message.id
+                )
             )
             
-            logger.info(f"Message sent to group: {self.room_group_name}")
+            log_sampled(
+                logger, logging.INFO, "Message %s sent to group %s", message.id, self.room_group_name,
+                extra={'user_id': self.user.id, 'room_id': self.room_id, 'message_id': message.id}
+            )
+            # Sending a message ends the sender's typing indicator
+            await self.typing_stop()
             
         except Exception as e:
-            logger.error(f"Error creating message: {e}")
+            logger.error("Error creating message: %s", e)
             await self.send_error("Failed to send message")
 
+    def typing_context(self):
+        return {'room_id': self.room_id}
+
+    def missed_messages(self, last_id):
+        return missed_room_messages(self.room_id, last_id)
+
+    def replay_data(self, message):
+        return room_message_data(message, message.sender, self.room_id)
+
     async def send_error(self, error_message):
         """Send error message to client"""
         await self.send(text_data=json.dumps({
@@ -210,12 +379,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_message(self, event):
         """Called when a message is sent to the group"""
         try:
-            message = event['message']
-            logger.info(f"Sending message to client: {message}")
-            await self.send(text_data=json.dumps(message))
+            # Runs once per member for every message: no logging here
+            if self.already_replayed(event):
+                return
+            await self.send(text_data=frame_text(event))
         except Exception as e:
-            logger.error(f"Error sending message to client: {e}")
-class PrivateChatConsumer(AsyncWebsocketConsumer):
+            logger.error("Error sending message to client: %s", e)
+class PrivateChatConsumer(MetricsConsumerMixin, RateLimitConsumerMixin, PresenceConsumerMixin, TypingConsumerMixin, ResumeMixin, AsyncWebsocketConsumer):
     async def connect(self):
         try:
             
@@ -224,7 +394,7 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             # Get token from query parameters
             token = self.get_token_from_scope()
             if not token:
-                logger.warning(f"No token provided for chat with user {self.other_user_id}")
+                logger.warning("No token provided for chat with user %s", self.other_user_id)
                 await self.close(code=4001)
                 return
 
@@ -234,31 +404,29 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                 user_id = access_token['user_id']
                 self.user = await self.get_user_by_id(user_id)
                 if not self.user:
-                    logger.warning(f"User {user_id} not found")
+                    logger.warning("User %s not found", user_id)
                     await self.close(code=4001)
                     return
             except (InvalidToken, TokenError) as e:
-                logger.warning(f"Invalid token for chat with user {self.other_user_id}: {e}")
+                logger.warning("Invalid token for chat with user %s: %s", self.other_user_id, e)
                 await self.close(code=4001)
                 return
 
             # Get the other user
             self.other_user = await self.get_user_by_id(self.other_user_id)
             if not self.other_user:
-                logger.warning(f"Other user {self.other_user_id} not found")
+                logger.warning("Other user %s not found", self.other_user_id)
                 await self.close(code=4004)
                 return
 
             # Check if users are connected - FIXED: using correct field names
             are_connected = await self.check_connection_status(self.user, self.other_user)
             if not are_connected:
-                logger.warning(f"Users {self.user.id} and {self.other_user_id} are not connected")
+                logger.warning("Users %s and %s are not connected", self.user.id, self.other_user_id)
                 await self.close(code=4004)
                 return
 
-            # Create a consistent room name based on user IDs (smaller ID first)
-            user_ids = sorted([self.user.id, self.other_user_id])
-            self.room_group_name = f'private_chat_{user_ids[0]}_{user_ids[1]}'
+            self.room_group_name = private_group_name(self.user.id, self.other_user_id)
 
             # Add to group and accept connection
             await self.channel_layer.group_add(
@@ -267,6 +435,7 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             )
 
             await self.accept()
+            await self.presence_connect(self.user.id)
             
             # Send connection confirmation
             await self.send(text_data=json.dumps({
@@ -280,14 +449,18 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                     'username': self.user.username
                 }
             }))
+            await self.resume(last_seen_id(self.scope))
             
-            logger.info(f"User {self.user.username} connected to chat with {self.other_user.username}")
+            logger.info(
+                "User %s connected to chat with %s", self.user.username, self.other_user.username,
+                extra={'user_id': self.user.id, 'other_user_id': self.other_user_id}
+            )
 
         except ValueError as e:
-            logger.error(f"Invalid user_id in URL: {e}")
+            logger.error("Invalid user_id in URL: %s", e)
             await self.close(code=4000)
         except Exception as e:
-            logger.error(f"Error in WebSocket connect: {e}")
+            logger.error("Error in WebSocket connect: %s", e)
             await self.close(code=4000)
 
     def get_token_from_scope(self):
@@ -301,7 +474,7 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                 
             return None
         except Exception as e:
-            logger.error(f"Error extracting token: {e}")
+            logger.error("Error extracting token: %s", e)
             return None
 
     @database_sync_to_async
@@ -314,32 +487,12 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_or_create_chat(self, user1, user2):
-        """Get existing chat or create new one"""
-        try:
-            # Try to find existing chat (either direction)
-            chat = PrivateChat.objects.filter(
-                Q(user1=user1, user2=user2) | Q(user1=user2, user2=user1)
-            ).first()
-            
-            if not chat:
-                # Create new chat with consistent ordering (smaller ID as user1)
-                if user1.id < user2.id:
-                    chat = PrivateChat.objects.create(user1=user1, user2=user2)
-                else:
-                    chat = PrivateChat.objects.create(user1=user2, user2=user1)
-                    
-            return chat
-        except Exception as e:
-            logger.error(f"Error getting or creating chat: {e}")
-            return None
+        return private_chat_between(user1.id, user2.id)
 
     @database_sync_to_async
     def check_connection_status(self, user1, user2):
         """Check if users are still connected - FIXED: using correct field names"""
-        return ConnectionRequest.objects.filter(
-            Q(from_user=user1, to_user=user2) | Q(from_user=user2, to_user=user1),
-            status='accepted'
-        ).exists()
+        return are_connected(user1.id, user2.id)
 
     @database_sync_to_async
     def create_message(self, chat, sender, content):
@@ -352,6 +505,9 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         try:
+            await self.presence_disconnect()
+            await self.typing_disconnect()
+
             # Check if room_group_name exists before trying to use it
             if hasattr(self, 'room_group_name'):
                 await self.channel_layer.group_discard(
@@ -359,23 +515,30 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                     self.channel_name
                 )
             if hasattr(self, 'user') and hasattr(self, 'other_user'):
-                logger.info(f"User {self.user.username} disconnected from chat with {self.other_user.username} with code: {close_code}")
+                logger.info(
+                    "User %s disconnected from chat with %s with code: %s",
+                    self.user.username, self.other_user.username, close_code,
+                    extra={'user_id': self.user.id, 'other_user_id': self.other_user_id, 'close_code': close_code}
+                )
         except Exception as e:
-            logger.error(f"Error in disconnect: {e}")
+            logger.error("Error in disconnect: %s", e)
 
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             message_type = data.get('type', 'message')
 
-            if message_type == 'message':
+            await self.presence_heartbeat()
+            if message_type == 'ping':
+                await self.send(text_data=json.dumps({'type': 'pong'}))
+            elif message_type == 'message':
                 await self.handle_message(data)
             elif message_type == 'typing':
-                await self.handle_typing(data)
+                await self.typing_frame(data)
             elif message_type == 'file':
                 await self.handle_file(data)
             else:
-                logger.warning(f"Unknown message type: {message_type}")
+                logger.warning("Unknown message type: %s", message_type)
 
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
@@ -383,7 +546,7 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                 'message': 'Invalid JSON format'
             }))
         except Exception as e:
-            logger.error(f"Error in receive: {e}")
+            logger.error("Error in receive: %s", e)
             await self.send(text_data=json.dumps({
                 'type': 'error', 
                 'message': 'Internal server error'
@@ -399,6 +562,8 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                 'message': 'Message cannot be empty'
             }))
             return
+        if not await self.allow_write(message_text):
+            return
 
         # Check if users are still connected - FIXED: using correct field names
         are_connected = await self.check_connection_status(self.user, self.other_user)
@@ -421,44 +586,26 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         # Create message in database
         message = await self.create_message(chat, self.user, message_text)
 
-        # Prepare message data
-        message_data = {
-            'type': 'message',
-            'id': message.id,
-            'content': message.content,
-            'sender': {
-                'id': self.user.id, 
-                'username': self.user.username
-            },
-            'created_at': message.created_at.isoformat(),
-            'chat_id': chat.id
-        }
-
         # Broadcast to group
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'private_chat_message',
-                'message': message_data
-            }
+            broadcast_event(
+                'private_chat_message', self.room_group_name,
+                private_message_data(message, self.user),
+                id=message.id
+            )
         )
+        # Sending a message ends the sender's typing indicator
+        await self.typing_stop()
 
-    async def handle_typing(self, data):
-        """Handle typing notifications"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'typing_notification',
-                'message': {
-                    'type': 'typing',
-                    'sender': {
-                        'id': self.user.id,
-                        'username': self.user.username
-                    },
-                    'other_user_id': self.other_user_id
-                }
-            }
-        )
+    def typing_context(self):
+        return {'other_user_id': self.other_user_id}
+
+    def missed_messages(self, last_id):
+        return missed_private_messages(self.user.id, self.other_user_id, last_id)
+
+    def replay_data(self, message):
+        return private_message_data(message, message.sender)
 
     async def handle_file(self, data):
         """Handle file uploads"""
@@ -472,6 +619,9 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                 'message': 'Invalid file data'
             }))
             return
+        # The file itself is bounded by WS_MAX_FRAME_BYTES
+        if not await self.allow_write(filename):
+            return
 
         # Get or create chat automatically
         chat = await self.get_or_create_chat(self.user, self.other_user)
@@ -486,39 +636,328 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         message_text = f"📎 {filename}"
         message = await self.create_message(chat, self.user, message_text)
 
-        # Prepare message data
-        message_data = {
-            'type': 'message',
-            'id': message.id,
-            'content': message.content,
-            'file': file_data,
-            'filename': filename,
-            'filesize': filesize,
-            'sender': {
-                'id': self.user.id, 
-                'username': self.user.username
-            },
-            'created_at': message.created_at.isoformat(),
-            'chat_id': chat.id
-        }
-
         # Broadcast to group
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'private_chat_message',
-                'message': message_data
-            }
+            broadcast_event(
+                'private_chat_message', self.room_group_name,
+                private_message_data(message, self.user, file=file_data, filename=filename, filesize=filesize),
+                id=message.id
+            )
         )
 
     async def private_chat_message(self, event):
         """Send message to WebSocket"""
-        await self.send(text_data=json.dumps(event['message']))
+        if self.already_replayed(event):
+            return
+        await self.send(text_data=frame_text(event))
+
+
+class Subscription(TypingConsumerMixin, ResumeMixin):
+    """One room or private chat carried by a MultiplexConsumer"""
+
+    def __init__(self, consumer, stream, group_name):
+        self.consumer = consumer
+        self.user = consumer.user
+        self.channel_layer = consumer.channel_layer
+        self.stream = stream
+        self.room_group_name = group_name
+
+    async def send(self, text_data):
+        await self.consumer.send(text_data=text_data)
+
+
+class RoomSubscription(Subscription):
+    def __init__(self, consumer, room_id):
+        super().__init__(consumer, f'room:{room_id}', f'chat_{room_id}')
+        self.room_id = str(room_id)
+
+    def typing_context(self):
+        return {'room_id': self.room_id}
+
+    def missed_messages(self, last_id):
+        return missed_room_messages(self.room_id, last_id)
+
+    def replay_data(self, message):
+        return room_message_data(message, message.sender, self.room_id)
+
+    async def send_message(self, content):
+        message = await database_sync_to_async(ChatMessage.objects.create)(
+            room_id=self.room_id,
+            sender=self.user,
+            text=content
+        )
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            broadcast_event(
+                'chat_message', self.room_group_name,
+                room_message_data(message, self.user, self.room_id),
+                id=message.id
+            )
+        )
+        await self.typing_stop()
+
+
+class PrivateSubscription(Subscription):
+    def __init__(self, consumer, other_user_id):
+        super().__init__(consumer, f'private:{other_user_id}', private_group_name(consumer.user.id, other_user_id))
+        self.other_user_id = other_user_id
+
+    def typing_context(self):
+        return {'other_user_id': self.other_user_id}
+
+    def missed_messages(self, last_id):
+        return missed_private_messages(self.user.id, self.other_user_id, last_id)
+
+    def replay_data(self, message):
+        return private_message_data(message, message.sender)
+
+    async def send_message(self, content):
+        if not await database_sync_to_async(are_connected)(self.user.id, self.other_user_id):
+            await self.consumer.send_error('Cannot send message - users are not connected', self.stream)
+            return
+        chat = await database_sync_to_async(private_chat_between)(self.user.id, self.other_user_id)
+        if not chat:
+            await self.consumer.send_error('Failed to create chat', self.stream)
+            return
+        message = await database_sync_to_async(PrivateMessage.objects.create)(
+            chat=chat,
+            sender=self.user,
+            content=content
+        )
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            broadcast_event(
+                'private_chat_message', self.room_group_name,
+                private_message_data(message, self.user),
+                id=message.id
+            )
+        )
+        await self.typing_stop()
+
+
+class MultiplexConsumer(MetricsConsumerMixin, RateLimitConsumerMixin, PresenceConsumerMixin, AsyncWebsocketConsumer):
+    """
+    One socket per device for all of a user's rooms and private chats.
+
+    The token is checked once, on connect. The client then subscribes to
+    streams, named ``room:<room_id>`` and ``private:<user_id>``:
+
+        {"type": "subscribe", "room_ids": [1, 2], "user_ids": [7],
+         "last_ids": {"room:1": 120}}
+        {"type": "unsubscribe", "streams": ["room:1"]}
+        {"type": "message", "stream": "room:2", "content": "hi"}
+        {"type": "typing", "stream": "private:7", "is_typing": false}
+        {"type": "ping"}
+
+    A subscribe frame is checked with one query per kind, however many ids
+    it lists. ``last_ids`` resumes streams as on the per-room endpoints
+    (see ``ResumeMixin``), one query per resumed stream. Frames sent to the client are the ones the per-room and
+    per-chat endpoints send, plus the ``stream`` they belong to.
+    """
+
+    get_token = ChatConsumer.get_token
+
+    async def connect(self):
+        self.subscriptions = {}
+        self.streams_by_group = {}
+        try:
+            token = await self.get_token()
+            if not token:
+                logger.error("No token provided")
+                await self.close(code=4001)
+                return
+
+            try:
+                access_token = AccessToken(token)
+                user_id = access_token['user_id']
+                self.user = await database_sync_to_async(User.objects.get)(id=user_id)
+            except (InvalidToken, TokenError) as e:
+                logger.error("Invalid token: %s", e)
+                await self.close(code=4002)
+                return
+            except User.DoesNotExist:
+                logger.error("User with id %s does not exist", user_id)
+                await self.close(code=4003)
+                return
+
+            await self.accept()
+            await self.presence_connect(self.user.id)
+            logger.info("User %s connected to multiplex socket", self.user.username, extra={'user_id': self.user.id})
+
+            await self.send(text_data=json.dumps({
+                'type': 'connection_established',
+                'user': {
+                    'id': self.user.id,
+                    'username': self.user.username
+                }
+            }))
+
+        except Exception as e:
+            logger.error("Error in connect: %s", e)
+            await self.close(code=4000)
+
+    async def disconnect(self, close_code):
+        try:
+            await self.presence_disconnect()
+            for stream in list(getattr(self, 'subscriptions', {})):
+                await self.unsubscribe(stream)
+            if hasattr(self, 'user'):
+                logger.info(
+                    "User %s disconnected from multiplex socket with code: %s", self.user.username, close_code,
+                    extra={'user_id': self.user.id, 'close_code': close_code}
+                )
+        except Exception as e:
+            logger.error("Error in disconnect: %s", e)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            if not isinstance(data, dict):
+                raise ValueError("Expected JSON object")
+
+            message_type = data.get('type')
+
+            await self.presence_heartbeat()
+            if message_type == 'ping':
+                await self.send(text_data=json.dumps({'type': 'pong'}))
+            elif message_type == 'subscribe':
+                await self.handle_subscribe(data)
+            elif message_type == 'unsubscribe':
+                await self.handle_unsubscribe(data)
+            elif message_type in ('message', 'typing'):
+                subscription = self.subscriptions.get(data.get('stream'))
+                if subscription is None:
+                    await self.send_error("Not subscribed to this stream", data.get('stream'))
+                elif message_type == 'typing':
+                    await subscription.typing_frame(data)
+                else:
+                    await self.handle_message(subscription, data)
+            else:
+                logger.warning("Unknown message type: %s", message_type)
+
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error("Invalid message format: %s", e)
+            await self.send_error("Invalid message format. Please send JSON with type and content.")
+        except Exception as e:
+            logger.error("Error in receive: %s", e)
+            await self.send_error("An error occurred while processing your message.")
+
+    async def handle_subscribe(self, data):
+        room_ids = self.parse_ids(data.get('room_ids', []))
+        user_ids = self.parse_ids(data.get('user_ids', []))
+        room_ids = [i for i in room_ids if f'room:{i}' not in self.subscriptions]
+        user_ids = [i for i in user_ids if f'private:{i}' not in self.subscriptions and i != self.user.id]
+
+        total = len(self.subscriptions) + len(room_ids) + len(user_ids)
+        if total > settings.MULTIPLEX_MAX_SUBSCRIPTIONS:
+            await self.send_error(f"At most {settings.MULTIPLEX_MAX_SUBSCRIPTIONS} subscriptions per connection")
+            return
+
+        allowed_rooms, allowed_users = await self.allowed(room_ids, user_ids)
+        subscribed, rejected = [], []
+        for room_id in room_ids:
+            if room_id in allowed_rooms:
+                await self.subscribe(RoomSubscription(self, room_id))
+                await self.presence_join(room_id)
+                subscribed.append(f'room:{room_id}')
+            else:
+                rejected.append(f'room:{room_id}')
+        for user_id in user_ids:
+            if user_id in allowed_users:
+                await self.subscribe(PrivateSubscription(self, user_id))
+                subscribed.append(f'private:{user_id}')
+            else:
+                rejected.append(f'private:{user_id}')
+
+        await self.send(text_data=json.dumps({
+            'type': 'subscribed',
+            'streams': subscribed,
+            'rejected': rejected
+        }))
+
+        last_ids = data.get('last_ids') or {}
+        if not isinstance(last_ids, dict):
+            raise ValueError("last_ids must be an object")
+        for stream in subscribed:
+            await self.subscriptions[stream].resume(parse_last_id(last_ids.get(stream)), stream=stream)
+
+    async def handle_unsubscribe(self, data):
+        streams = data.get('streams', [])
+        if not isinstance(streams, list):
+            raise ValueError("streams must be a list")
+        removed = [stream for stream in streams if stream in self.subscriptions]
+        for stream in removed:
+            await self.unsubscribe(stream)
+        await self.send(text_data=json.dumps({'type': 'unsubscribed', 'streams': removed}))
+
+    async def handle_message(self, subscription, data):
+        content = data.get('content', data.get('text', ''))
+        if not isinstance(content, str) or not content.strip():
+            await self.send_error("Message content cannot be empty", subscription.stream)
+            return
+        if not await self.allow_write(content.strip(), stream=subscription.stream):
+            return
+        try:
+            await subscription.send_message(content.strip())
+        except Exception as e:
+            logger.error("Error creating message: %s", e)
+            await self.send_error("Failed to send message", subscription.stream)
+
+    def parse_ids(self, ids):
+        if not isinstance(ids, list):
+            raise ValueError("Expected a list of ids")
+        try:
+            return list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            raise ValueError("Ids must be integers")
+
+    @database_sync_to_async
+    def allowed(self, room_ids, user_ids):
+        rooms = set(rooms_for_user(self.user).filter(pk__in=room_ids).values_list('pk', flat=True)) if room_ids else set()
+        users = connected_user_ids(self.user.id, user_ids) if user_ids else set()
+        return rooms, users
+
+    async def subscribe(self, subscription):
+        self.subscriptions[subscription.stream] = subscription
+        self.streams_by_group[subscription.room_group_name] = subscription.stream
+        await self.channel_layer.group_add(subscription.room_group_name, self.channel_name)
+
+    async def unsubscribe(self, stream):
+        subscription = self.subscriptions.pop(stream)
+        self.streams_by_group.pop(subscription.room_group_name, None)
+        await self.channel_layer.group_discard(subscription.room_group_name, self.channel_name)
+        await subscription.typing_disconnect()
+        if isinstance(subscription, RoomSubscription):
+            await self.presence_leave(int(subscription.room_id))
+
+    async def send_error(self, error_message, stream=None):
+        payload = {'type': 'error', 'message': error_message}
+        if stream is not None:
+            payload['stream'] = stream
+        await self.send(text_data=json.dumps(payload))
+
+    async def forward(self, event):
+        stream = self.streams_by_group.get(event.get('group'))
+        if stream is None:
+            # Unsubscribed while the event was in flight
+            return
+        if self.subscriptions[stream].already_replayed(event):
+            return
+        await self.send(text_data=with_stream(frame_text(event), stream))
+
+    async def chat_message(self, event):
+        await self.forward(event)
+
+    async def private_chat_message(self, event):
+        await self.forward(event)
 
     async def typing_notification(self, event):
-        """Send typing notification to WebSocket"""
-        await self.send(text_data=json.dumps(event['message']))
-        
+        if event.get('sender_id') == self.user.id:
+            return
+        await self.forward(event)
+
+
 # Custom WebSocket middleware for better error handling
 class TokenAuthMiddleware:
     """Custom middleware for token authentication"""
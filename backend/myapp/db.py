@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+def postgres_only(sql, reverse_sql=None):
+    """
+    Migration operation that runs raw SQL on PostgreSQL and is a no-op elsewhere.
+
+    Used for features SQLite cannot express (range columns, GiST/GIN indexes,
+    extensions) so the same migration history still applies to test databases.
+    """
+    # params=None: the SQL runs as written, so it may contain % (e.g. format())
+    def forwards(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql, params=None)
+
+    def backwards(apps, schema_editor):
+        if reverse_sql and schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(reverse_sql, params=None)
+
+    return migrations.RunPython(forwards, backwards)
+
+
+def connection_stats(alias='default'):
+    """
+    Describe how ``alias`` manages connections: persistent-connection settings,
+    pool counters when Django's psycopg pool is enabled, and on PostgreSQL the
+    server's view of this application's connections by state.
+    """
+    from django.db import connections
+
+    connection = connections[alias]
+    settings_dict = connection.settings_dict
+    pool_options = settings_dict.get('OPTIONS', {}).get('pool')
+    stats = {
+        'vendor': connection.vendor,
+        'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+        'conn_health_checks': settings_dict.get('CONN_HEALTH_CHECKS'),
+        'server_side_cursors': not settings_dict.get('DISABLE_SERVER_SIDE_CURSORS', False),
+        'pooled': bool(pool_options),
+        'pool': None,
+        'server': None,
+    }
+
+    if pool_options and connection.pool is not None:
+        # psycopg_pool counters: pool_size, pool_available, requests_waiting, ...
+        stats['pool'] = connection.pool.get_stats()
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND application_name = %s GROUP BY 1",
+                [settings_dict.get('OPTIONS', {}).get('application_name', '')],
+            )
+            stats['server'] = dict(cursor.fetchall())
+    return stats
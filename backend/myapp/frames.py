@@ -0,0 +1,53 @@
+"""
+Encode-once frames for group broadcasts.
+
+A group_send reaches every socket in the group. If each receiving consumer
+turned the payload into JSON itself, a message to a 500-member room would be
+encoded 500 times. Senders build the event with ``broadcast_event``, which
+encodes the payload once and carries it as ``text``; receivers write it to
+the socket unchanged with ``frame_text``. orjson is used when it is
+installed, the standard library otherwise.
+
+The multiplex consumer tags each frame with its stream. ``with_stream``
+does that by splicing the key into the encoded object, which is much
+cheaper than decoding and encoding again.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library is slower but equivalent
+    orjson = None
+
+
+def encode_frame(payload):
+    """``payload`` as JSON text, ready for ``send(text_data=...)``"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            # Types orjson refuses (e.g. integers over 64 bits); json may cope
+            pass
+    return json.dumps(payload)
+
+
+def broadcast_event(handler, group_name, payload, **routing):
+    """
+    A group_send event for consumer method ``handler`` carrying ``payload``
+    encoded once. ``routing`` fields (message id, sender id) let receivers
+    filter without decoding the frame.
+    """
+    return {'type': handler, 'group': group_name, **routing, 'text': encode_frame(payload)}
+
+
+def frame_text(event):
+    """The encoded frame of a broadcast event; older events carry the payload instead"""
+    text = event.get('text')
+    if text is None:
+        text = encode_frame(event['message'])
+    return text
+
+
+def with_stream(text, stream):
+    """Add ``"stream": stream`` to an encoded JSON object"""
+    return f'{text[:-1]},"stream":{json.dumps(stream)}}}' if text != '{}' else encode_frame({'stream': stream})
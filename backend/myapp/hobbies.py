@@ -0,0 +1,120 @@
+"""
+Normalized hobby storage.
+
+Profiles keep hobbies as free text. Depending on the client it may be a JSON
+list, a Python list repr (a list saved straight into a TextField) or a
+comma-separated string. ``sync_user_hobbies`` parses every hobby field a user
+has and mirrors the result into ``UserHobby`` rows, so matching can use
+indexed joins against ``Hobby`` instead of re-parsing text per request.
+"""
+import ast
+import json
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .cache import HOBBY_IDS_CACHE_KEY, cached_lookup, invalidate
+from .models import CustomUser, Hobby, UserHobby
+
+HOBBY_NAME_MAX_LENGTH = Hobby._meta.get_field('name').max_length
+
+# Every text field that can hold a user's hobbies, as paths from CustomUser
+HOBBY_SOURCES = (
+    'hobbies',
+    'student_profile__hobbies',
+    'hstudent_profile__hobbies',
+    'serviceprovider_profile__hobbies',
+    'jobseeker_profile__hobbies',
+)
+
+
+def _clean(name):
+    name = ' '.join(str(name).strip().strip('\'"[]').split())
+    return name[:HOBBY_NAME_MAX_LENGTH]
+
+
+def parse_hobbies(value):
+    """Parse stored hobby text (or a list) into unique names, keeping first spelling and order"""
+    if not value:
+        return []
+
+    if isinstance(value, str):
+        text = value.strip()
+        items = None
+        if text.startswith('['):
+            for loader in (json.loads, ast.literal_eval):
+                try:
+                    items = loader(text)
+                    break
+                except (ValueError, SyntaxError):
+                    continue
+        if not isinstance(items, (list, tuple)):
+            items = text.split(',')
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = [value]
+
+    names = {}
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get('name', '')
+        name = _clean(item)
+        if name:
+            names.setdefault(name.lower(), name)
+    return list(names.values())
+
+
+def _hobby_ids_by_name():
+    return {name.lower(): pk for pk, name in Hobby.objects.values_list('pk', 'name')}
+
+
+def get_or_create_hobby_ids(names):
+    """
+    Return Hobby ids for ``names``, matching existing hobbies case-insensitively
+    so "Hiking" and "hiking" share one row.
+    """
+    wanted = {}
+    for name in names:
+        name = _clean(name)
+        if name:
+            wanted.setdefault(name.lower(), name)
+    if not wanted:
+        return []
+
+    known = cached_lookup(HOBBY_IDS_CACHE_KEY, _hobby_ids_by_name)
+    missing = [name for key, name in wanted.items() if key not in known]
+    if missing:
+        Hobby.objects.bulk_create([Hobby(name=name) for name in missing], ignore_conflicts=True)
+        # bulk_create sends no post_save, so invalidate here
+        invalidate(HOBBY_IDS_CACHE_KEY)
+        known = {
+            hobby.lname: hobby.pk
+            for hobby in Hobby.objects.annotate(lname=Lower('name')).filter(lname__in=list(wanted))
+        }
+    return [known[key] for key in wanted if key in known]
+
+
+def sync_user_hobbies(user_id):
+    """Rebuild the UserHobby rows of one user from all of their hobby fields"""
+    sources = CustomUser.objects.filter(pk=user_id).values_list(*HOBBY_SOURCES).first()
+    if sources is None:
+        return
+
+    names = []
+    for value in sources:
+        names.extend(parse_hobbies(value))
+
+    with transaction.atomic():
+        wanted = set(get_or_create_hobby_ids(names))
+        current = set(UserHobby.objects.filter(user_id=user_id).values_list('hobby_id', flat=True))
+
+        stale = current - wanted
+        if stale:
+            UserHobby.objects.filter(user_id=user_id, hobby_id__in=stale).delete()
+        added = wanted - current
+        if added:
+            UserHobby.objects.bulk_create(
+                [UserHobby(user_id=user_id, hobby_id=hobby_id) for hobby_id in added],
+                ignore_conflicts=True,
+            )
@@ -0,0 +1,123 @@
+"""
+Minimal iCalendar (RFC 5545) writer for the booking calendar export.
+
+Bookings store wall-clock date/time without a zone, so they are written as
+floating times; events carry aware datetimes and are written in UTC.
+"""
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+PRODID = '-//Ispani//Calendar//EN'
+
+BOOKING_STATUS_MAP = {
+    'pending': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'completed': 'CONFIRMED',
+    'cancelled': 'CANCELLED',
+}
+
+
+def escape_text(value):
+    """Escape a TEXT property value"""
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Fold a content line to 75 octets as required by RFC 5545, ending with CRLF"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split inside a multi-byte UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def format_floating(date, time):
+    return datetime.combine(date, time).strftime('%Y%m%dT%H%M%S')
+
+
+def _uid_domain():
+    return urlparse(settings.FRONTEND_URL).hostname or 'localhost'
+
+
+def vevent(uid, dtstamp, dtstart, dtend, summary, description=None, location=None, url=None, status=None):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{dtstamp}',
+        f'DTSTART:{dtstart}',
+        f'DTEND:{dtend}',
+        f'SUMMARY:{escape_text(summary)}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{escape_text(description)}')
+    if location:
+        lines.append(f'LOCATION:{escape_text(location)}')
+    if url:
+        lines.append(f'URL:{url}')
+    if status:
+        lines.append(f'STATUS:{status}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def booking_vevent(booking, user):
+    """Render a booking (with tutor, student and subject selected) as seen by ``user``"""
+    other = booking.student if booking.tutor_id == user.id else booking.tutor
+    return vevent(
+        uid=f'booking-{booking.id}@{_uid_domain()}',
+        dtstamp=format_utc(booking.updated_at),
+        dtstart=format_floating(booking.date, booking.start_time),
+        dtend=format_floating(booking.date, booking.end_time),
+        summary=f'{booking.subject.name} with {other.username}',
+        description=booking.notes,
+        location=booking.location if booking.booking_type == 'physical' else booking.platform,
+        url=booking.meeting_link,
+        status=BOOKING_STATUS_MAP.get(booking.status),
+    )
+
+
+def event_vevent(event):
+    return vevent(
+        uid=f'event-{event.id}@{_uid_domain()}',
+        dtstamp=format_utc(event.updated_at),
+        dtstart=format_utc(event.start_time),
+        dtend=format_utc(event.end_time),
+        summary=event.title,
+        description=event.description,
+        location=event.location,
+        status='CONFIRMED',
+    )
+
+
+def iter_calendar(components, name=None):
+    """Yield a VCALENDAR stream chunk by chunk around already rendered components"""
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH']
+    if name:
+        header.append(f'X-WR-CALNAME:{escape_text(name)}')
+    yield ''.join(fold(line) for line in header)
+    for component in components:
+        yield component
+    yield fold('END:VCALENDAR')
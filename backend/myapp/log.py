@@ -0,0 +1,134 @@
+"""
+Logging that stays off the request and WebSocket hot paths.
+
+- ``QueueingHandler`` puts records on a bounded queue; a background thread
+  formats and writes them with the real handler (``target``). The calling
+  thread only renders the message string. When the queue is full, records
+  are dropped and counted instead of blocking the event loop.
+- ``JsonFormatter`` writes one JSON object per line: time, level, logger,
+  message, and any ``extra={...}`` fields, so log pipelines can filter on
+  ``user_id`` or ``room_id`` without parsing text.
+- ``log_sampled`` keeps a fraction (``LOG_SAMPLE_RATE``) of high-volume
+  events such as per-frame logs. The check comes before the record is
+  built, so skipped events cost one random number.
+
+Call sites pass arguments instead of f-strings (``logger.info("... %s",
+value)``), so disabled levels never format anything.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Attributes every LogRecord has; anything else came from ``extra``
+RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """
+    Use from ``LOGGING`` as ``{'()': 'myapp.log.QueueingHandler', 'target':
+    'logging.StreamHandler', 'formatter': ...}``. The formatter is applied by
+    the writer thread. The thread is started on first use in each process,
+    so it survives a fork.
+    """
+
+    def __init__(self, target='logging.StreamHandler', queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = import_string(target)()
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._stopped = False
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting happens in the writer thread, with the target's formatter
+        self.target.setFormatter(fmt)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self.target.setLevel(level)
+
+    def prepare(self, record):
+        # Render the message now, while its arguments are still what the
+        # caller meant; leave JSON and tracebacks to the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._stopped:
+            # Shutting down: no writer thread any more, write in place
+            self.target.handle(record)
+            return
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._start_lock:
+            if self._listener_pid == pid:
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = pid
+            atexit.register(self._stop)
+
+    def _stop(self):
+        # Drains the queue; safe to call more than once
+        with self._start_lock:
+            listener, self._listener = self._listener, None
+            if listener is not None and self._listener_pid == os.getpid():
+                listener.stop()
+            self._stopped = True
+
+    def close(self):
+        self._stop()
+        self.target.close()
+        super().close()
+
+
+def log_sampled(logger, level, msg, *args, rate=None, **kwargs):
+    """``logger.log`` for a ``rate`` fraction of calls (default ``LOG_SAMPLE_RATE``)"""
+    if not logger.isEnabledFor(level):
+        return
+    if rate is None:
+        rate = settings.LOG_SAMPLE_RATE
+    if rate < 1 and random.random() >= rate:
+        return
+    extra = kwargs.pop('extra', None) or {}
+    logger.log(level, msg, *args, extra={**extra, 'sample_rate': rate}, **kwargs)
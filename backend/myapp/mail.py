@@ -0,0 +1,156 @@
+"""
+Email outbox.
+
+Views call ``queue_email`` instead of ``send_mail``. The message is written
+as an ``OutboundEmail`` row inside the caller's transaction, and a Celery
+task is queued once that transaction commits. ``deliver_pending`` then sends
+due rows over one SMTP connection per batch, and reschedules failures with
+exponential backoff until ``EMAIL_OUTBOX_MAX_ATTEMPTS`` is reached. A beat
+sweep picks up anything whose task was never published or whose worker died
+mid-send.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+# How long a claimed row stays with one worker before another may retry it
+SENDING_LEASE = timedelta(minutes=5)
+
+
+def _max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+
+
+def _backoff_seconds(attempts):
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_BASE', 30)
+    cap = getattr(settings, 'EMAIL_OUTBOX_RETRY_MAX', 3600)
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+
+def queue_email(subject, message, recipient_list, from_email=None, html_message=None):
+    """
+    Store an email in the outbox and schedule delivery after the current
+    transaction commits. Returns the OutboundEmail row.
+    """
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=message or '',
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+    transaction.on_commit(lambda: _publish([email.pk]))
+    return email
+
+
+def _publish(ids):
+    from .tasks import deliver_outbound_email
+
+    try:
+        # retry=False: don't keep the request waiting on publish retries when the
+        # broker is down; the row is already stored and the beat sweep sends it.
+        deliver_outbound_email.apply_async(args=[ids], retry=False)
+    except Exception as e:
+        logger.warning("Could not queue outbound email %s; leaving it for the sweep: %s", ids, e)
+
+
+def _build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _claim(ids, batch_size):
+    """Lease up to ``batch_size`` due rows to this worker"""
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        Q(status='pending') | Q(status='sending'),
+        next_attempt_at__lte=now,
+    ).order_by('next_attempt_at')
+    if ids is not None:
+        due = due.filter(pk__in=ids)
+
+    with transaction.atomic():
+        batch = list(due.select_for_update(skip_locked=True)[:batch_size])
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                status='sending',
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + SENDING_LEASE,
+            )
+    for email in batch:
+        email.attempts += 1
+    return batch
+
+
+def _record_failure(email, error, stats):
+    email.last_error = str(error)[:2000]
+    if email.attempts >= _max_attempts():
+        email.status = 'failed'
+        stats['failed'] += 1
+        logger.error("Giving up on outbound email %s after %s attempts: %s", email.pk, email.attempts, error)
+    else:
+        delay = _backoff_seconds(email.attempts)
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        stats['retry'] += 1
+        stats['retry_in'] = min(stats['retry_in'] or delay, delay)
+    email.save(update_fields=['status', 'last_error', 'next_attempt_at'])
+
+
+def deliver_pending(ids=None, batch_size=BATCH_SIZE):
+    """
+    Send due outbox rows, restricted to ``ids`` when given. Returns counts of
+    sent, retried and failed rows, plus ``retry_in``: seconds until the
+    earliest retry, or None.
+    """
+    stats = {'sent': 0, 'retry': 0, 'failed': 0, 'retry_in': None}
+
+    while True:
+        batch = _claim(ids, batch_size)
+        if not batch:
+            return stats
+
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.warning("Email connection failed: %s", e)
+            for email in batch:
+                _record_failure(email, e, stats)
+            return stats
+
+        try:
+            for email in batch:
+                try:
+                    connection.send_messages([_build_message(email, connection)])
+                except Exception as e:
+                    _record_failure(email, e, stats)
+                else:
+                    email.status = 'sent'
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    email.save(update_fields=['status', 'sent_at', 'last_error'])
+                    stats['sent'] += 1
+        finally:
+            connection.close()
+
+        if len(batch) < batch_size:
+            return stats
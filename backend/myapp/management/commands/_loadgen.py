@@ -0,0 +1,100 @@
+"""
+Client-side helpers shared by the loadtest and benchmark commands.
+
+The leading underscore keeps Django from listing this module as a command.
+"""
+import asyncio
+import json
+import statistics
+from urllib.parse import urlsplit
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {}
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive, body)"""
+    status_line = await reader.readuntil(b'\r\n')
+    status = int(status_line.split()[1])
+    length, chunked, keep_alive = 0, False, True
+    while True:
+        line = await reader.readuntil(b'\r\n')
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            keep_alive = False
+
+    body = b''
+    if chunked:
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            body += (await reader.readexactly(size + 2))[:-2]
+            if size == 0:
+                break
+    elif length:
+        body = await reader.readexactly(length)
+    return status, keep_alive, body
+
+
+class HttpConnection:
+    """
+    One keep-alive HTTP/1.1 connection, reopened after the server closes it
+    or on error. Raw asyncio streams keep the client's own overhead low
+    enough that the numbers describe the server.
+    """
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.netloc = parts.netloc
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = parts.scheme == 'https' or None
+        self.reader = self.writer = None
+
+    async def request(self, method, path, token=None, payload=None):
+        body = b'' if payload is None else json.dumps(payload).encode()
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.netloc}', 'Connection: keep-alive']
+        if token:
+            head.append(f'Authorization: Bearer {token}')
+        if payload is not None:
+            head += ['Content-Type: application/json', f'Content-Length: {len(body)}']
+        raw = ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        try:
+            self.writer.write(raw)
+            await self.writer.drain()
+            status, keep_alive, response = await read_response(self.reader)
+        except BaseException:
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status, response
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
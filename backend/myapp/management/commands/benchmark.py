@@ -0,0 +1,380 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from myapp.models import CustomUser, GroupMembership, Subject
+from myapp.models.authentication import ConnectionRequest, TutorProfile
+
+from ._loadgen import HttpConnection, latency_summary
+
+# Relative weights of each operation per scenario. WS operations are whole
+# sessions: connect, exchange --ws-messages chat messages, disconnect.
+MIXES = {
+    'browse': {'rooms': 3, 'history': 3, 'group_suggestions': 2, 'tutors': 2},
+    'chat': {'rooms': 1, 'history': 2, 'ws_chat': 4, 'ws_private': 3},
+    'booking': {'login': 1, 'tutors': 4, 'booking_create': 2},
+    'mixed': {
+        'login': 1, 'rooms': 3, 'history': 3, 'group_suggestions': 2, 'tutors': 2,
+        'booking_create': 1, 'ws_chat': 2, 'ws_private': 1,
+    },
+}
+OPERATIONS = ('login', 'rooms', 'history', 'group_suggestions', 'tutors', 'booking_create', 'ws_chat', 'ws_private')
+
+# Compared between runs; a rise in any of them is a regression
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'error_rate')
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return dict(MIXES[value])
+    weights = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise CommandError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for {name!r}: {weight!r}")
+    return weights
+
+
+class Account:
+    def __init__(self, user, room_id, peer_id):
+        self.user = user
+        self.token = str(RefreshToken.for_user(user).access_token)
+        self.room_id = room_id
+        self.peer_id = peer_id
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def record(self, operation, started, status=None, ok=True):
+        self.latencies[operation].append(time.perf_counter() - started)
+        if status is not None:
+            self.statuses[operation][str(status)] += 1
+        if not ok:
+            self.errors[operation] += 1
+
+    def fail(self, operation, reason):
+        self.statuses[operation][reason] += 1
+        self.errors[operation] += 1
+
+    def report(self, elapsed):
+        operations = {}
+        names = sorted(set(self.latencies) | set(self.errors))
+        for name in names:
+            latencies = self.latencies[name]
+            attempts = len(latencies) + sum(
+                count for status, count in self.statuses[name].items() if not status.isdigit()
+            )
+            operations[name] = {
+                'count': attempts,
+                'errors': self.errors[name],
+                'error_rate': round(self.errors[name] / attempts, 4) if attempts else 0.0,
+                'per_sec': round(len(latencies) / elapsed, 2),
+                'statuses': dict(sorted(self.statuses[name].items())),
+                **latency_summary(latencies),
+            }
+        every = [value for values in self.latencies.values() for value in values]
+        attempts = sum(op['count'] for op in operations.values())
+        errors = sum(self.errors.values())
+        return operations, {
+            'count': attempts,
+            'errors': errors,
+            'error_rate': round(errors / attempts, 4) if attempts else 0.0,
+            'per_sec': round(len(every) / elapsed, 2),
+            **latency_summary(every),
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a running server with a weighted mix of REST calls and WebSocket chat "
+        "sessions. Reports p50/p95/p99 latency, throughput and error rate per operation, "
+        "optionally as JSON (--output) that a later run can --compare against."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the web pool')
+        parser.add_argument('--ws-url', default='ws://127.0.0.1:8001', help='Base URL of the WebSocket pool')
+        parser.add_argument('--mix', default='mixed',
+                            help=f"Scenario ({', '.join(MIXES)}) or explicit weights, e.g. 'rooms=3,ws_chat=1'")
+        parser.add_argument('--users', help='Comma-separated usernames to act as (default: --accounts students)')
+        parser.add_argument('--accounts', type=int, default=20,
+                            help='Students picked automatically: group members with an accepted connection')
+        parser.add_argument('--password', help="Shared password of the accounts, needed by 'login'")
+        parser.add_argument('--vus', type=int, default=20, help='Concurrent virtual users')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+        parser.add_argument('--think-time', type=float, default=0.0, help='Seconds each virtual user waits between operations')
+        parser.add_argument('--ws-messages', type=int, default=5, help='Messages sent per WebSocket session')
+        parser.add_argument('--seed', type=int, help='Random seed, for repeatable operation sequences')
+        parser.add_argument('--label', default='', help='Name stored with the results')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--compare', help='JSON report of an earlier run to compare against')
+        parser.add_argument('--max-regression', type=float,
+                            help='With --compare, fail when a p95 rises by more than this percentage')
+
+    def handle(self, *args, **options):
+        weights = parse_mix(options['mix'])
+        if not weights or not any(weight > 0 for weight in weights.values()):
+            raise CommandError("The mix has no operations")
+        if 'login' in weights and not options['password']:
+            raise CommandError("The mix includes 'login'; pass --password (shared by the benchmark accounts)")
+        needs_ws = any(name.startswith('ws_') for name in weights)
+        if needs_ws:
+            try:
+                import websockets  # noqa: F401
+            except ImportError:
+                raise CommandError("WebSocket operations need the 'websockets' package (installed with uvicorn[standard])")
+
+        accounts = self._accounts(options)
+        fixtures = {
+            'tutors': list(TutorProfile.objects.values_list('user_id', 'hourly_rate')[:200]),
+            'subjects': list(Subject.objects.values_list('id', flat=True)),
+        }
+        if 'booking_create' in weights and not (fixtures['tutors'] and fixtures['subjects']):
+            raise CommandError("'booking_create' needs at least one tutor and one subject")
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        rng = random.Random(options['seed'])
+        started_at = datetime.now(timezone.utc)
+        stats, elapsed = asyncio.run(self._run(options, weights, accounts, fixtures, rng))
+        operations, totals = stats.report(elapsed)
+
+        report = {
+            'label': options['label'],
+            'started_at': started_at.isoformat(),
+            'url': options['url'],
+            'ws_url': options['ws_url'],
+            'mix': weights,
+            'vus': options['vus'],
+            'accounts': len(accounts),
+            'duration_s': round(elapsed, 2),
+            'totals': totals,
+            'operations': operations,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report)
+
+        if baseline is not None:
+            regressions = self._compare(baseline, report, options['max_regression'])
+            if regressions:
+                raise CommandError(f"p95 regressed beyond {options['max_regression']}%: {', '.join(regressions)}")
+
+    # Setup -----------------------------------------------------------------
+
+    def _accounts(self, options):
+        if options['users']:
+            usernames = [name.strip() for name in options['users'].split(',') if name.strip()]
+            users = list(CustomUser.objects.filter(username__in=usernames))
+            missing = set(usernames) - {user.username for user in users}
+            if missing:
+                raise CommandError(f"No users named {', '.join(sorted(missing))}")
+        else:
+            users = list(
+                CustomUser.objects.filter(is_active=True, student_profile__isnull=False, groupmembership__isnull=False)
+                .filter(Q(sent_requests__status='accepted') | Q(received_requests__status='accepted'))
+                .distinct().order_by('id')[:options['accounts']]
+            )
+        if not users:
+            raise CommandError("No accounts to benchmark with; pass --users or seed some data")
+
+        user_ids = [user.id for user in users]
+        rooms = {}
+        for user_id, room_id in GroupMembership.objects.filter(
+            user_id__in=user_ids, group__chat_room__isnull=False,
+        ).values_list('user_id', 'group__chat_room').order_by('group_id'):
+            rooms.setdefault(user_id, room_id)
+        peers = {}
+        for from_id, to_id in ConnectionRequest.objects.filter(
+            Q(from_user_id__in=user_ids) | Q(to_user_id__in=user_ids), status='accepted'
+        ).values_list('from_user_id', 'to_user_id').order_by('id'):
+            peers.setdefault(from_id, to_id)
+            peers.setdefault(to_id, from_id)
+        return [Account(user, rooms.get(user.id), peers.get(user.id)) for user in users]
+
+    # Run -------------------------------------------------------------------
+
+    async def _run(self, options, weights, accounts, fixtures, rng):
+        stats = Stats()
+        names = list(weights)
+        relative = [weights[name] for name in names]
+        deadline = time.perf_counter() + options['duration']
+
+        async def virtual_user(index):
+            account = accounts[index % len(accounts)]
+            connection = HttpConnection(options['url'])
+            while time.perf_counter() < deadline:
+                operation = rng.choices(names, relative)[0]
+                try:
+                    await getattr(self, f'_op_{operation}')(connection, account, fixtures, rng, stats, options)
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    stats.fail(operation, type(e).__name__)
+                    connection.close()
+                    await asyncio.sleep(0.05)
+                if options['think_time']:
+                    await asyncio.sleep(options['think_time'])
+            connection.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(index) for index in range(options['vus'])))
+        return stats, time.perf_counter() - started
+
+    async def _get(self, name, connection, account, path, stats):
+        started = time.perf_counter()
+        status, _ = await connection.request('GET', path, account.token)
+        stats.record(name, started, status, ok=status < 400)
+
+    async def _op_login(self, connection, account, fixtures, rng, stats, options):
+        started = time.perf_counter()
+        status, _ = await connection.request(
+            'POST', '/auth/login/', payload={'email': account.user.email, 'password': options['password']}
+        )
+        stats.record('login', started, status, ok=status == 200)
+
+    async def _op_rooms(self, connection, account, fixtures, rng, stats, options):
+        await self._get('rooms', connection, account, '/chat/chat/rooms/', stats)
+
+    async def _op_history(self, connection, account, fixtures, rng, stats, options):
+        if account.room_id is None:
+            return stats.fail('history', 'no_room')
+        await self._get('history', connection, account, f'/chat/chat/rooms/{account.room_id}/messages/', stats)
+
+    async def _op_group_suggestions(self, connection, account, fixtures, rng, stats, options):
+        await self._get('group_suggestions', connection, account, '/groups/groups/suggestions/', stats)
+
+    async def _op_tutors(self, connection, account, fixtures, rng, stats, options):
+        await self._get('tutors', connection, account, '/tutoring/tutors/', stats)
+
+    async def _op_booking_create(self, connection, account, fixtures, rng, stats, options):
+        # A random hour far in the future, so bookings rarely collide with
+        # each other or with real ones; collisions show up as 409s
+        day = date.today() + timedelta(days=3650 + rng.randrange(3650))
+        hour = rng.randrange(6, 21)
+        tutor_id, hourly_rate = rng.choice(fixtures['tutors'])
+        payload = {
+            'tutor_id': tutor_id,
+            'subject_id': rng.choice(fixtures['subjects']),
+            'date': day.isoformat(),
+            'start_time': f'{hour:02d}:00',
+            'end_time': f'{hour + 1:02d}:00',
+            'hourly_rate': str(hourly_rate),
+            'booking_type': 'online',
+            'notes': 'benchmark',
+        }
+        started = time.perf_counter()
+        status, _ = await connection.request('POST', '/tutoring/bookings/', account.token, payload)
+        stats.record('booking_create', started, status, ok=status == 201)
+
+    async def _op_ws_chat(self, connection, account, fixtures, rng, stats, options):
+        if account.room_id is None:
+            return stats.fail('ws_chat.connect', 'no_room')
+        await self._ws_session('ws_chat', f'/ws/chat/{account.room_id}/', account, stats, options)
+
+    async def _op_ws_private(self, connection, account, fixtures, rng, stats, options):
+        if account.peer_id is None:
+            return stats.fail('ws_private.connect', 'no_connection')
+        await self._ws_session('ws_private', f'/ws/private/{account.peer_id}/', account, stats, options)
+
+    async def _ws_session(self, name, path, account, stats, options):
+        import websockets
+
+        url = f"{options['ws_url'].rstrip('/')}{path}?token={account.token}"
+        http = urlsplit(options['url'])
+        stage = f'{name}.connect'
+        started = time.perf_counter()
+        try:
+            async with websockets.connect(url, origin=f'{http.scheme}://{http.netloc}', max_size=2 ** 20) as ws:
+                greeting = json.loads(await asyncio.wait_for(ws.recv(), 10))
+                stats.record(stage, started, ok=greeting.get('type') == 'connection_established')
+                stage = f'{name}.message'
+                for _ in range(options['ws_messages']):
+                    # Wait for our own message to come back through the channel layer
+                    content = f'benchmark {uuid.uuid4().hex}'
+                    sent_at = time.perf_counter()
+                    await ws.send(json.dumps({'type': 'message', 'content': content}))
+                    while True:
+                        event = json.loads(await asyncio.wait_for(ws.recv(), 10))
+                        if event.get('type') == 'error':
+                            # e.g. rate_limited: raise WS_USER_RATE on the server to benchmark past it
+                            stats.fail(stage, event.get('code', 'error'))
+                            break
+                        if event.get('type') == 'message' and content in (event.get('text'), event.get('content')):
+                            stats.record(stage, sent_at)
+                            break
+        except asyncio.TimeoutError:
+            stats.fail(stage, 'timeout')
+        except websockets.exceptions.InvalidStatus as e:
+            stats.fail(stage, str(e.response.status_code))
+        except websockets.exceptions.ConnectionClosed as e:
+            stats.fail(stage, f'closed_{e.rcvd.code if e.rcvd else "abnormal"}')
+        except OSError as e:
+            stats.fail(stage, type(e).__name__)
+
+    # Report ----------------------------------------------------------------
+
+    def _print_report(self, report):
+        totals = report['totals']
+        self.stdout.write(
+            f"{report['label'] or 'benchmark'}: {report['vus']} virtual users, {report['accounts']} accounts, "
+            f"{report['duration_s']} s\n"
+            f"total  {totals['count']} ops, {totals['per_sec']}/s, {totals['error_rate']:.2%} errors, "
+            f"p50 {totals.get('p50_ms')} ms, p95 {totals.get('p95_ms')} ms, p99 {totals.get('p99_ms')} ms"
+        )
+        self.stdout.write(f"{'operation':<20}{'count':>8}{'per_s':>9}{'err%':>8}{'p50':>9}{'p95':>9}{'p99':>9}  statuses")
+        for name, op in report['operations'].items():
+            self.stdout.write(
+                f"{name:<20}{op['count']:>8}{op['per_sec']:>9}{op['error_rate'] * 100:>8.2f}"
+                f"{op.get('p50_ms', '-'):>9}{op.get('p95_ms', '-'):>9}{op.get('p99_ms', '-'):>9}  {op['statuses']}"
+            )
+
+    def _compare(self, baseline, report, max_regression):
+        self.stdout.write(f"\nAgainst {baseline.get('label') or baseline.get('started_at', 'baseline')}:")
+        regressions = []
+        rows = [('total', baseline.get('totals', {}), report['totals'])]
+        rows += [
+            (name, baseline.get('operations', {}).get(name, {}), op)
+            for name, op in report['operations'].items()
+        ]
+        for name, before, after in rows:
+            cells = []
+            for key in COMPARED + ('per_sec',):
+                old, new = before.get(key), after.get(key)
+                if old is None or new is None:
+                    cells.append(f'{key} n/a')
+                    continue
+                change = (new - old) / old * 100 if old else 0.0
+                cells.append(f'{key} {old} -> {new} ({change:+.1f}%)')
+                if key == 'p95_ms' and max_regression is not None and change > max_regression:
+                    regressions.append(name)
+            self.stdout.write(f"{name:<20}" + ', '.join(cells))
+        return regressions
+
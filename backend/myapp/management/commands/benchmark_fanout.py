@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from myapp import frames
+
+
+def _strategies():
+    """(label, encoder, encode once?) for each way of getting a broadcast onto N sockets"""
+    yield 'per receiver, json', json.dumps, False
+    yield 'encode once, json', json.dumps, True
+    if frames.orjson is not None:
+        yield 'encode once, orjson', frames.encode_frame, True
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark group fan-out: one chat message delivered to --members sockets, "
+        "encoded by every receiver versus once by the sender (see myapp.frames). Reports "
+        "the encoding alone and the whole trip through an in-memory channel layer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=500, help='Sockets in the group')
+        parser.add_argument('--rounds', type=int, default=50, help='Messages broadcast per strategy')
+        parser.add_argument('--size', type=int, default=200, help='Characters of message text')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        payload = {
+            'type': 'message',
+            'id': 123456,
+            'text': 'x' * options['size'],
+            'sender': {'id': 42, 'username': 'benchmark'},
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'room_id': '7',
+        }
+        members, rounds = options['members'], options['rounds']
+        results = []
+        for label, encode, once in _strategies():
+            results.append({
+                'strategy': label,
+                'encode_ms': round(self._encode_only(payload, encode, once, members, rounds) * 1000, 3),
+                'layer_ms': round(asyncio.run(self._through_layer(payload, encode, once, members, rounds)) * 1000, 3),
+            })
+        baseline = results[0]
+        for result in results:
+            result['encode_speedup'] = round(baseline['encode_ms'] / result['encode_ms'], 1)
+            result['layer_speedup'] = round(baseline['layer_ms'] / result['layer_ms'], 1)
+
+        report = {'members': members, 'rounds': rounds, 'size': options['size'], 'results': results}
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"fan-out of one {options['size']}-character message to {members} sockets, "
+            f"mean of {rounds} rounds (ms per message)"
+        )
+        self.stdout.write(f"{'strategy':24} {'encode':>10} {'x':>6} {'via layer':>10} {'x':>6}")
+        for r in results:
+            self.stdout.write(
+                f"{r['strategy']:24} {r['encode_ms']:>10} {r['encode_speedup']:>6} "
+                f"{r['layer_ms']:>10} {r['layer_speedup']:>6}"
+            )
+
+    def _encode_only(self, payload, encode, once, members, rounds):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            if once:
+                text = encode(payload)
+                for _ in range(members):
+                    frame = text
+            else:
+                for _ in range(members):
+                    frame = encode(payload)
+        return (time.perf_counter() - started) / rounds
+
+    async def _through_layer(self, payload, encode, once, members, rounds):
+        layer = InMemoryChannelLayer()
+        channels = [await layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await layer.group_add('fanout', channel)
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            # What the consumers do: the sender's group_send, then each receiver's handler
+            if once:
+                event = {'type': 'chat_message', 'group': 'fanout', 'id': payload['id'], 'text': encode(payload)}
+            else:
+                event = {'type': 'chat_message', 'group': 'fanout', 'message': payload}
+            await layer.group_send('fanout', event)
+            for channel in channels:
+                received = await layer.receive(channel)
+                frame = received['text'] if once else encode(received['message'])
+        return (time.perf_counter() - started) / rounds
@@ -0,0 +1,57 @@
+import json
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from myapp.db import connection_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Show database connection settings, pool usage and server-side connection counts. "
+        "With --probe, simulate request cycles and report how many backend connections were used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--probe', type=int, default=0, metavar='N',
+                            help='Run N request cycles per thread (query, then close_old_connections)')
+        parser.add_argument('--threads', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['probe']:
+            self._probe(options['probe'], options['threads'])
+        self.stdout.write(json.dumps(connection_stats(options['database']), indent=2, default=str))
+
+    def _probe(self, cycles, threads):
+        if connection.vendor != 'postgresql':
+            self.stderr.write("Probe needs PostgreSQL (it counts pg_backend_pid values)")
+            return
+
+        backends = set()
+        lock = threading.Lock()
+
+        def worker():
+            seen = set()
+            for _ in range(cycles):
+                # What Django does at the start and end of every request
+                close_old_connections()
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_backend_pid()")
+                    seen.add(cursor.fetchone()[0])
+                close_old_connections()
+            connection.close()
+            with lock:
+                backends.update(seen)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+        self.stdout.write(
+            f"{cycles * threads} request cycles on {threads} thread(s) used "
+            f"{len(backends)} backend connection(s)"
+        )
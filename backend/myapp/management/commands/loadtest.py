@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from myapp.membership import rooms_for_user
+from myapp.models import CustomUser
+
+from ._loadgen import HttpConnection, latency_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a running server: keep-alive HTTP GETs against --url and WebSocket "
+        "round trips against --ws-url, reported as throughput per server core."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the web pool')
+        parser.add_argument('--path', default='/tutoring/subjects/', help='Authenticated GET endpoint to hit')
+        parser.add_argument('--ws-url', default='ws://127.0.0.1:8001', help='Base URL of the WebSocket pool')
+        parser.add_argument('--user', required=True, help='Username to issue the access token for')
+        parser.add_argument('--room', type=int, help='Chat room id for WS clients (default: one the user belongs to)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per phase')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent HTTP connections')
+        parser.add_argument('--ws-clients', type=int, default=100, help='Concurrent WebSocket connections')
+        parser.add_argument('--ws-mode', choices=['ping', 'message'], default='ping',
+                            help="'ping' measures transport round trips; 'message' posts chat messages "
+                                 "(database write plus fan-out to every client in the room). Raise the "
+                                 "server's WS_CONNECTION_RATE and WS_USER_RATE to measure past the rate limits")
+        parser.add_argument('--cores', type=int, default=os.cpu_count(),
+                            help='Cores serving each pool, used for the per-core figures')
+        parser.add_argument('--skip-http', action='store_true')
+        parser.add_argument('--skip-ws', action='store_true')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+        token = str(RefreshToken.for_user(user).access_token)
+
+        room_id = options['room']
+        if room_id is None and not options['skip_ws']:
+            room_id = rooms_for_user(user).values_list('id', flat=True).first()
+            if room_id is None:
+                raise CommandError("The user is not in any chat room; pass --room or --skip-ws")
+
+        report = {'cores': options['cores']}
+        if not options['skip_http']:
+            report['http'] = asyncio.run(self._http_phase(options, token))
+        if not options['skip_ws']:
+            report['ws'] = asyncio.run(self._ws_phase(options, token, room_id))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report)
+
+    # HTTP ------------------------------------------------------------------
+
+    async def _http_phase(self, options, token):
+        deadline = time.perf_counter() + options['duration']
+        latencies, statuses, errors = [], {}, 0
+
+        async def client():
+            nonlocal errors
+            connection = HttpConnection(options['url'])
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = await connection.request('GET', options['path'], token)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    await asyncio.sleep(0.05)
+                    continue
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+            connection.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        rps = len(latencies) / elapsed
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'requests_per_sec': round(rps, 1),
+            'requests_per_sec_per_core': round(rps / options['cores'], 1),
+            **latency_summary(latencies),
+        }
+
+    # WebSocket -------------------------------------------------------------
+
+    async def _ws_phase(self, options, token, room_id):
+        try:
+            import websockets
+        except ImportError:
+            raise CommandError("The WebSocket phase needs the 'websockets' package (installed with uvicorn[standard])")
+
+        url = f"{options['ws_url'].rstrip('/')}/ws/chat/{room_id}/?token={token}"
+        http = urlsplit(options['url'])
+        origin = f'{http.scheme}://{http.netloc}'
+        mode = options['ws_mode']
+        deadline = None
+        connect_times, round_trips = [], []
+        sent = received = failed = rejected = 0
+        ready = asyncio.Event()
+
+        async def receive_all(ws, pongs):
+            nonlocal received, rejected
+            try:
+                async for raw in ws:
+                    received += 1
+                    frame_type = json.loads(raw).get('type')
+                    if frame_type == 'error':
+                        # Rate limited; counted, and a ping waiting on it moves on
+                        rejected += 1
+                    if mode == 'ping' and frame_type in ('pong', 'error'):
+                        pongs.put_nowait(frame_type == 'pong')
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            finally:
+                # Closed by the server: release a ping waiting for its pong
+                pongs.put_nowait(None)
+
+        async def client():
+            nonlocal sent, failed
+            frame = json.dumps({'type': 'ping'} if mode == 'ping' else {'type': 'message', 'content': 'load test'})
+            pongs = asyncio.Queue()
+            started = time.perf_counter()
+            try:
+                async with websockets.connect(url, origin=origin, max_size=2 ** 20) as ws:
+                    await ws.recv()  # connection_established
+                    connect_times.append(time.perf_counter() - started)
+                    await ready.wait()
+                    reader = asyncio.create_task(receive_all(ws, pongs))
+                    while time.perf_counter() < deadline:
+                        sent_at = time.perf_counter()
+                        await ws.send(frame)
+                        sent += 1
+                        if mode == 'ping':
+                            # One ping in flight per client, so each pong pairs with its ping
+                            answer = await pongs.get()
+                            if answer is None:
+                                raise ConnectionError("closed by the server")
+                            if answer:
+                                round_trips.append(time.perf_counter() - sent_at)
+                        else:
+                            await asyncio.sleep(0.1)
+                    reader.cancel()
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"WS client failed: {e!r}")
+
+        tasks = [asyncio.create_task(client()) for _ in range(options['ws_clients'])]
+        # Let the connections finish their handshakes before the clock starts
+        await asyncio.sleep(min(5.0, 0.01 * options['ws_clients'] + 0.5))
+        deadline = time.perf_counter() + options['duration']
+        started = time.perf_counter()
+        ready.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        result = {
+            'mode': mode,
+            'clients': options['ws_clients'],
+            'connected': len(connect_times),
+            'failed': failed,
+            'frames_sent': sent,
+            'frames_received': received,
+            'frames_rejected': rejected,
+            'frames_per_sec': round((sent + received) / elapsed, 1),
+            'frames_per_sec_per_core': round((sent + received) / elapsed / options['cores'], 1),
+            'connect': latency_summary(connect_times),
+        }
+        if round_trips:
+            result['round_trip'] = latency_summary(round_trips)
+        return result
+
+    def _print_report(self, report):
+        cores = report['cores']
+        if 'http' in report:
+            http = report['http']
+            self.stdout.write(
+                f"HTTP  {http['requests']} requests, {http['errors']} errors, statuses {http['statuses']}\n"
+                f"      {http['requests_per_sec']} req/s = {http['requests_per_sec_per_core']} req/s per core "
+                f"({cores} cores); p50 {http.get('p50_ms')} ms, p95 {http.get('p95_ms')} ms, p99 {http.get('p99_ms')} ms"
+            )
+        if 'ws' in report:
+            ws = report['ws']
+            line = (
+                f"WS    {ws['connected']}/{ws['clients']} connected ({ws['failed']} failed), mode {ws['mode']}, "
+                f"{ws['frames_rejected']} frames rejected\n"
+                f"      {ws['frames_per_sec']} frames/s = {ws['frames_per_sec_per_core']} frames/s per core; "
+                f"connect p95 {ws['connect'].get('p95_ms')} ms"
+            )
+            if 'round_trip' in ws:
+                line += f"; round trip p50 {ws['round_trip']['p50_ms']} ms, p99 {ws['round_trip']['p99_ms']} ms"
+            self.stdout.write(line)
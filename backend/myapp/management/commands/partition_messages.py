@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from myapp.archive import archive_cold_messages
+from myapp.partitions import MESSAGE_TABLES, ensure_partitions, is_partitioned, table_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the coming months' partitions of the message tables (PostgreSQL) and, with "
+        "--archive, move months older than MESSAGE_ARCHIVE_AFTER_MONTHS to segment files. "
+        "The maintain_message_partitions task does both on a schedule."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help='Default: MESSAGE_PARTITION_MONTHS_AHEAD')
+        parser.add_argument('--archive', action='store_true', help='Also archive cold months')
+        parser.add_argument('--keep-months', type=int, help='Default: MESSAGE_ARCHIVE_AFTER_MONTHS')
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions(options['months_ahead']):
+            self.stdout.write(f"created partition {name}")
+        if options['archive']:
+            for segment in archive_cold_messages(keep_months=options['keep_months']):
+                self.stdout.write(
+                    f"archived {segment.message_count} {segment.kind} messages of {segment.month:%Y-%m} "
+                    f"to {segment.path} ({segment.size_bytes} bytes)"
+                )
+
+        for table in MESSAGE_TABLES:
+            if not is_partitioned(table):
+                self.stdout.write(f"{table}: not partitioned")
+                continue
+            for partition in table_partitions(table):
+                start = f'{partition.start:%Y-%m-%d}' if partition.start else 'MINVALUE'
+                end = f'{partition.end:%Y-%m-%d}' if partition.end else 'MAXVALUE'
+                self.stdout.write(f"{table}: {partition.name} [{start}, {end})")
@@ -0,0 +1,95 @@
+"""
+Group and chat room membership.
+
+``GroupMembership`` is the only record of who belongs to a group. Every
+group gets a chat room when it is created (see ``signals``), and that room
+(``ChatRoom.group``) has no member rows of its own: the groups API, the chat
+room list and ``ChatConsumer`` all read ``GroupMembership``. Joining or
+leaving a group is a single write, and the two can't drift apart. Rooms
+without a group, created through the chat API, keep their members in
+``ChatRoom.members``.
+"""
+import logging
+
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import ChatRoom, CustomUser, GroupChat, GroupMembership
+
+logger = logging.getLogger(__name__)
+
+
+def join_group(group, user, role='member'):
+    """Add ``user`` to ``group`` (and so to its chat room); returns False if already a member"""
+    _, created = GroupMembership.objects.get_or_create(group=group, user=user, defaults={'role': role})
+    return created
+
+
+def leave_group(group, user):
+    deleted, _ = GroupMembership.objects.filter(group=group, user=user).delete()
+    return bool(deleted)
+
+
+def rooms_for_user(user):
+    """Chat rooms ``user`` may read and post in"""
+    in_group = GroupMembership.objects.filter(group_id=OuterRef('group_id'), user=user)
+    direct = ChatRoom.members.through.objects.filter(chatroom_id=OuterRef('pk'), customuser=user)
+    return ChatRoom.objects.filter(
+        Q(Exists(in_group), group__isnull=False) | Q(Exists(direct), group__isnull=True)
+    )
+
+
+def is_room_member(room, user):
+    if room.group_id:
+        return GroupMembership.objects.filter(group_id=room.group_id, user=user).exists()
+    return room.members.filter(pk=user.pk).exists()
+
+
+def room_members(room):
+    if room.group_id:
+        return CustomUser.objects.filter(groupmembership__group_id=room.group_id)
+    return room.members.all()
+
+
+def dynamic_group_name(role, city, institution=None):
+    if role == "student" and institution and city:
+        return f"Students in {city} at {institution}"
+    elif role == "tutor" and city:
+        return f"Tutors in {city}"
+    elif role == "service provider" and city:
+        return f"Service Providers in {city}"
+    elif role == "jobseeker" and city:
+        return f"Jobseekers in {city}"
+    elif role == "hs student" and city:
+        return f"High School Students in {city}"
+    return f"{role.title()}s in {city}"
+
+
+def assign_user_to_dynamic_group(user, role, city, institution=None, qualification=None):
+    """
+    Create and assign user to dynamic groups based on their role and location.
+    Returns the group, or None if it could not be created; registration
+    carries on without it.
+    """
+    group_name = dynamic_group_name(role, city, institution)
+    try:
+        # Savepoint, so a failure here leaves the caller's transaction usable
+        with transaction.atomic():
+            # Django auth group (for permissions)
+            auth_group, _ = Group.objects.get_or_create(name=group_name)
+            user.groups.add(auth_group)
+
+            group_chat, _ = GroupChat.objects.get_or_create(
+                name=group_name,
+                city=city,
+                institution=institution if role == "student" else "",
+                defaults={'is_dynamic': True},
+            )
+            join_group(group_chat, user)
+    except Exception:
+        logger.exception("Could not add user %s to dynamic group %r", user.username, group_name)
+        return None
+
+    logger.info("Added user %s to dynamic group %r", user.username, group_name)
+    return group_chat
@@ -0,0 +1,341 @@
+"""
+Per-request database and latency instrumentation.
+
+``MetricsMiddleware`` (HTTP) and ``MetricsConsumerMixin`` (WebSocket) sample a
+fraction of requests (``METRICS_SAMPLE_RATE``). For a sampled request they
+record wall time, the number of SQL queries, the total SQL time and queries
+repeated with the same shape. A repeated shape is the usual N+1 signature.
+Results are exported in the Prometheus text format by ``metrics_view``.
+
+Queries are seen through a database execute wrapper, installed on every
+connection when it is created. The wrapper reads a context variable and
+returns straight to the driver when no recorder is active. An unsampled
+request therefore costs one random() call and one context variable lookup
+per query.
+
+Metrics live in process memory. Each gunicorn worker reports its own
+numbers, so totals are per worker and counts are of sampled requests only.
+"""
+import bisect
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter as _TallyCounter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (last slot is +Inf), then the sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {total}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'ispani_request_duration_seconds', 'Wall time of sampled HTTP requests', ['view', 'method'],
+)
+REQUESTS = Counter(
+    'ispani_requests_total', 'Sampled HTTP requests', ['view', 'method', 'status'],
+)
+CONSUMER_DURATION = Histogram(
+    'ispani_consumer_event_duration_seconds', 'Wall time of sampled WebSocket consumer events', ['view', 'event'],
+)
+QUERIES = Histogram(
+    'ispani_db_queries', 'SQL queries per sampled request or consumer event', ['view'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    'ispani_db_query_duration_seconds', 'Total SQL time per sampled request or consumer event', ['view'],
+)
+DUPLICATE_QUERIES = Counter(
+    'ispani_db_duplicate_queries_total',
+    'Queries repeating an earlier query shape within the same request or event', ['view'],
+)
+REPEATED_FINGERPRINTS = Counter(
+    'ispani_db_repeated_fingerprint_total',
+    'Requests or events that ran one query shape at least METRICS_DUPLICATE_THRESHOLD times; '
+    'the SQL of each fingerprint is logged by myapp.metrics',
+    ['view', 'fingerprint'],
+)
+
+REGISTRY = [
+    REQUESTS, REQUEST_DURATION, CONSUMER_DURATION, QUERIES, QUERY_DURATION,
+    DUPLICATE_QUERIES, REPEATED_FINGERPRINTS,
+]
+
+
+# Query recording -------------------------------------------------------------
+
+_recorder = ContextVar('query_recorder', default=None)
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fingerprint(sql):
+    """Reduce SQL to its shape: literals and IN-list lengths removed"""
+    return _LITERAL.sub('?', _IN_LIST.sub('(...)', sql))
+
+
+class QueryRecorder:
+    __slots__ = ('count', 'duration', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = _TallyCounter()
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[fingerprint(sql)] += 1
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Fires on every (re)connect of the same wrapper, so guard against stacking
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _should_sample():
+    rate = settings.METRICS_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def _report_queries(view, recorder):
+    QUERIES.observe(recorder.count, view=view)
+    QUERY_DURATION.observe(recorder.duration, view=view)
+    duplicates = recorder.count - len(recorder.shapes)
+    if not duplicates:
+        return
+    DUPLICATE_QUERIES.inc(duplicates, view=view)
+    threshold = settings.METRICS_DUPLICATE_THRESHOLD
+    for shape, count in recorder.shapes.items():
+        if count >= threshold:
+            digest = hashlib.sha1(shape.encode()).hexdigest()[:10]
+            REPEATED_FINGERPRINTS.inc(view=view, fingerprint=digest)
+            logger.warning("%s ran one query %s times (fingerprint %s): %.300s", view, count, digest, shape)
+
+
+# HTTP ------------------------------------------------------------------------
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """
+    Samples requests for the metrics above. Place it first in MIDDLEWARE so
+    the wall time and query counts cover the other middleware as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _should_sample():
+            return self.get_response(request)
+        recorder, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._finish(request, response, recorder, started)
+        return response
+
+    async def __acall__(self, request):
+        if not _should_sample():
+            return await self.get_response(request)
+        recorder, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._finish(request, response, recorder, started)
+        return response
+
+    def _start(self):
+        recorder = QueryRecorder()
+        return recorder, _recorder.set(recorder), time.perf_counter()
+
+    def _finish(self, request, response, recorder, started):
+        view = _view_label(request)
+        REQUEST_DURATION.observe(time.perf_counter() - started, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        _report_queries(view, recorder)
+
+
+# WebSocket -------------------------------------------------------------------
+
+class MetricsConsumerMixin:
+    """
+    Samples consumer events (connect, receive, group messages, disconnect).
+    Put it before the consumer base class:
+
+        class ChatConsumer(MetricsConsumerMixin, AsyncWebsocketConsumer): ...
+
+    database_sync_to_async copies the context, so queries run in its thread
+    are recorded against the event that awaited them.
+    """
+
+    async def dispatch(self, message):
+        if not _should_sample():
+            return await super().dispatch(message)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            return await super().dispatch(message)
+        finally:
+            _recorder.reset(token)
+            view = type(self).__name__
+            CONSUMER_DURATION.observe(time.perf_counter() - started, view=view, event=message.get('type', ''))
+            _report_queries(view, recorder)
+
+
+# Export ----------------------------------------------------------------------
+
+def _connection_lines():
+    from .db import connection_stats
+
+    try:
+        stats = connection_stats()
+    except Exception as e:
+        logger.warning("Could not read database connection stats: %s", e)
+        return []
+
+    lines = []
+    for name, value in sorted((stats.get('pool') or {}).items()):
+        metric = f'ispani_db_pool_{name}'
+        lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+    server = stats.get('server')
+    if server is not None:
+        lines += [
+            '# HELP ispani_db_server_connections Connections of this application seen by PostgreSQL',
+            '# TYPE ispani_db_server_connections gauge',
+        ]
+        lines += [f'ispani_db_server_connections{{state="{state}"}} {count}' for state, count in sorted(server.items())]
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(_connection_lines())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; only answers clients in METRICS_ALLOWED_IPS"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
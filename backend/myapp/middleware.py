@@ -0,0 +1,28 @@
+from django.contrib.sessions.middleware import SessionMiddleware
+
+
+def has_bearer_token(request):
+    return request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer ')
+
+
+class TokenAwareSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that leaves JWT requests alone.
+
+    API calls authenticate with a bearer token, so they get an empty session
+    that is never loaded from or saved to the session store, and no session
+    cookie is set. Browser flows (admin, allauth) keep normal sessions.
+    """
+
+    def process_request(self, request):
+        if has_bearer_token(request):
+            # A store without a key never touches the backend until saved
+            request.session = self.SessionStore()
+            request._skip_session_save = True
+            return
+        super().process_request(request)
+
+    def process_response(self, request, response):
+        if getattr(request, '_skip_session_save', False):
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:27
+
+from django.db import migrations
+
+from myapp.db import postgres_only
+
+
+# A generated tsrange column holds each booking's [start, end) slot; the GiST
+# exclusion constraint then rejects overlapping active bookings of one tutor,
+# including concurrent inserts. Bookings whose end is not after their start get
+# an empty range and never conflict.
+#
+# unique_together only kept identical start times apart, so existing active
+# bookings may overlap, and the constraint could not be added. Those are
+# resolved first: going through each tutor's bookings, confirmed before
+# pending and then oldest first, a booking that overlaps one already kept is
+# cancelled, with a note saying which booking it clashed with. Every
+# cancellation is also raised as a WARNING in the migration output.
+BOOKING_SLOT_SQL = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE myapp_booking
+    ADD COLUMN slot tsrange GENERATED ALWAYS AS (
+        tsrange(date + start_time, date + greatest(end_time, start_time), '[)')
+    ) STORED;
+DO $$
+DECLARE
+    b record;
+    tutor bigint;
+    kept uuid[];
+    clash uuid;
+BEGIN
+    FOR b IN SELECT id, tutor_id, slot FROM myapp_booking
+             WHERE status IN ('pending', 'confirmed')
+             ORDER BY tutor_id, status = 'confirmed' DESC, created_at, id LOOP
+        IF tutor IS DISTINCT FROM b.tutor_id THEN
+            tutor := b.tutor_id;
+            kept := ARRAY[]::uuid[];
+        END IF;
+        SELECT id INTO clash FROM myapp_booking WHERE id = ANY(kept) AND slot && b.slot LIMIT 1;
+        IF clash IS NULL THEN
+            kept := kept || b.id;
+        ELSE
+            UPDATE myapp_booking
+                SET status = 'cancelled', updated_at = now(),
+                    notes = concat_ws(E'\\n', nullif(notes, ''), format('Cancelled: overlapped booking %s', clash))
+                WHERE id = b.id;
+            RAISE WARNING 'Cancelled booking % of tutor %: it overlapped booking %', b.id, b.tutor_id, clash;
+        END IF;
+    END LOOP;
+END $$;
+ALTER TABLE myapp_booking
+    ADD CONSTRAINT booking_tutor_no_overlap
+    EXCLUDE USING gist (tutor_id WITH =, slot WITH &&)
+    WHERE (status IN ('pending', 'confirmed'));
+"""
+
+DROP_BOOKING_SLOT_SQL = """
+ALTER TABLE myapp_booking DROP CONSTRAINT IF EXISTS booking_tutor_no_overlap;
+ALTER TABLE myapp_booking DROP COLUMN IF EXISTS slot;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_customuser_hobbies'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='booking',
+            unique_together=set(),
+        ),
+        postgres_only(BOOKING_SLOT_SQL, DROP_BOOKING_SLOT_SQL),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:28
+
+from django.db import migrations, models
+
+from myapp.db import postgres_only
+
+
+# Django compiles name__icontains to UPPER(name) LIKE UPPER(%s) on PostgreSQL,
+# so the trigram index is built over the same expression.
+SUBJECT_NAME_TRGM_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS subject_name_trgm_idx
+    ON myapp_subject USING gin (UPPER(name) gin_trgm_ops);
+"""
+
+DROP_SUBJECT_NAME_TRGM_SQL = "DROP INDEX IF EXISTS subject_name_trgm_idx;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_booking_overlap_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tutorprofile',
+            index=models.Index(fields=['is_available_online', 'city'], name='tutor_online_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tutorprofile',
+            index=models.Index(fields=['is_available_physical', 'city'], name='tutor_physical_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tutorprofile',
+            index=models.Index(fields=['hourly_rate'], name='tutor_hourly_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tutorprofile',
+            index=models.Index(fields=['-rating'], name='tutor_rating_idx'),
+        ),
+        postgres_only(SUBJECT_NAME_TRGM_SQL, DROP_SUBJECT_NAME_TRGM_SQL),
+    ]
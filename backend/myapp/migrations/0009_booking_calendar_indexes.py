@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_tutor_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['tutor', 'date'], name='booking_tutor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['student', 'date'], name='booking_student_date_idx'),
+        ),
+    ]
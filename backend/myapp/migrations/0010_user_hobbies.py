@@ -0,0 +1,108 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:33
+
+import ast
+import json
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copies of myapp.hobbies as of this migration, so later changes to
+# that module or to the models can't change what it does.
+HOBBY_SOURCES = (
+    'hobbies',
+    'student_profile__hobbies',
+    'hstudent_profile__hobbies',
+    'serviceprovider_profile__hobbies',
+    'jobseeker_profile__hobbies',
+)
+
+
+def parse_hobbies(value, max_length):
+    """Parse stored hobby text (or a list) into unique names, keeping first spelling and order"""
+    if not value:
+        return []
+
+    if isinstance(value, str):
+        text = value.strip()
+        items = None
+        if text.startswith('['):
+            for loader in (json.loads, ast.literal_eval):
+                try:
+                    items = loader(text)
+                    break
+                except (ValueError, SyntaxError):
+                    continue
+        if not isinstance(items, (list, tuple)):
+            items = text.split(',')
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = [value]
+
+    names = {}
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get('name', '')
+        name = ' '.join(str(item).strip().strip('\'"[]').split())[:max_length]
+        if name:
+            names.setdefault(name.lower(), name)
+    return list(names.values())
+
+
+def backfill_user_hobbies(apps, schema_editor):
+    CustomUser = apps.get_model('myapp', 'CustomUser')
+    Hobby = apps.get_model('myapp', 'Hobby')
+    UserHobby = apps.get_model('myapp', 'UserHobby')
+    max_length = Hobby._meta.get_field('name').max_length
+
+    hobby_ids = {name.lower(): pk for pk, name in Hobby.objects.values_list('pk', 'name')}
+    links = []
+    for row in CustomUser.objects.values_list('pk', *HOBBY_SOURCES).iterator(chunk_size=2000):
+        user_id, sources = row[0], row[1:]
+        seen = set()
+        for value in sources:
+            for name in parse_hobbies(value, max_length):
+                key = name.lower()
+                if key not in hobby_ids:
+                    hobby_ids[key] = Hobby.objects.create(name=name).pk
+                if key not in seen:
+                    seen.add(key)
+                    links.append(UserHobby(user_id=user_id, hobby_id=hobby_ids[key]))
+        if len(links) >= 2000:
+            UserHobby.objects.bulk_create(links, ignore_conflicts=True)
+            links = []
+    UserHobby.objects.bulk_create(links, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_booking_calendar_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHobby',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hobby', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.hobby')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='hobby',
+            name='users',
+            field=models.ManyToManyField(blank=True, related_name='interests', through='myapp.UserHobby', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='userhobby',
+            index=models.Index(fields=['hobby', 'user'], name='userhobby_hobby_user_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='userhobby',
+            unique_together={('user', 'hobby')},
+        ),
+        migrations.RunPython(backfill_user_hobbies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_group_rooms(apps, schema_editor):
+    ChatRoom = apps.get_model('myapp', 'ChatRoom')
+    GroupChat = apps.get_model('myapp', 'GroupChat')
+    GroupMembership = apps.get_model('myapp', 'GroupMembership')
+    RoomMember = ChatRoom.members.through
+
+    # Group rooms were created with the group's id and name. An id match alone
+    # could be an unrelated room, so a room is only linked if it also has the
+    # group's name, or if all of its members are members of the group.
+    groups = dict(GroupChat.objects.values_list('id', 'name'))
+    linked, unmatched = [], []
+    for room_id, name in ChatRoom.objects.filter(id__in=list(groups)).values_list('id', 'name'):
+        if name == groups[room_id]:
+            linked.append(room_id)
+            continue
+        outsiders = RoomMember.objects.filter(chatroom_id=room_id).exclude(
+            customuser_id__in=GroupMembership.objects.filter(group_id=room_id).values('user_id'),
+        )
+        (unmatched if outsiders.exists() else linked).append(room_id)
+    for start in range(0, len(linked), 2000):
+        chunk = linked[start:start + 2000]
+        ChatRoom.objects.filter(id__in=chunk).update(group_id=models.F('id'))
+    if unmatched:
+        # Left as they are, members included; their groups get new rooms below
+        print(f"\n  Not linked to the group with the same id (name and members differ): rooms {unmatched}")
+
+    ChatRoom.objects.bulk_create([
+        ChatRoom(name=name, group_id=group_id)
+        for group_id, name in GroupChat.objects.filter(chat_room__isnull=True).values_list('id', 'name')
+    ])
+    # Their members now come from GroupMembership
+    RoomMember.objects.filter(chatroom__group__isnull=False).delete()
+
+
+def unlink_group_rooms(apps, schema_editor):
+    ChatRoom = apps.get_model('myapp', 'ChatRoom')
+    GroupMembership = apps.get_model('myapp', 'GroupMembership')
+    RoomMember = ChatRoom.members.through
+
+    rooms = dict(ChatRoom.objects.filter(group__isnull=False).values_list('group_id', 'id'))
+    rows = []
+    for group_id, user_id in GroupMembership.objects.filter(group_id__in=list(rooms)).values_list('group_id', 'user_id').iterator(chunk_size=2000):
+        rows.append(RoomMember(chatroom_id=rooms[group_id], customuser_id=user_id))
+        if len(rows) >= 2000:
+            RoomMember.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    RoomMember.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='group',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_room', to='myapp.groupchat'),
+        ),
+        migrations.RunPython(link_group_rooms, unlink_group_rooms),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from myapp.db import postgres_only
+
+
+# Generated columns are filled by PostgreSQL on every insert and update; the
+# configuration must match myapp.search.SEARCH_CONFIG. Adding a stored
+# column rewrites each table once.
+MESSAGE_SEARCH_SQL = """
+ALTER TABLE myapp_chatmessage ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english'::regconfig, coalesce(text, ''))) STORED;
+CREATE INDEX IF NOT EXISTS chatmessage_search_idx ON myapp_chatmessage USING gin (search_vector);
+ALTER TABLE myapp_privatemessage ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english'::regconfig, coalesce(content, ''))) STORED;
+CREATE INDEX IF NOT EXISTS privatemessage_search_idx ON myapp_privatemessage USING gin (search_vector);
+"""
+
+DROP_MESSAGE_SEARCH_SQL = """
+ALTER TABLE myapp_chatmessage DROP COLUMN IF EXISTS search_vector;
+ALTER TABLE myapp_privatemessage DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_message_resume_indexes'),
+    ]
+
+    operations = [
+        postgres_only(MESSAGE_SEARCH_SQL, DROP_MESSAGE_SEARCH_SQL),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 5.2.1 on 2026-10-19 07:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TABLES = ('myapp_chatmessage', 'myapp_privatemessage')
+
+
+# Turns a message table into one partitioned by month of created_at (see
+# myapp.partitions). The existing table becomes the <table>_legacy partition,
+# holding everything up to the end of the current month; later months get
+# their own partitions. The primary key must include the partition column,
+# so it becomes (id, created_at); ids still come from one sequence, which
+# continues where the old one stopped. Foreign keys into the table are
+# dropped, since nothing can reference it by id alone. Running it again is a
+# no-op, and it is not undone on the way back: the partitioned table has the
+# same columns.
+#
+# Attaching a table as a partition scans it to check the bound, unless a
+# validated CHECK constraint already proves it. BOUND_SQL adds that
+# constraint NOT VALID and validates it in separate transactions first;
+# validation only takes a SHARE UPDATE EXCLUSIVE lock, so reads and writes
+# go on while the existing rows are scanned. Until the attach, rows dated
+# after this month would fail the constraint, so don't run it on the last
+# day of a month. The migration is not atomic: each statement commits on its
+# own.
+BOUND_SQL = (
+    'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_legacy_bound',
+    "ALTER TABLE {table} ADD CONSTRAINT {table}_legacy_bound CHECK (created_at < '{bound}') NOT VALID",
+    'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_legacy_bound',
+)
+
+PARTITION_SQL = """
+DO $$
+DECLARE
+    c record;
+    def text;
+    index_defs text[];
+    fk_defs text[];
+    next_id bigint;
+    bound timestamptz := '{bound}';
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = '{table}'::regclass) THEN
+        RETURN;
+    END IF;
+
+    SELECT coalesce(array_agg(pg_get_indexdef(indexrelid)), ARRAY[]::text[]) INTO index_defs
+        FROM pg_index WHERE indrelid = '{table}'::regclass AND NOT indisunique;
+    SELECT coalesce(array_agg(format('ALTER TABLE {table} ADD CONSTRAINT %I %s', conname, pg_get_constraintdef(oid))),
+                    ARRAY[]::text[]) INTO fk_defs
+        FROM pg_constraint WHERE conrelid = '{table}'::regclass AND contype = 'f';
+    FOR c IN SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+             WHERE contype = 'f' AND '{table}'::regclass IN (conrelid, confrelid) LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', c.tbl, c.conname);
+    END LOOP;
+    -- Free the index names (and the primary key's) for the parent
+    FOR c IN SELECT ic.relname FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid
+             WHERE i.indrelid = '{table}'::regclass LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', c.relname, left(c.relname, 55) || '_legacy');
+    END LOOP;
+
+    next_id := coalesce(nextval(pg_get_serial_sequence('{table}', 'id')), (SELECT max(id) + 1 FROM {table}), 1);
+    ALTER TABLE {table} ALTER COLUMN id DROP IDENTITY IF EXISTS;
+    ALTER TABLE {table} ALTER COLUMN id DROP DEFAULT;
+    DROP SEQUENCE IF EXISTS {table}_id_seq;
+    ALTER TABLE {table} RENAME TO {table}_legacy;
+
+    CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS INCLUDING GENERATED)
+        PARTITION BY RANGE (created_at);
+    CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id;
+    PERFORM setval('{table}_id_seq', next_id, false);
+    ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq');
+    ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at);
+    FOREACH def IN ARRAY index_defs LOOP
+        EXECUTE def;
+    END LOOP;
+    FOREACH def IN ARRAY fk_defs LOOP
+        EXECUTE def;
+    END LOOP;
+
+    -- No scan: the validated {table}_legacy_bound constraint implies the bound
+    EXECUTE format('ALTER TABLE {table} ATTACH PARTITION {table}_legacy FOR VALUES FROM (MINVALUE) TO (%L)', bound);
+    ALTER TABLE {table}_legacy DROP CONSTRAINT {table}_legacy_bound;
+    CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+END $$;
+"""
+
+
+def partition_message_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        # The end of this month, once, so the constraint and the partition agree
+        cursor.execute("SELECT date_trunc('month', now(), 'UTC') + interval '1 month'")
+        bound = cursor.fetchone()[0].isoformat()
+    for table in TABLES:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+            if cursor.fetchone():
+                continue
+        for sql in BOUND_SQL:
+            schema_editor.execute(sql.format(table=table, bound=bound), params=None)
+        schema_editor.execute(PARTITION_SQL.format(table=table, bound=bound), params=None)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('myapp', '0014_message_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messageattachment',
+            name='message',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='myapp.chatmessage'),
+        ),
+        migrations.CreateModel(
+            name='MessageArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('room', 'Room messages'), ('private', 'Private messages')], max_length=10)),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=255)),
+                ('message_count', models.PositiveIntegerField()),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('size_bytes', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'month'), name='archive_segment_kind_month_uniq')],
+            },
+        ),
+        migrations.RunPython(partition_message_tables, migrations.RunPython.noop),
+    ]
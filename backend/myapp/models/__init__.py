@@ -1,7 +1,8 @@
 # models/__init__.py
 from .authentication import *
-from .groups import GroupChat, GroupMembership, Hobby
+from .groups import GroupChat, GroupMembership, Hobby, UserHobby
 from .messaging import *
 from .events import *
+from .mail import OutboundEmail
 
 
@@ -25,24 +25,31 @@ class CustomUser(AbstractUser):
         verbose_name_plural = 'Users'
     
     def has_student_profile(self):
-        return hasattr(self, 'student_profile')
+        return self.get_role_profile('student') is not None
     
     def has_tutor_profile(self):
-        return hasattr(self, 'tutor_profile')
+        return self.get_role_profile('tutor') is not None
     
     def has_jobseeker_profile(self):
-        return hasattr(self, 'jobseeker_profile')
+        return self.get_role_profile('jobseeker') is not None
     
     def has_hstudent_profile(self):
-        return hasattr(self, 'hstudent_profile')
+        return self.get_role_profile('hs student') is not None
+    
+    def get_role_profile(self, role):
+        """Return this user's profile for ``role``, loading all profiles in one query"""
+        from ..profiles import get_profile
+        return get_profile(self, role)
     
     def get_display_name(self):
         """Get the display name for the user based on their active role"""
-        if self.active_role == 'student' and self.has_student_profile():
+        from ..profiles import normalize_role
+        role = normalize_role(self.active_role)
+        if role == 'student' and self.has_student_profile():
             return f"Student: {self.username}"
-        elif self.active_role == 'tutor' and self.has_tutor_profile():
+        elif role == 'tutor' and self.has_tutor_profile():
             return f"Tutor: {self.username}"
-        elif self.active_role == 'hstudent' and self.has_hstudent_profile():
+        elif role == 'hs student' and self.has_hstudent_profile():
             return f"High School Student: {self.username}"
         return self.username
     
@@ -117,6 +124,15 @@ class TutorProfile(models.Model):
     
     # Fixed: Use string reference to Subject model
     subjects = models.ManyToManyField('Subject', blank=True, related_name='tutors')
+
+    class Meta:
+        indexes = [
+            # Tutor browse filters: booking type + city, plus price and rating ordering
+            models.Index(fields=['is_available_online', 'city'], name='tutor_online_city_idx'),
+            models.Index(fields=['is_available_physical', 'city'], name='tutor_physical_city_idx'),
+            models.Index(fields=['hourly_rate'], name='tutor_hourly_rate_idx'),
+            models.Index(fields=['-rating'], name='tutor_rating_idx'),
+        ]
     
     def __str__(self):
         return f"Tutor Profile: {self.user.username}"
@@ -45,10 +45,23 @@ class GroupMembership(models.Model):
 
 class Hobby(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    users = models.ManyToManyField(CustomUser, through='UserHobby', related_name='interests', blank=True)
 
     def __str__(self):
         return self.name
 
+class UserHobby(models.Model):
+    """A user's hobby, kept in sync with the free-text hobby fields by myapp.hobbies"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    hobby = models.ForeignKey(Hobby, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('user', 'hobby')
+        indexes = [
+            # Hobby -> users lookups; (user, hobby) is covered by the unique index
+            models.Index(fields=['hobby', 'user'], name='userhobby_hobby_user_idx'),
+        ]
+
 class GroupMessage(models.Model):
     chat = models.ForeignKey(GroupChat, on_delete=models.CASCADE)
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -6,12 +6,24 @@ from .authentication import CustomUser
 class ChatRoom(models.Model):
     name = models.CharField(max_length=255)
     chat_type = models.CharField(max_length=20, default='group')
+    # A group's room takes its members from GroupMembership (see myapp.membership);
+    # the members table is only used by rooms without a group
+    group = models.OneToOneField(
+        'GroupChat', on_delete=models.CASCADE, null=True, blank=True, related_name='chat_room',
+    )
     members = models.ManyToManyField(CustomUser, related_name='chat_rooms')
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
 
+    @property
+    def member_list(self):
+        """Members of the room, whichever table holds them; uses prefetched rows when present"""
+        if self.group_id:
+            return self.group.members.all()
+        return self.members.all()
+
 class ChatMessage(models.Model):
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -20,12 +32,18 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Reconnecting sockets replay a room from the last id they saw
+            models.Index(fields=['room', 'id'], name='chatmessage_room_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender.username}: {self.text[:50]}'
 
 class MessageAttachment(models.Model):
-    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='attachments')
+    # No database constraint: the partitioned message table can't be referenced
+    # by id alone, and attachments outlive archived messages (see myapp.archive)
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='attachments', db_constraint=False)
     file = models.FileField(upload_to='message_attachments/')
     attachment_type = models.CharField(max_length=50)
     thumbnail = models.ImageField(upload_to='message_thumbnails/', null=True, blank=True)
@@ -40,4 +58,33 @@ class PrivateMessage(models.Model):
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     content = models.TextField()
     is_read = models.BooleanField(default=False)
-    created_at= models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at= models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Reconnecting sockets replay a chat from the last id they saw
+            models.Index(fields=['chat', 'id'], name='privatemessage_chat_id_idx'),
+        ]
+class MessageArchiveSegment(models.Model):
+    """One month of room or private messages moved to a segment file by myapp.archive"""
+    KIND_CHOICES = (
+        ('room', 'Room messages'),
+        ('private', 'Private messages'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    month = models.DateField()  # First day of the month, UTC
+    path = models.CharField(max_length=255)  # Relative to MESSAGE_ARCHIVE_ROOT
+    message_count = models.PositiveIntegerField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    size_bytes = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'month'], name='archive_segment_kind_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} messages {self.month:%Y-%m} ({self.message_count})'
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction, connections, router, IntegrityError
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -6,7 +6,32 @@ from datetime import time
 from decimal import Decimal
 import uuid
 from .authentication import CustomUser, StudentProfile, Subject, TutorProfile
- 
+
+# Bookings in these states hold the tutor's time slot
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed')
+
+# Name of the PostgreSQL exclusion constraint added in migration 0007
+BOOKING_OVERLAP_CONSTRAINT = 'booking_tutor_no_overlap'
+
+
+class BookingConflict(Exception):
+    """Raised when a booking overlaps another active booking of the same tutor"""
+
+
+class BookingQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status__in=ACTIVE_BOOKING_STATUSES)
+
+    def overlapping(self, tutor, date, start_time, end_time):
+        """Active bookings of ``tutor`` on ``date`` whose [start, end) intersects the given one"""
+        return self.active().filter(
+            tutor=tutor,
+            date=date,
+            start_time__lt=end_time,
+            end_time__gt=start_time,
+        )
+
+
 class Booking(models.Model):
     BOOKING_STATUS = (
         ('pending', 'Pending'),
@@ -69,10 +94,15 @@ class Booking(models.Model):
     rescheduled_at = models.DateTimeField(null=True, blank=True)
     reschedule_reason = models.TextField(blank=True)
 
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
-        unique_together = ['tutor', 'date', 'start_time']
+        indexes = [
+            # Calendar feeds read one user's bookings over a date range
+            models.Index(fields=['tutor', 'date'], name='booking_tutor_date_idx'),
+            models.Index(fields=['student', 'date'], name='booking_student_date_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Calculate total cost based on duration and hourly rate
@@ -87,8 +117,27 @@ class Booking(models.Model):
         # Set completed_at when status changes to completed
         if self.status == 'completed' and not self.completed_at:
             self.completed_at = timezone.now()
-            
-        super().save(*args, **kwargs)
+
+        if self.status not in ACTIVE_BOOKING_STATUSES:
+            super().save(*args, **kwargs)
+            return
+
+        # On PostgreSQL the exclusion constraint is authoritative and race-free;
+        # other backends (SQLite in tests) get the same rule checked in-transaction.
+        using = kwargs.get('using') or router.db_for_write(Booking, instance=self)
+        with transaction.atomic(using=using):
+            if connections[using].vendor != 'postgresql':
+                conflicts = Booking.objects.using(using).overlapping(
+                    self.tutor_id, self.date, self.start_time, self.end_time
+                ).exclude(pk=self.pk)
+                if conflicts.exists():
+                    raise BookingConflict("The tutor already has a booking at this time")
+            try:
+                super().save(*args, **kwargs)
+            except IntegrityError as e:
+                if BOOKING_OVERLAP_CONSTRAINT in str(e):
+                    raise BookingConflict("The tutor already has a booking at this time") from e
+                raise
         
     def __str__(self):
         return f"{self.student.username} -> {self.tutor.username} - {self.date} {self.start_time}"
@@ -0,0 +1,120 @@
+"""
+Pagination for every list endpoint.
+
+- ``BoundedLimitOffsetPagination`` is the project default
+  (``REST_FRAMEWORK['DEFAULT_PAGINATION_CLASS']``), for catalogues such as
+  groups, events and users: ``?limit=&offset=`` with a ``count``. ``limit``
+  is capped at ``API_MAX_PAGE_SIZE``.
+- ``NewestFirstCursorPagination`` is for tables that only grow and are read
+  newest first: bookings, reviews, connection requests, event media.
+  ``?cursor=`` pages are keyed on the primary key, which grows with creation
+  time. They need no COUNT(*), and the last page costs as much as the first.
+  ``OldestFirstCursorPagination`` reads the same way in creation order, as
+  comment threads do.
+- ``MessageHistoryPagination`` pages a room's or private chat's history
+  across live rows and archive segments (see ``myapp.archive``).
+
+``paginate`` applies any of these to a plain ``APIView``.
+"""
+from django.conf import settings
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class TutorSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class BoundedLimitOffsetPagination(LimitOffsetPagination):
+    max_limit = settings.API_MAX_PAGE_SIZE
+
+
+class NewestFirstCursorPagination(CursorPagination):
+    ordering = '-pk'
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class OldestFirstCursorPagination(NewestFirstCursorPagination):
+    ordering = 'pk'
+
+
+def paginate(request, items, serialize, pagination_class=BoundedLimitOffsetPagination, view=None):
+    """
+    Paginated response for an ``APIView``: one page of ``items`` (a queryset,
+    or a list for limit/offset), serialized by ``serialize(page)``.
+    """
+    paginator = pagination_class()
+    page = paginator.paginate_queryset(items, request, view=view)
+    return paginator.get_paginated_response(serialize(page))
+
+
+def _id_param(request, name):
+    value = request.query_params.get(name)
+    return int(value) if value and value.isdigit() else None
+
+
+class MessageHistoryPagination(BasePagination):
+    """
+    Keyset pages of one room's or chat's messages, oldest first within a
+    page. With no parameters a page holds the newest messages. ``next``
+    carries ``?before=<id>`` to page further back. ``?after=<id>`` pages
+    forward from a message instead, which is how a resumed socket fills a
+    gap. Archived messages are older than live ones, so each page reads the
+    live table first and the archive only after the live rows run out.
+    """
+    page_size_query_param = 'page_size'
+
+    def paginate(self, request, messages, archive_kind, archive_key):
+        from .archive import archived_messages
+
+        self.request = request
+        size = self.get_page_size(request)
+        self.before, self.after = _id_param(request, 'before'), _id_param(request, 'after')
+
+        def archived(**kwargs):
+            if archive_key is None:
+                return []
+            return archived_messages(archive_kind, archive_key, **kwargs)
+
+        if self.after is not None:
+            page = archived(after_id=self.after, limit=size + 1)
+            if len(page) <= size:
+                page += messages.filter(id__gt=self.after).order_by('id')[:size + 1 - len(page)]
+        else:
+            live = messages.filter(id__lt=self.before) if self.before is not None else messages
+            page = list(live.order_by('-id')[:size + 1])
+            if len(page) <= size:
+                page += archived(before_id=self.before, limit=size + 1 - len(page), newest_first=True)
+            page.reverse()
+
+        self.has_more = len(page) > size
+        if self.has_more:
+            page = page[:size] if self.after is not None else page[1:]
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        size = _id_param(request, self.page_size_query_param)
+        return min(size or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.after is not None:
+            return replace_query_param(url, 'after', self.page[-1].id)
+        return replace_query_param(remove_query_param(url, 'after'), 'before', self.page[0].id)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {'next': {'type': 'string', 'nullable': True, 'format': 'uri'}, 'results': schema},
+        }
@@ -0,0 +1,133 @@
+"""
+Monthly range partitions of the message tables on PostgreSQL.
+
+Migration 0015 turns ``myapp_chatmessage`` and ``myapp_privatemessage`` into
+tables partitioned by ``created_at``. Rows that existed at the time stay in
+one ``<table>_legacy`` partition covering everything up to the end of that
+month, and a ``<table>_default`` partition catches rows no other partition
+covers. ``ensure_partitions`` creates one ``<table>_pYYYYMM`` partition per
+month ahead of time, so the default partition stays empty. It runs from the
+``maintain_message_partitions`` task and the ``partition_messages`` command.
+
+Each partition has its own, smaller indexes, so inserts only touch the
+current month's indexes. History and resume reads go by id, not
+``created_at``, so they look up each month's (room or chat, id) index rather
+than skipping months; archival's month ranges do skip them.
+``myapp.archive`` drops whole partitions once their month is archived.
+
+Other databases have no partitions. There every function here is a no-op,
+and archival deletes rows instead.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+
+from .models import ChatMessage, PrivateMessage
+
+MESSAGE_TABLES = tuple(model._meta.db_table for model in (ChatMessage, PrivateMessage))
+
+# start is None for a partition open towards MINVALUE, end for MAXVALUE
+Partition = namedtuple('Partition', 'name start end')
+
+BOUND = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def is_partitioned(table):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def table_partitions(table):
+    """Range partitions of ``table``, oldest first; the default partition is left out"""
+    if not is_partitioned(table):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [table],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = BOUND.match(bound)
+        if match:
+            partitions.append(Partition(name, _bound_value(match[1]), _bound_value(match[2])))
+    return sorted(partitions, key=lambda p: (p.start is not None, p.start))
+
+
+def _bound_value(value):
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    # '2026-11-01 00:00:00+00', rendered in the session time zone (UTC)
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def ensure_partitions(months_ahead=None, now=None):
+    """
+    Create the monthly partitions from this month to ``months_ahead`` months
+    ahead (default ``MESSAGE_PARTITION_MONTHS_AHEAD``) that no existing
+    partition covers. Returns the names of the partitions created.
+    """
+    months_ahead = settings.MESSAGE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    this_month = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for table in MESSAGE_TABLES:
+        if not is_partitioned(table):
+            continue
+        existing = table_partitions(table)
+        for offset in range(months_ahead + 1):
+            start = add_months(this_month, offset)
+            end = add_months(start, 1)
+            if any(_overlaps(partition, start, end) for partition in existing):
+                continue
+            name = partition_name(table, start)
+            with connection.cursor() as cursor:
+                # Fails if the default partition already holds rows of this month
+                cursor.execute(
+                    f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+                    [start.isoformat(), end.isoformat()],
+                )
+            existing.append(Partition(name, start, end))
+            created.append(name)
+    return created
+
+
+def _overlaps(partition, start, end):
+    return (partition.start is None or partition.start < end) and (partition.end is None or partition.end > start)
+
+
+def month_partition(table, month):
+    """The partition holding exactly ``month`` of ``table``, or None"""
+    end = add_months(month, 1)
+    for partition in table_partitions(table):
+        if partition.start == month and partition.end == end:
+            return partition.name
+    return None
+
+
+def drop_partition(table, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+        cursor.execute(f'DROP TABLE "{name}"')
@@ -0,0 +1,276 @@
+"""
+Who is online, fed by the WebSocket consumers.
+
+A user is online while any of their sockets has been heard from within
+``PRESENCE_TTL`` seconds. Connects, heartbeats (client pings, throttled to
+one write per ``PRESENCE_HEARTBEAT_INTERVAL`` per socket) and disconnects
+update two kinds of Redis sorted set, scored by last-seen time:
+
+    ispani:presence:users          every online user
+    ispani:presence:room:<id>      users with a socket open on that room
+
+Hashes of open socket counts, per user and per user in each room, keep a
+second tab from being marked offline, or out of the room, when the first one
+closes. Entries older than the TTL are
+ignored on read and trimmed now and then on write, so a crashed worker's
+sockets simply age out.
+
+Costs: a heartbeat is one pipelined round trip of constant size. Looking
+up N users or N rooms is one pipelined round trip of N commands. Nothing
+touches the database. Without Redis (local runs, tests) the same
+structures live in process memory.
+"""
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import _uses_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+USERS_KEY = 'ispani:presence:users'
+CONNECTIONS_KEY = 'ispani:presence:connections'
+ROOM_KEY = 'ispani:presence:room:{}'
+ROOM_CONNECTIONS_KEY = 'ispani:presence:room:{}:connections'
+
+# Fraction of writes that also trim expired entries
+PRUNE_PROBABILITY = 0.01
+
+
+class RedisPresence:
+    def __init__(self, client):
+        self.client = client
+
+    def connect(self, user_id, room_id, now, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(CONNECTIONS_KEY, user_id, 1)
+        if room_id is not None:
+            pipe.hincrby(ROOM_CONNECTIONS_KEY.format(room_id), user_id, 1)
+        self._touch(pipe, user_id, room_id, now, ttl)
+        pipe.execute()
+
+    def heartbeat(self, user_id, room_id, now, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        self._touch(pipe, user_id, room_id, now, ttl)
+        pipe.execute()
+
+    def disconnect(self, user_id, room_id, now, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(CONNECTIONS_KEY, user_id, -1)
+        if room_id is not None:
+            pipe.hincrby(ROOM_CONNECTIONS_KEY.format(room_id), user_id, -1)
+        remaining, *room_remaining = pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        if room_id is not None and room_remaining[0] <= 0:
+            pipe.hdel(ROOM_CONNECTIONS_KEY.format(room_id), user_id)
+            pipe.zrem(ROOM_KEY.format(room_id), user_id)
+        if remaining <= 0:
+            pipe.hdel(CONNECTIONS_KEY, user_id)
+            pipe.zrem(USERS_KEY, user_id)
+        pipe.execute()
+
+    def _touch(self, pipe, user_id, room_id, now, ttl):
+        pipe.zadd(USERS_KEY, {user_id: now})
+        if room_id is not None:
+            room_key = ROOM_KEY.format(room_id)
+            pipe.zadd(room_key, {user_id: now})
+            # A room nobody has touched for a while disappears on its own
+            pipe.expire(room_key, ttl * 2)
+            pipe.expire(ROOM_CONNECTIONS_KEY.format(room_id), ttl * 2)
+        if random.random() < PRUNE_PROBABILITY:
+            pipe.zremrangebyscore(USERS_KEY, '-inf', now - ttl)
+            if room_id is not None:
+                pipe.zremrangebyscore(room_key, '-inf', now - ttl)
+
+    def online(self, user_ids, now, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zscore(USERS_KEY, user_id)
+        cutoff = now - ttl
+        return {
+            user_id for user_id, seen in zip(user_ids, pipe.execute())
+            if seen is not None and seen >= cutoff
+        }
+
+    def room_counts(self, room_ids, now, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        for room_id in room_ids:
+            pipe.zcount(ROOM_KEY.format(room_id), now - ttl, '+inf')
+        return dict(zip(room_ids, pipe.execute()))
+
+
+class LocalPresence:
+    """The same bookkeeping in process memory, for runs without Redis"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._connections = {}
+        self._room_connections = {}
+        self._rooms = {}
+
+    def connect(self, user_id, room_id, now, ttl):
+        with self._lock:
+            self._connections[user_id] = self._connections.get(user_id, 0) + 1
+            if room_id is not None:
+                key = (room_id, user_id)
+                self._room_connections[key] = self._room_connections.get(key, 0) + 1
+            self._touch(user_id, room_id, now)
+
+    def heartbeat(self, user_id, room_id, now, ttl):
+        with self._lock:
+            self._touch(user_id, room_id, now)
+
+    def disconnect(self, user_id, room_id, now, ttl):
+        with self._lock:
+            if room_id is not None:
+                key = (room_id, user_id)
+                room_remaining = self._room_connections.get(key, 0) - 1
+                if room_remaining > 0:
+                    self._room_connections[key] = room_remaining
+                else:
+                    self._room_connections.pop(key, None)
+                    self._rooms.get(room_id, {}).pop(user_id, None)
+            remaining = self._connections.get(user_id, 0) - 1
+            if remaining > 0:
+                self._connections[user_id] = remaining
+            else:
+                self._connections.pop(user_id, None)
+                self._users.pop(user_id, None)
+
+    def _touch(self, user_id, room_id, now):
+        self._users[user_id] = now
+        if room_id is not None:
+            self._rooms.setdefault(room_id, {})[user_id] = now
+
+    def online(self, user_ids, now, ttl):
+        cutoff = now - ttl
+        with self._lock:
+            return {user_id for user_id in user_ids if self._users.get(user_id, cutoff - 1) >= cutoff}
+
+    def room_counts(self, room_ids, now, ttl):
+        cutoff = now - ttl
+        with self._lock:
+            return {
+                room_id: sum(1 for seen in self._rooms.get(room_id, {}).values() if seen >= cutoff)
+                for room_id in room_ids
+            }
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._connections.clear()
+            self._room_connections.clear()
+            self._rooms.clear()
+
+
+local_presence = LocalPresence()
+
+
+def _backend():
+    if _uses_redis():
+        client = get_redis()
+        if client is not None:
+            return RedisPresence(client)
+    return local_presence
+
+
+def _call(method, *args):
+    try:
+        return getattr(_backend(), method)(*args, time.time(), settings.PRESENCE_TTL)
+    except Exception as e:
+        logger.warning("Presence %s failed: %s", method, e)
+        return None
+
+
+def user_connected(user_id, room_id=None):
+    _call('connect', user_id, room_id)
+
+
+def user_heartbeat(user_id, room_id=None):
+    _call('heartbeat', user_id, room_id)
+
+
+def user_disconnected(user_id, room_id=None):
+    _call('disconnect', user_id, room_id)
+
+
+def online_user_ids(user_ids):
+    """The subset of ``user_ids`` that is online; empty if presence is unavailable"""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return set()
+    return _call('online', user_ids) or set()
+
+
+def room_online_counts(room_ids):
+    """{room_id: users online in the room}; zeros if presence is unavailable"""
+    room_ids = list(dict.fromkeys(room_ids))
+    if not room_ids:
+        return {}
+    return _call('room_counts', room_ids) or dict.fromkeys(room_ids, 0)
+
+
+class PresenceConsumerMixin:
+    """
+    Presence bookkeeping for a consumer. Call ``presence_connect`` once the
+    socket is accepted, ``presence_heartbeat`` on client activity and
+    ``presence_disconnect`` from ``disconnect``. A socket that carries
+    several rooms adds and drops them with ``presence_join`` and
+    ``presence_leave``. Redis calls run in a worker thread so they never
+    block the event loop.
+    """
+    presence_user_id = None
+    presence_room_id = None
+    presence_extra_rooms = ()
+    _presence_written_at = 0.0
+
+    async def presence_connect(self, user_id, room_id=None):
+        self.presence_user_id, self.presence_room_id = user_id, room_id
+        self.presence_extra_rooms = set()
+        self._presence_written_at = time.monotonic()
+        await sync_to_async(user_connected, thread_sensitive=False)(user_id, room_id)
+
+    async def presence_join(self, room_id):
+        if self.presence_user_id is None or room_id in self.presence_extra_rooms:
+            return
+        self.presence_extra_rooms.add(room_id)
+        await sync_to_async(user_connected, thread_sensitive=False)(self.presence_user_id, room_id)
+
+    async def presence_leave(self, room_id):
+        if self.presence_user_id is None or room_id not in self.presence_extra_rooms:
+            return
+        self.presence_extra_rooms.discard(room_id)
+        await sync_to_async(user_disconnected, thread_sensitive=False)(self.presence_user_id, room_id)
+
+    async def presence_heartbeat(self):
+        if self.presence_user_id is None:
+            return
+        now = time.monotonic()
+        if now - self._presence_written_at < settings.PRESENCE_HEARTBEAT_INTERVAL:
+            return
+        self._presence_written_at = now
+        await sync_to_async(_heartbeat_rooms, thread_sensitive=False)(
+            self.presence_user_id, [self.presence_room_id, *self.presence_extra_rooms]
+        )
+
+    async def presence_disconnect(self):
+        user_id, self.presence_user_id = self.presence_user_id, None
+        if user_id is not None:
+            await sync_to_async(_disconnect_rooms, thread_sensitive=False)(
+                user_id, [self.presence_room_id, *self.presence_extra_rooms]
+            )
+
+
+def _heartbeat_rooms(user_id, room_ids):
+    for room_id in room_ids:
+        user_heartbeat(user_id, room_id)
+
+
+def _disconnect_rooms(user_id, room_ids):
+    for room_id in room_ids:
+        user_disconnected(user_id, room_id)
@@ -0,0 +1,102 @@
+"""
+Role profile resolution.
+
+A user can hold up to five role profiles, each a reverse one-to-one relation.
+Probing them with ``hasattr`` costs one query per miss, so the helpers here
+load every profile with a single ``select_related`` query and store the
+results in the user's relation cache. After that, attribute access and
+``hasattr`` on the same instance (typically ``request.user``) no longer hit
+the database.
+"""
+from .models import CustomUser
+
+# Role name (as stored in CustomUser.roles) -> reverse one-to-one accessor.
+# The order is the fallback order when a user has no usable active_role.
+ROLE_PROFILES = {
+    'student': 'student_profile',
+    'hs student': 'hstudent_profile',
+    'service provider': 'serviceprovider_profile',
+    'jobseeker': 'jobseeker_profile',
+    'tutor': 'tutor_profile',
+}
+
+# Spellings that older clients send for the same roles
+ROLE_ALIASES = {
+    'hstudent': 'hs student',
+    'hs_student': 'hs student',
+    'service_provider': 'service provider',
+    'serviceprovider': 'service provider',
+}
+
+
+def normalize_role(role):
+    if not role:
+        return None
+    role = str(role).strip().lower()
+    return ROLE_ALIASES.get(role, role)
+
+
+def _relation(accessor):
+    return CustomUser._meta.get_field(accessor)
+
+
+def with_profiles(queryset=None):
+    """Select every role profile alongside the users of ``queryset``"""
+    if queryset is None:
+        queryset = CustomUser.objects.all()
+    return queryset.select_related(*ROLE_PROFILES.values())
+
+
+def load_profiles(user):
+    """Populate the relation cache of ``user`` for every role profile in one query"""
+    if not getattr(user, 'pk', None):
+        return user
+
+    missing = [accessor for accessor in ROLE_PROFILES.values() if not _relation(accessor).is_cached(user)]
+    if not missing:
+        return user
+
+    loaded = CustomUser.objects.select_related(*missing).get(pk=user.pk)
+    for accessor in missing:
+        relation = _relation(accessor)
+        profile = relation.get_cached_value(loaded, default=None)
+        if profile is not None:
+            # Point the profile back at the caller's instance, not the throwaway copy
+            profile._meta.get_field('user').set_cached_value(profile, user)
+        relation.set_cached_value(user, profile)
+    return user
+
+
+def get_role_profiles(user):
+    """Return an ordered ``{role: profile}`` dict of the profiles the user has"""
+    load_profiles(user)
+    profiles = {}
+    for role, accessor in ROLE_PROFILES.items():
+        profile = _relation(accessor).get_cached_value(user, default=None)
+        if profile is not None:
+            profiles[role] = profile
+    return profiles
+
+
+def get_profile(user, role):
+    """Return the user's profile for ``role`` or None"""
+    return get_role_profiles(user).get(normalize_role(role))
+
+
+def has_role(user, role):
+    return get_profile(user, role) is not None
+
+
+def get_active_profile(user):
+    """
+    Return ``(role, profile)`` for the user's active role. If active_role is unset
+    or has no matching profile, fall back to the first profile in ROLE_PROFILES
+    order. Return ``(None, None)`` when the user has no profile at all.
+    """
+    profiles = get_role_profiles(user)
+    active = normalize_role(getattr(user, 'active_role', None))
+    if active in profiles:
+        return active, profiles[active]
+    for role, profile in profiles.items():
+        return role, profile
+    return None, None
@@ -0,0 +1,212 @@
+"""
+Rate limits and size caps for WebSocket frames.
+
+Two token buckets guard every consumer:
+- One per connection, in process memory, charged for every frame. A frame
+  over ``WS_MAX_FRAME_BYTES`` or beyond the bucket is answered with an error
+  frame before it is parsed, so flooding a socket costs a length check and
+  a little arithmetic.
+- One per user, shared by all of the user's sockets in every process through
+  Redis, charged only for frames that write to the database (messages and
+  files). A user can't multiply their allowance by opening more sockets.
+
+Rejections are error frames with a ``code`` (``unsupported_frame``,
+``frame_too_large``, ``message_too_long``, ``rate_limited``) and, for rate limits, the
+``retry_after`` seconds. A connection that keeps going after
+``WS_MAX_VIOLATIONS`` rejections in a row is closed with code 4029.
+
+The shared bucket is one Lua script call per write: atomic, constant size,
+and a single round trip. Without Redis (local runs, tests) it lives in
+process memory. If Redis fails the user limit is skipped and the
+per-connection limit still applies.
+"""
+import json
+import logging
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import _uses_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+USER_KEY = 'ispani:ratelimit:user:{}'
+
+# KEYS[1] bucket; ARGV rate, burst, now, cost. Returns {allowed, tokens left}
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class TokenBucket:
+    """``rate`` tokens a second, holding at most ``burst``. Not thread-safe."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost=1, now=None):
+        """0 if the tokens were taken, else the seconds until they could be"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+    def idle(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class RedisBuckets:
+    def __init__(self, client):
+        self.client = client
+
+    def take(self, key, rate, burst, cost):
+        allowed, tokens = _take_script(self.client)(keys=[key], args=[rate, burst, time.time(), cost])
+        if allowed:
+            return 0
+        return (cost - float(tokens)) / rate
+
+
+class LocalBuckets:
+    """The same buckets in process memory, for runs without Redis"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst, cost):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_entries:
+                    self._prune(now)
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket.take(cost, now)
+
+    def _prune(self, now):
+        # A full bucket is the same as no bucket
+        for key in [key for key, bucket in self._buckets.items() if bucket.idle(now)]:
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+local_buckets = LocalBuckets()
+_scripts = {}
+
+
+def _take_script(client):
+    script = _scripts.get(id(client))
+    if script is None:
+        script = _scripts[id(client)] = client.register_script(TAKE_SCRIPT)
+    return script
+
+
+def _backend():
+    if _uses_redis():
+        client = get_redis()
+        if client is not None:
+            return RedisBuckets(client)
+    return local_buckets
+
+
+def take_user_token(user_id, cost=1):
+    """0 if ``user_id`` may write now, else seconds to wait; 0 if the limiter is unavailable"""
+    try:
+        return _backend().take(
+            USER_KEY.format(user_id), settings.WS_USER_RATE, settings.WS_USER_BURST, cost
+        )
+    except Exception as e:
+        logger.warning("User rate limit check failed: %s", e)
+        return 0
+
+
+class RateLimitConsumerMixin:
+    """
+    Put it before the consumer base class. Every frame passes through
+    ``websocket_receive`` here before ``receive`` sees it. Handlers that
+    write call ``allow_write(text)`` first and stop if it returns False; it
+    has already told the client why.
+    """
+    _frame_bucket = None
+    _violations = 0
+
+    async def websocket_receive(self, message):
+        text_data = message.get('text')
+        if text_data is None:
+            await self.reject('unsupported_frame', "Only text frames are supported")
+            return
+        if _utf8_size_over(text_data, settings.WS_MAX_FRAME_BYTES):
+            await self.reject(
+                'frame_too_large', "Frame is too large", limit=settings.WS_MAX_FRAME_BYTES
+            )
+            return
+        if self._frame_bucket is None:
+            self._frame_bucket = TokenBucket(settings.WS_CONNECTION_RATE, settings.WS_CONNECTION_BURST)
+        retry_after = self._frame_bucket.take()
+        if retry_after:
+            await self.reject('rate_limited', "Too many frames", retry_after=_round_up(retry_after))
+            return
+        self._violations = 0
+        await super().websocket_receive(message)
+
+    async def allow_write(self, text, **extra):
+        if len(text) > settings.WS_MAX_MESSAGE_LENGTH:
+            await self.reject(
+                'message_too_long', "Message is too long", limit=settings.WS_MAX_MESSAGE_LENGTH, **extra
+            )
+            return False
+        retry_after = await sync_to_async(take_user_token, thread_sensitive=False)(self.user.id)
+        if retry_after:
+            await self.reject('rate_limited', "Too many messages", retry_after=_round_up(retry_after), **extra)
+            return False
+        return True
+
+    async def reject(self, code, message, **extra):
+        self._violations += 1
+        if self._violations > settings.WS_MAX_VIOLATIONS:
+            logger.warning("Closing socket after %s rejected frames (%s)", self._violations, code)
+            await self.close(code=4029)
+            return
+        await self.send(text_data=json.dumps({'type': 'error', 'code': code, 'message': message, **extra}))
+
+
+def _round_up(seconds):
+    return math.ceil(seconds * 100) / 100
+
+
+def _utf8_size_over(text, limit):
+    """Whether ``text`` takes more than ``limit`` bytes as UTF-8, encoding only when the length can't tell"""
+    # One to four bytes per character
+    if len(text) > limit:
+        return True
+    if len(text) * 4 <= limit:
+        return False
+    return len(text.encode('utf-8', 'surrogatepass')) > limit
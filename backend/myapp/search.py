@@ -0,0 +1,270 @@
+"""
+Full-text search over the chat rooms and private chats a user belongs to.
+
+On PostgreSQL both message tables have a ``search_vector`` tsvector column,
+generated from the message text on insert, with a GIN index (migration
+0014). A search is one query per table: the index finds the matches, they
+are ranked with ``ts_rank`` and only the returned page gets a
+``ts_headline`` snippet.
+
+Other databases (SQLite in tests and local runs) use an in-process inverted
+index of the same messages: token -> message ids, loaded on first search and
+kept current by ``signals`` on save and delete. It narrows the candidates;
+their rows are then read back and scored from the stored text, so a stale
+entry can never return a message that doesn't match. Rows written with
+``bulk_create`` after the index is loaded are not indexed.
+
+Results from both tables are merged by (rank, kind, id), highest first.
+Pagination is by keyset: each page returns an opaque cursor holding the
+sort key of its last result, so page N costs the same as page 1.
+"""
+import base64
+import binascii
+import html
+import json
+import math
+import re
+import threading
+
+from django.db import connection
+from django.db.models import BooleanField, CharField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .membership import rooms_for_user
+from .models import ChatMessage, PrivateMessage
+
+# Markers ts_headline puts around matches; swapped for <mark> after escaping
+START, STOP = '\x02', '\x03'
+HEADLINE_OPTIONS = f'StartSel={START}, StopSel={STOP}, MaxWords=20, MinWords=8, MaxFragments=1'
+TOKEN = re.compile(r'\w+')
+TOKEN_SPLIT = re.compile(r'(\w+)')
+# Text search configuration of the search_vector columns (migration 0014)
+SEARCH_CONFIG = 'english'
+
+# Kinds in sort order, lowest first: ties on rank list room messages first
+KINDS = {'private': 0, 'room': 1}
+MODELS = {'room': (ChatMessage, 'text'), 'private': (PrivateMessage, 'content')}
+
+
+def encode_cursor(rank, kind, message_id):
+    raw = json.dumps([rank, KINDS[kind], message_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(rank, kind order, id); ValueError if the cursor wasn't made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        rank, kind, message_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(rank, (int, float)) or kind not in KINDS.values() or not isinstance(message_id, int):
+        raise ValueError("Invalid cursor")
+    return float(rank), kind, message_id
+
+
+def _after_cursor(kind, cursor):
+    """Filter for the rows of ``kind`` that sort after ``cursor``"""
+    rank, cursor_kind, message_id = cursor
+    order = KINDS[kind]
+    if order < cursor_kind:
+        return Q(rank__lte=rank)
+    if order > cursor_kind:
+        return Q(rank__lt=rank)
+    return Q(rank__lt=rank) | Q(rank=rank, id__lt=message_id)
+
+
+def scoped_messages(user, kind, room_id=None, other_user_id=None):
+    """Messages of ``kind`` that ``user`` can read, optionally in one room or chat"""
+    if kind == 'room':
+        messages = ChatMessage.objects.filter(room_id__in=rooms_for_user(user).values('pk'))
+        if room_id is not None:
+            messages = messages.filter(room_id=room_id)
+        return messages
+    messages = PrivateMessage.objects.filter(Q(chat__user1=user) | Q(chat__user2=user))
+    if other_user_id is not None:
+        messages = messages.filter(Q(chat__user1_id=other_user_id) | Q(chat__user2_id=other_user_id))
+    return messages
+
+
+def search_messages(user, query, kinds=('room', 'private'), room_id=None, other_user_id=None, cursor=None, limit=20):
+    """
+    One page of ``user``'s messages matching ``query``, best first, and the
+    cursor of the next page (None on the last one).
+    """
+    cursor = decode_cursor(cursor) if cursor else None
+    search = _postgres_search if connection.vendor == 'postgresql' else _fallback_search
+    hits = []
+    for kind in kinds:
+        messages = scoped_messages(user, kind, room_id, other_user_id)
+        hits += [(kind, message) for message in search(kind, messages, query, cursor, limit + 1)]
+
+    hits.sort(key=lambda hit: (hit[1].rank, KINDS[hit[0]], hit[1].id), reverse=True)
+    page = hits[:limit]
+    next_cursor = None
+    if len(hits) > limit:
+        kind, last = page[-1]
+        next_cursor = encode_cursor(last.rank, kind, last.id)
+    return [_result(kind, message, user) for kind, message in page], next_cursor
+
+
+def _result(kind, message, user):
+    result = {
+        'kind': kind,
+        'id': message.id,
+        'text': getattr(message, MODELS[kind][1]),
+        'snippet': _mark(message.snippet),
+        'rank': message.rank,
+        'sender': {'id': message.sender_id, 'username': message.sender.username},
+        'created_at': message.created_at.isoformat(),
+    }
+    if kind == 'room':
+        result['room_id'] = message.room_id
+    else:
+        result['chat_id'] = message.chat_id
+        chat = message.chat
+        result['other_user_id'] = chat.user2_id if chat.user1_id == user.id else chat.user1_id
+    return result
+
+
+def _mark(snippet):
+    return html.escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+def _related(kind):
+    return ('sender',) if kind == 'room' else ('sender', 'chat')
+
+
+# PostgreSQL ------------------------------------------------------------------
+
+def _postgres_search(kind, messages, query, cursor, limit):
+    model, text_field = MODELS[kind]
+    table = model._meta.db_table
+    config = SEARCH_CONFIG
+    tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+    messages = messages.filter(
+        RawSQL(f'"{table}".search_vector @@ {tsquery}', (config, query), output_field=BooleanField())
+    ).annotate(
+        # ts_rank returns real; as float8 the rank in the cursor compares equal to
+        # the row it came from, which the tie-break on id depends on
+        rank=RawSQL(
+            f'ts_rank("{table}".search_vector, {tsquery})::float8', (config, query), output_field=FloatField(),
+        ),
+    )
+    if cursor:
+        messages = messages.filter(_after_cursor(kind, cursor))
+    return list(
+        messages.annotate(snippet=RawSQL(
+            f'ts_headline(%s::regconfig, "{table}"."{text_field}", {tsquery}, %s)',
+            (config, config, query, HEADLINE_OPTIONS), output_field=CharField(),
+        ))
+        .select_related(*_related(kind))
+        .order_by('-rank', '-id')[:limit]
+    )
+
+
+# Fallback --------------------------------------------------------------------
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class InvertedIndex:
+    """token -> message ids for each kind, built from the database on first use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+
+    def candidates(self, kind, tokens):
+        """Ids of ``kind`` messages indexed under every token"""
+        self._ensure_loaded(kind)
+        with self._lock:
+            postings = self._postings[kind]
+            sets = sorted((postings.get(token, set()) for token in set(tokens)), key=len)
+            return set.intersection(*sets) if sets else set()
+
+    def add(self, kind, message_id, text):
+        with self._lock:
+            if kind in self._postings:
+                self._add(self._postings[kind], message_id, text)
+
+    def remove(self, kind, message_id, text):
+        with self._lock:
+            postings = self._postings.get(kind)
+            if postings is None:
+                return
+            for token in set(tokenize(text)):
+                postings.get(token, set()).discard(message_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+
+    def _ensure_loaded(self, kind):
+        with self._lock:
+            if kind in self._postings:
+                return
+        model, text_field = MODELS[kind]
+        postings = {}
+        for message_id, text in model.objects.order_by().values_list('id', text_field).iterator(chunk_size=2000):
+            self._add(postings, message_id, text)
+        with self._lock:
+            self._postings.setdefault(kind, postings)
+
+    def _add(self, postings, message_id, text):
+        for token in set(tokenize(text)):
+            postings.setdefault(token, set()).add(message_id)
+
+
+search_index = InvertedIndex()
+
+
+def uses_fallback_index():
+    return connection.vendor != 'postgresql'
+
+
+def _score(tokens, terms):
+    counts = {term: tokens.count(term) for term in terms}
+    if not all(counts.values()):
+        return None
+    return round(sum(math.log1p(count) for count in counts.values()) / math.sqrt(len(tokens)), 6)
+
+
+def _snippet(text, terms, words=20):
+    """About ``words`` words from just before the first match, matches marked"""
+    # Separators at even indexes, words at odd ones
+    parts = TOKEN_SPLIT.split(text)
+    first = next((i for i in range(1, len(parts), 2) if parts[i].lower() in terms), 1)
+    start = max(0, first - 8)
+    return ''.join(
+        f'{START}{part}{STOP}' if i % 2 and part.lower() in terms else part
+        for i, part in enumerate(parts[start:start + 2 * words], start)
+    ).strip()
+
+
+def _fallback_search(kind, messages, query, cursor, limit):
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    text_field = MODELS[kind][1]
+    ids = search_index.candidates(kind, terms)
+    if not ids:
+        return []
+    hits = []
+    for message in messages.filter(id__in=ids).select_related(*_related(kind)):
+        text = getattr(message, text_field)
+        rank = _score(tokenize(text), terms)
+        if rank is None:
+            continue
+        message.rank = rank
+        if cursor and not _sorts_after(rank, KINDS[kind], message.id, cursor):
+            continue
+        message.snippet = _snippet(text, terms)
+        hits.append(message)
+    hits.sort(key=lambda message: (message.rank, message.id), reverse=True)
+    return hits[:limit]
+
+
+def _sorts_after(rank, kind_order, message_id, cursor):
+    return (rank, kind_order, message_id) < cursor
@@ -1,3 +1,5 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.crypto import get_random_string
 from rest_framework import serializers
 from ..models import EventComment, EventMedia, EventParticipant, EventTag, Event
@@ -53,15 +55,19 @@ class EventSerializer(serializers.ModelSerializer):
         read_only_fields = ['creator', 'created_at', 'updated_at', 'invite_link']
     
     def get_participants_count(self, obj):
+        if hasattr(obj, 'going_count'):
+            return obj.going_count
         return obj.participants.filter(status='going').count()
     
     def get_is_creator(self, obj):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
-            return obj.creator == request.user
+            return obj.creator_id == request.user.id
         return False
     
     def get_user_status(self, obj):
+        if hasattr(obj, 'viewer_status'):
+            return obj.viewer_status
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             try:
@@ -116,6 +122,26 @@ class EventSerializer(serializers.ModelSerializer):
                 
         return instance
 
+def with_event_stats(queryset, user):
+    """
+    Annotate events with what EventSerializer reads per row (going count and
+    ``user``'s own status) and load creators and tags alongside, so a list
+    costs a fixed number of queries. Apply before slicing.
+    """
+    going = (
+        EventParticipant.objects
+        .filter(event=OuterRef('pk'), status='going')
+        .order_by()
+        .values('event')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    own_status = EventParticipant.objects.filter(event=OuterRef('pk'), user=user).values('status')[:1]
+    return queryset.select_related('creator').prefetch_related('tags').annotate(
+        going_count=Coalesce(Subquery(going, output_field=IntegerField()), 0),
+        viewer_status=Subquery(own_status),
+    )
+
 class EventDetailSerializer(EventSerializer):
     participants = EventParticipantSerializer(many=True, read_only=True)
     comments = EventCommentSerializer(many=True, read_only=True)
@@ -1,3 +1,5 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from ..models import GroupChat, GroupMembership, Hobby
 from ..models import CustomUser
@@ -5,20 +7,39 @@ from ..models import CustomUser
 class GroupChatSerializer(serializers.ModelSerializer):
     admin = serializers.StringRelatedField()
     members_count = serializers.SerializerMethodField()
+    # Connect to ws/chat/<chat_room_id>/; rooms of newer groups don't share the group's id
+    chat_room_id = serializers.IntegerField(source='chat_room.id', read_only=True, default=None)
 
     class Meta:
         model = GroupChat
         fields = [
             'id', 'name', 'description', 'group_type',
             'hobbies', 'city', 'institution', 'image', 'admin', 'members_count',
-            'created_at',
+            'chat_room_id', 'created_at',
         ]
         read_only_fields = ['admin', 'created_at']
 
     def get_members_count(self, obj):
+        if hasattr(obj, 'member_total'):
+            return obj.member_total
         return obj.members.count()
 
 
+def with_group_stats(queryset):
+    """Annotate member counts and load hobby ids and chat rooms so GroupChatSerializer lists need no per-row queries"""
+    members = (
+        GroupMembership.objects
+        .filter(group_id=OuterRef('pk'))
+        .order_by()
+        .values('group_id')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return queryset.select_related('chat_room').prefetch_related('hobbies').annotate(
+        member_total=Coalesce(Subquery(members, output_field=IntegerField()), 0),
+    )
+
+
 class GroupCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = GroupChat
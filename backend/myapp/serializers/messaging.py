@@ -1,13 +1,22 @@
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Prefetch, Subquery, When, Window
+from django.db.models.functions import Coalesce, RowNumber
 from rest_framework import serializers
-from ..models import ChatMessage, MessageAttachment, ChatRoom, PrivateChat, PrivateMessage
+from ..membership import room_members
+from ..models import ChatMessage, GroupMembership, MessageAttachment, ChatRoom, PrivateChat, PrivateMessage
 from ..serializers.authentication import UserBasicSerializer, UserSerializer
 
 class ChatRoomSerializer(serializers.ModelSerializer):
-    members = UserSerializer(many=True, read_only=True)
+    # Group rooms can have thousands of members, so lists only carry the count
+    member_count = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatRoom
-        fields = ['id', 'name', 'chat_type', 'members', 'created_at']
+        fields = ['id', 'name', 'chat_type', 'member_count', 'created_at']
+
+    def get_member_count(self, obj):
+        """Annotated by with_room_summary; counted here for a single room"""
+        total = getattr(obj, 'member_total', None)
+        return total if total is not None else room_members(obj).count()
 
 class MessageAttachmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,6 +32,73 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'room', 'sender', 'text', 'attachments', 'created_at'] 
         read_only_fields = ['sender', 'created_at']
 
+def latest_message_prefetch(model, parent_field, to_attr='latest_messages'):
+    """
+    Prefetch only the newest message of each chat or room, with its sender,
+    into ``to_attr`` (a list of zero or one message). One query for the whole
+    list instead of one per row: messages are numbered newest first within
+    each parent by a window function, and only the first is kept. Ids grow
+    with creation time, so the order follows the (parent, id) indexes.
+    """
+    newest = (
+        model.objects
+        .annotate(position=Window(RowNumber(), partition_by=F(parent_field), order_by=F('id').desc()))
+        .filter(position=1)
+        .order_by()
+        .select_related('sender')
+    )
+    return Prefetch('messages', queryset=newest, to_attr=to_attr)
+
+
+def with_room_summary(queryset):
+    """Member count and the newest message of each room, for ChatRoomListCreateView"""
+    # Group rooms take their members from the group, other rooms from their own table
+    in_group = (
+        GroupMembership.objects
+        .filter(group_id=OuterRef('group_id'))
+        .order_by()
+        .values('group_id')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    direct = (
+        ChatRoom.members.through.objects
+        .filter(chatroom_id=OuterRef('pk'))
+        .order_by()
+        .values('chatroom_id')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return queryset.annotate(member_total=Coalesce(
+        Case(
+            When(group__isnull=False, then=Subquery(in_group, output_field=IntegerField())),
+            default=Subquery(direct, output_field=IntegerField()),
+        ),
+        0,
+    )).prefetch_related(latest_message_prefetch(ChatMessage, 'room'))
+
+
+def with_chat_summary(queryset, user):
+    """
+    Users, newest message and the unread count that PrivateChatSerializer
+    reads per chat, for lists of ``user``'s private chats.
+    """
+    unread = (
+        PrivateMessage.objects
+        .filter(chat=OuterRef('pk'), sender=user, is_read=False)
+        .order_by()
+        .values('chat')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return (
+        queryset
+        .select_related('user1', 'user2')
+        .prefetch_related(latest_message_prefetch(PrivateMessage, 'chat'))
+        .annotate(unread_total=Coalesce(Subquery(unread, output_field=IntegerField()), 0))
+    )
+
+
 class PrivateChatSerializer(serializers.ModelSerializer):
     user1 = UserBasicSerializer(read_only=True)
     user2 = UserBasicSerializer(read_only=True)
@@ -42,7 +118,10 @@ class PrivateChatSerializer(serializers.ModelSerializer):
         return None
     
     def get_last_message(self, obj):
-        last_message = obj.messages.order_by('-created_at').first()
+        if hasattr(obj, 'latest_messages'):
+            last_message = obj.latest_messages[0] if obj.latest_messages else None
+        else:
+            last_message = obj.messages.order_by('-created_at').first()
         if last_message:
             return {
                 'content': last_message.content,
@@ -53,6 +132,8 @@ class PrivateChatSerializer(serializers.ModelSerializer):
         return None
     
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread_total'):
+            return obj.unread_total
         request = self.context.get('request')
         if request and request.user:
             return obj.messages.filter(sender=request.user, is_read=False).count()
@@ -3,6 +3,7 @@ from rest_framework import serializers
 from ..models.authentication import CustomUser
 from ..models.tutoring import  Subject, Review, Booking, TutorAvailability
 from ..models import TutorProfile, StudentProfile
+from ..cache import SUBJECTS_CACHE_KEY, cached_lookup
 
 class TutorProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -61,32 +62,28 @@ class BookingSerializer(serializers.ModelSerializer):
     
     def validate_tutor_id(self, value):
         """Validate that the tutor exists and has a tutor profile"""
-        try:
-            user = CustomUser.objects.get(id=value)
-            if not hasattr(user, 'tutor_profile'):
-                raise serializers.ValidationError("User is not a tutor")
-            return value
-        except CustomUser.DoesNotExist:
+        user = CustomUser.objects.filter(id=value).values('id', 'tutor_profile').first()
+        if user is None:
             raise serializers.ValidationError("Tutor not found")
+        if user['tutor_profile'] is None:
+            raise serializers.ValidationError("User is not a tutor")
+        return value
     
     def validate_subject_id(self, value):
         """Validate that the subject exists"""
-        try:
-            Subject.objects.get(id=value)
-            return value
-        except Subject.DoesNotExist:
+        subject_ids = {subject['id'] for subject in cached_subjects()}
+        if value not in subject_ids and not Subject.objects.filter(id=value).exists():
             raise serializers.ValidationError("Subject not found")
+        return value
     
     def validate_student_id(self, value):
         """Validate that the student exists (if provided)"""
         if value:
-            try:
-                user = CustomUser.objects.get(id=value)
-                if not hasattr(user, 'student_profile'):
-                    raise serializers.ValidationError("User is not a student")
-                return value
-            except CustomUser.DoesNotExist:
+            user = CustomUser.objects.filter(id=value).values('id', 'student_profile').first()
+            if user is None:
                 raise serializers.ValidationError("Student not found")
+            if user['student_profile'] is None:
+                raise serializers.ValidationError("User is not a student")
         return value
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -99,6 +96,14 @@ class SubjectSerializer(serializers.ModelSerializer):
         model = Subject
         fields = ['id', 'name', 'description']
 
+
+def cached_subjects():
+    """Serialized subject catalogue from the two-tier cache"""
+    return cached_lookup(
+        SUBJECTS_CACHE_KEY,
+        lambda: SubjectSerializer(Subject.objects.order_by('name', 'id'), many=True).data,
+    )
+
 class TutorAvailabilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = TutorAvailability
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import ARCHIVE_SEGMENTS_CACHE_KEY, HOBBY_IDS_CACHE_KEY, POPULAR_TAGS_CACHE_KEY, SUBJECTS_CACHE_KEY, invalidate
+from .hobbies import sync_user_hobbies
+from .models import ChatMessage, ChatRoom, CustomUser, StudentProfile, HStudents, ServiceProvider, JobSeeker, Event, EventTag, GroupChat, Hobby, MessageArchiveSegment, PrivateMessage
+from .models.tutoring import Subject
+from .search import search_index, uses_fallback_index
+
+
+def _hobbies_saved(update_fields):
+    return update_fields is None or 'hobbies' in update_fields
+
+
+@receiver(post_save, sender=CustomUser)
+def sync_hobbies_from_user(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or not _hobbies_saved(update_fields):
+        return
+    transaction.on_commit(lambda: sync_user_hobbies(instance.pk))
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=HStudents)
+@receiver(post_save, sender=ServiceProvider)
+@receiver(post_save, sender=JobSeeker)
+def sync_hobbies_from_profile(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or not _hobbies_saved(update_fields):
+        return
+    transaction.on_commit(lambda: sync_user_hobbies(instance.user_id))
+
+
+@receiver(post_save, sender=GroupChat)
+def create_group_chat_room(sender, instance, created, raw=False, **kwargs):
+    # Members are read from GroupMembership; see myapp.membership
+    if created and not raw:
+        ChatRoom.objects.create(group=instance, name=instance.name)
+
+
+def _invalidate_on_commit(*keys):
+    transaction.on_commit(lambda: invalidate(*keys))
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def invalidate_subjects(sender, **kwargs):
+    _invalidate_on_commit(SUBJECTS_CACHE_KEY)
+
+
+@receiver(post_save, sender=EventTag)
+@receiver(post_delete, sender=EventTag)
+def invalidate_tags(sender, **kwargs):
+    _invalidate_on_commit(POPULAR_TAGS_CACHE_KEY)
+
+
+@receiver(m2m_changed, sender=Event.tags.through)
+def invalidate_tag_usage(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_on_commit(POPULAR_TAGS_CACHE_KEY)
+
+
+@receiver(post_save, sender=Hobby)
+@receiver(post_delete, sender=Hobby)
+def invalidate_hobbies(sender, **kwargs):
+    _invalidate_on_commit(HOBBY_IDS_CACHE_KEY)
+
+
+@receiver(post_save, sender=MessageArchiveSegment)
+@receiver(post_delete, sender=MessageArchiveSegment)
+def invalidate_archive_segments(sender, **kwargs):
+    _invalidate_on_commit(ARCHIVE_SEGMENTS_CACHE_KEY)
+
+
+# Keeps the in-process search index current where there is no tsvector
+# column (see myapp.search); PostgreSQL maintains its own.
+@receiver(post_save, sender=ChatMessage)
+@receiver(post_save, sender=PrivateMessage)
+def index_message(sender, instance, raw=False, **kwargs):
+    if raw or not uses_fallback_index():
+        return
+    kind, text = _search_entry(instance)
+    search_index.add(kind, instance.pk, text)
+
+
+@receiver(post_delete, sender=ChatMessage)
+@receiver(post_delete, sender=PrivateMessage)
+def unindex_message(sender, instance, **kwargs):
+    if not uses_fallback_index():
+        return
+    kind, text = _search_entry(instance)
+    search_index.remove(kind, instance.pk, text)
+
+
+def _search_entry(message):
+    if isinstance(message, ChatMessage):
+        return 'room', message.text
+    return 'private', message.content
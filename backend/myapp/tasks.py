@@ -1,11 +1,37 @@
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
-from .models import Booking, TutorEarnings
 from decimal import Decimal
 
+from .mail import deliver_pending
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None)
+def deliver_outbound_email(self, ids=None):
+    """Deliver queued outbox emails; with ``ids``, retry those rows until sent or given up"""
+    stats = deliver_pending(ids)
+    if ids is not None and stats['retry_in'] is not None:
+        raise self.retry(countdown=stats['retry_in'])
+    return stats
+
+
+@shared_task(ignore_result=True)
+def maintain_message_partitions():
+    """Create the coming months' message partitions, then archive cold months"""
+    from .archive import archive_cold_messages
+    from .partitions import ensure_partitions
+
+    created = ensure_partitions()
+    segments = archive_cold_messages()
+    return {'partitions_created': created, 'segments_written': [segment.path for segment in segments]}
+
+
 @shared_task
 def calculate_weekly_earnings():
+    # Imported here so the module (and the email task) stays importable while
+    # the earnings model does not exist yet
+    from .models.tutoring import Booking, TutorEarnings
+
     today = timezone.now().date()
     start_of_week = today - timedelta(days=today.weekday() + 7)
     end_of_week = start_of_week + timedelta(days=6)
@@ -36,4 +62,4 @@ def calculate_weekly_earnings():
             net_earnings=net
         )
 
-        tutor_bookings.update(is_processed=True)
\ No newline at end of file
+        tutor_bookings.update(is_processed=True)
@@ -0,0 +1,332 @@
+"""
+Deterministic bulk dataset for the performance tests.
+
+The user template (password hash, flags) comes from the fixture in
+``data.json``, so seeded accounts look like real ones without paying for
+password hashing thousands of times. Everything else is generated with
+bulk_create, which skips model signals, so derived rows such as UserHobby
+are written directly.
+
+``seed()`` returns the handful of accounts the tests log in as. Each one
+sits in the busy part of the data: many connections, rooms, bookings and
+events.
+"""
+import json
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import (
+    ChatMessage, ChatRoom, ConnectionRequest, CustomUser, Event, EventComment, EventMedia,
+    EventParticipant, EventTag, GroupChat, GroupMembership, HStudents, Hobby, JobSeeker,
+    PrivateChat, PrivateMessage, ServiceProvider, StudentProfile, TutorProfile, UserHobby,
+)
+from ..models.tutoring import Booking, Review, Subject
+
+FIXTURE = Path(settings.BASE_DIR) / 'data.json'
+
+CITIES = ['Johannesburg', 'Cape Town', 'Durban', 'Pretoria', 'Gqeberha']
+INSTITUTIONS = ['Wits', 'UCT', 'UKZN', 'UP', 'NMU']
+HOBBIES = [
+    'Hiking', 'Chess', 'Football', 'Reading', 'Photography', 'Cooking', 'Gaming', 'Music',
+    'Dancing', 'Painting', 'Running', 'Cycling', 'Swimming', 'Coding', 'Gardening', 'Yoga',
+    'Basketball', 'Writing', 'Film', 'Travel',
+]
+SUBJECTS = [
+    'Mathematics', 'Physical Sciences', 'Life Sciences', 'Accounting', 'Economics', 'English',
+    'isiZulu', 'Afrikaans', 'Geography', 'History', 'Computer Science', 'Statistics',
+    'Chemistry', 'Physics', 'Business Studies', 'Information Technology',
+]
+ROLE_MIX = (
+    ('student', 40), ('tutor', 15), ('hs student', 15), ('jobseeker', 15), ('service provider', 15),
+)
+
+
+@dataclass
+class Scale:
+    users: int = 2000
+    groups: int = 200
+    members_per_group: int = 20
+    messages_per_room: int = 40
+    connections_per_user: int = 8
+    private_messages_per_chat: int = 15
+    events: int = 300
+    participants_per_event: int = 12
+    comments_per_event: int = 6
+    bookings_per_tutor: int = 12
+
+
+@dataclass
+class Dataset:
+    student: CustomUser
+    tutor: CustomUser
+    other_student: CustomUser
+    room: ChatRoom
+    event: Event
+
+
+def _user_template():
+    for obj in json.loads(FIXTURE.read_text()):
+        if obj['model'] == 'myapp.customuser':
+            fields = obj['fields']
+            return {
+                'password': fields['password'],
+                'is_active': True,
+                'is_staff': False,
+                'is_superuser': False,
+                'first_name': fields['first_name'],
+                'last_name': fields['last_name'],
+            }
+    raise LookupError(f'No myapp.customuser in {FIXTURE}')
+
+
+def _cycle_roles(count):
+    roles = []
+    for role, share in ROLE_MIX:
+        roles += [role] * share
+    return [roles[i % len(roles)] for i in range(count)]
+
+
+def seed(scale=None, rng_seed=1):
+    scale = scale or Scale()
+    rng = random.Random(rng_seed)
+    now = timezone.now()
+    template = _user_template()
+
+    # Users and profiles ---------------------------------------------------
+    roles = _cycle_roles(scale.users)
+    users = CustomUser.objects.bulk_create([
+        CustomUser(
+            username=f'user{i:05d}',
+            email=f'user{i:05d}@example.com',
+            roles=[role],
+            active_role=role,
+            city=CITIES[i % len(CITIES)],
+            hobbies=json.dumps(rng.sample(HOBBIES, 3)),
+            bio='Seeded account for performance tests',
+            **template,
+        )
+        for i, role in enumerate(roles)
+    ])
+    if users[0].pk is None:
+        # Backends without RETURNING on bulk inserts
+        users = list(CustomUser.objects.filter(username__startswith='user').order_by('username'))
+    by_role = {role: [] for role, _ in ROLE_MIX}
+    for user, role in zip(users, roles):
+        by_role[role].append(user)
+
+    StudentProfile.objects.bulk_create([
+        StudentProfile(
+            user=user, city=user.city, year_of_study=1 + i % 4, course='BSc',
+            hobbies=user.hobbies, institution=INSTITUTIONS[CITIES.index(user.city)],
+        )
+        for i, user in enumerate(by_role['student'])
+    ])
+    HStudents.objects.bulk_create([
+        HStudents(user=user, city=user.city, hobbies=user.hobbies, schoolName='High School', studyLevel='Grade 11')
+        for user in by_role['hs student']
+    ])
+    JobSeeker.objects.bulk_create([
+        JobSeeker(user=user, city=user.city, hobbies=user.hobbies, status='Looking')
+        for user in by_role['jobseeker']
+    ])
+    ServiceProvider.objects.bulk_create([
+        ServiceProvider(
+            user=user, city=user.city, company='Acme', about='Services', usageType='business',
+            sectors='IT', hobbies=user.hobbies, serviceNeeds='Staff',
+        )
+        for user in by_role['service provider']
+    ])
+    tutors = TutorProfile.objects.bulk_create([
+        TutorProfile(
+            user=user, city=user.city, place=user.city, phone_number=600000000 + i,
+            hourly_rate=Decimal(150 + (i % 20) * 10), rating=Decimal(i % 50) / 10,
+        )
+        for i, user in enumerate(by_role['tutor'])
+    ])
+
+    subjects = Subject.objects.bulk_create([Subject(name=name, description=f'{name} tutoring') for name in SUBJECTS])
+    TutorProfile.subjects.through.objects.bulk_create([
+        TutorProfile.subjects.through(tutorprofile_id=tutor.pk, subject_id=subject.pk)
+        for tutor in tutors
+        for subject in rng.sample(subjects, 3)
+    ])
+
+    hobbies = Hobby.objects.bulk_create([Hobby(name=name) for name in HOBBIES])
+    hobby_ids = {hobby.name: hobby.pk for hobby in hobbies}
+    UserHobby.objects.bulk_create([
+        UserHobby(user_id=user.pk, hobby_id=hobby_ids[name])
+        for user in users
+        for name in json.loads(user.hobbies)
+    ])
+
+    student, other_student = by_role['student'][0], by_role['student'][1]
+    tutor = by_role['tutor'][0]
+
+    # Groups and their chat rooms (members come from GroupMembership) ------
+    groups = GroupChat.objects.bulk_create([
+        GroupChat(
+            name=f'{CITIES[i % len(CITIES)]} group {i}',
+            description='Seeded group',
+            group_type='city_hobby' if i % 2 else 'institution',
+            city=CITIES[i % len(CITIES)],
+            institution=INSTITUTIONS[i % len(INSTITUTIONS)],
+            is_dynamic=i % 3 == 0,
+        )
+        for i in range(scale.groups)
+    ])
+    GroupChat.hobbies.through.objects.bulk_create([
+        GroupChat.hobbies.through(groupchat_id=group.pk, hobby_id=hobby.pk)
+        for group in groups
+        for hobby in rng.sample(hobbies, 2)
+    ])
+    rooms = ChatRoom.objects.bulk_create([ChatRoom(group=group, name=group.name) for group in groups])
+
+    memberships = []
+    for index, group in enumerate(groups):
+        members = rng.sample(users, scale.members_per_group)
+        # The test accounts are in every fourth group
+        if index % 4 == 0:
+            members = [m for m in members if m.pk not in (student.pk, tutor.pk)] + [student, tutor]
+        for member in members:
+            memberships.append(GroupMembership(user=member, group=group, role='member'))
+    GroupMembership.objects.bulk_create(memberships)
+
+    members_by_group = {}
+    for row in memberships:
+        members_by_group.setdefault(row.group_id, []).append(row.user_id)
+    ChatMessage.objects.bulk_create([
+        ChatMessage(room_id=room.pk, sender_id=rng.choice(members_by_group[room.group_id]), text=f'Message {n} in {room.name}')
+        for room in rooms
+        for n in range(scale.messages_per_room)
+    ], batch_size=2000)
+
+    # Connections and private chats -------------------------------------------
+    pairs = set()
+    hubs = [student, tutor, other_student]
+    for user in hubs:
+        for other in rng.sample(users, scale.connections_per_user * 4):
+            if other.pk != user.pk:
+                pairs.add((min(user.pk, other.pk), max(user.pk, other.pk)))
+    for user in users:
+        for other in rng.sample(users, scale.connections_per_user // 2):
+            if other.pk != user.pk:
+                pairs.add((min(user.pk, other.pk), max(user.pk, other.pk)))
+    # The two students are connected and share some connections
+    accepted_pairs = {(min(student.pk, other_student.pk), max(student.pk, other_student.pk))}
+    for other in rng.sample(users[3:], scale.connections_per_user):
+        for hub in (student, other_student):
+            accepted_pairs.add((min(hub.pk, other.pk), max(hub.pk, other.pk)))
+    pairs = sorted(pairs | accepted_pairs)
+
+    statuses = ['accepted', 'accepted', 'accepted', 'pending', 'rejected']
+    requests = []
+    for n, (a, b) in enumerate(pairs):
+        status = 'accepted' if (a, b) in accepted_pairs else statuses[n % len(statuses)]
+        from_user, to_user = (a, b) if n % 2 else (b, a)
+        requests.append(ConnectionRequest(from_user_id=from_user, to_user_id=to_user, status=status))
+    ConnectionRequest.objects.bulk_create(requests, batch_size=2000)
+
+    accepted = [(r.from_user_id, r.to_user_id) for r in requests if r.status == 'accepted']
+    hub_ids = {user.pk for user in hubs}
+    chat_pairs = [pair for pair in accepted if hub_ids & set(pair)] + accepted[:300]
+    chats = PrivateChat.objects.bulk_create([
+        PrivateChat(user1_id=min(pair), user2_id=max(pair)) for pair in dict.fromkeys(chat_pairs)
+    ])
+    PrivateMessage.objects.bulk_create([
+        PrivateMessage(
+            chat_id=chat.pk,
+            sender_id=(chat.user1_id, chat.user2_id)[n % 2],
+            content=f'Private message {n}',
+            is_read=n < scale.private_messages_per_chat - 3,
+        )
+        for chat in chats
+        for n in range(scale.private_messages_per_chat)
+    ], batch_size=2000)
+
+    # Events -----------------------------------------------------------------
+    tags = EventTag.objects.bulk_create([EventTag(name=name.lower()) for name in HOBBIES])
+    events = Event.objects.bulk_create([
+        Event(
+            title=f'Event {i}',
+            description='Seeded event',
+            event_type=Event.EVENT_TYPE_CHOICES[i % len(Event.EVENT_TYPE_CHOICES)][0],
+            creator=rng.choice(users),
+            location=CITIES[i % len(CITIES)],
+            # A third are in the past so recommendations have history to draw on
+            start_time=now + timedelta(days=i % 90 - 30, hours=1),
+            end_time=now + timedelta(days=i % 90 - 30, hours=3),
+            max_participants=50,
+            is_public=i % 5 != 0,
+            invite_link=f'invite-{i:05d}',
+        )
+        for i in range(scale.events)
+    ])
+    Event.tags.through.objects.bulk_create([
+        Event.tags.through(event_id=event.pk, eventtag_id=tag.pk)
+        for event in events
+        for tag in rng.sample(tags, 2)
+    ])
+    participants = []
+    for index, event in enumerate(events):
+        people = {event.creator_id} | {u.pk for u in rng.sample(users, scale.participants_per_event)}
+        if index % 3 == 0:
+            people |= {student.pk, tutor.pk}
+        for user_id in people:
+            participants.append(EventParticipant(
+                event=event, user_id=user_id,
+                role='organizer' if user_id == event.creator_id else 'participant',
+                status=('going', 'going', 'maybe', 'invited')[user_id % 4],
+            ))
+    EventParticipant.objects.bulk_create(participants, batch_size=2000)
+    EventComment.objects.bulk_create([
+        EventComment(event=event, user=rng.choice(users), content=f'Comment {n}')
+        for event in events
+        for n in range(scale.comments_per_event)
+    ], batch_size=2000)
+    EventMedia.objects.bulk_create([
+        EventMedia(event=event, file=f'event_media/{event.pk}-{n}.jpg', media_type='image', title=f'Photo {n}', uploaded_by=event.creator)
+        for event in events
+        for n in range(2)
+    ])
+
+    # Bookings and reviews -----------------------------------------------------
+    # One booking per tutor per day keeps the no-overlap rule satisfied
+    students = by_role['student']
+    today = date.today()
+    bookings = []
+    for t_index, profile in enumerate(tutors):
+        for n in range(scale.bookings_per_tutor):
+            booking_student = student if (t_index == 0 or n == 0) else rng.choice(students)
+            day = today + timedelta(days=n - scale.bookings_per_tutor // 2)
+            status = 'completed' if day < today else ('confirmed', 'pending')[n % 2]
+            bookings.append(Booking(
+                student_id=booking_student.pk,
+                tutor_id=profile.user_id,
+                subject=subjects[(t_index + n) % len(subjects)],
+                date=day,
+                start_time=time(9 + n % 8, 0),
+                end_time=time(10 + n % 8, 0),
+                hourly_rate=profile.hourly_rate,
+                total_cost=profile.hourly_rate,
+                status=status,
+                completed_at=datetime.combine(day, time(12), tzinfo=dt_timezone.utc) if status == 'completed' else None,
+            ))
+    Booking.objects.bulk_create(bookings, batch_size=2000)
+    Review.objects.bulk_create([
+        Review(booking=booking, student_id=booking.student_id, tutor_id=booking.tutor_id, rating=1 + n % 5, comment='Seeded review')
+        for n, booking in enumerate(b for b in bookings if b.status == 'completed')
+    ])
+
+    return Dataset(
+        student=student,
+        tutor=tutor,
+        other_student=other_student,
+        room=rooms[0],
+        event=events[0],
+    )
@@ -0,0 +1,112 @@
+"""
+Cold months move to segment files and stay readable through the history endpoints.
+"""
+import os
+import tempfile
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .. import archive
+from ..cache import local_cache
+from ..consumers import private_chat_between
+from ..membership import join_group
+from ..models import (
+    ChatMessage, ConnectionRequest, CustomUser, GroupChat, MessageArchiveSegment, MessageAttachment, PrivateMessage,
+)
+from .test_query_budgets import TEST_CACHES
+
+NOW = datetime(2026, 10, 19, tzinfo=timezone.utc)
+OLD = datetime(2025, 3, 14, tzinfo=timezone.utc)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='x')
+        group, other = GroupChat.objects.create(name='Archive'), GroupChat.objects.create(name='Other')
+        for member in (cls.alice, cls.bob):
+            join_group(group, member)
+            join_group(other, member)
+        cls.room, cls.other_room = group.chat_room, other.chat_room
+        ConnectionRequest.objects.create(from_user=cls.alice, to_user=cls.bob, status='accepted')
+        cls.chat = private_chat_between(cls.alice.pk, cls.bob.pk)
+
+        cls.old_room = [ChatMessage.objects.create(room=cls.room, sender=cls.bob, text=f'old {n}') for n in range(5)]
+        cls.attachment = MessageAttachment.objects.create(
+            message=cls.old_room[0], file='message_attachments/a.png', attachment_type='image',
+        )
+        ChatMessage.objects.create(room=cls.other_room, sender=cls.bob, text='elsewhere')
+        cls.old_private = [PrivateMessage.objects.create(chat=cls.chat, sender=cls.bob, content=f'old {n}') for n in range(2)]
+        ChatMessage.objects.update(created_at=OLD)
+        PrivateMessage.objects.update(created_at=OLD)
+        cls.live_room = ChatMessage.objects.create(room=cls.room, sender=cls.alice, text='new')
+        cls.live_private = PrivateMessage.objects.create(chat=cls.chat, sender=cls.alice, content='new')
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(MESSAGE_ARCHIVE_ROOT=root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        local_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def archive(self):
+        # Small blocks, so one room spans several of them
+        with mock.patch.object(archive, 'BLOCK_ROWS', 2):
+            return archive.archive_cold_messages(now=NOW, keep_months=12)
+
+    def test_cold_months_move_to_segments(self):
+        segments = self.archive()
+        self.assertEqual(sorted((s.kind, s.month.isoformat(), s.message_count) for s in segments),
+                         [('private', '2025-03-01', 2), ('room', '2025-03-01', 6)])
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True)), [self.live_room.pk])
+        self.assertEqual(list(PrivateMessage.objects.values_list('id', flat=True)), [self.live_private.pk])
+        for segment in segments:
+            self.assertTrue(os.path.exists(archive.full_path(segment.path)))
+        # Already archived months are left alone
+        self.assertEqual(self.archive(), [])
+        self.assertEqual(MessageArchiveSegment.objects.count(), 2)
+
+    def test_segments_read_one_room_from_its_blocks(self):
+        self.archive()
+        path = MessageArchiveSegment.objects.get(kind='room').path
+        segment = archive.open_segment(archive.full_path(path))
+        self.assertEqual([row[0] for row in segment.rows(self.room.pk)], [m.pk for m in self.old_room])
+        self.assertEqual([row[0] for row in segment.rows(self.room.pk, after_id=self.old_room[2].pk)],
+                         [m.pk for m in self.old_room[3:]])
+        self.assertEqual([row[0] for row in segment.rows(self.room.pk, before_id=self.old_room[3].pk, newest_first=True)],
+                         [m.pk for m in reversed(self.old_room[:3])])
+        self.assertEqual(list(segment.rows(self.room.pk + 1000)), [])
+
+    def test_history_pages_from_live_into_archived_messages(self):
+        self.archive()
+        url = f'/chat/chat/rooms/{self.room.pk}/messages/'
+        body = self.client.get(url, {'page_size': 4}).json()
+        self.assertEqual([m['id'] for m in body['results']], [m.pk for m in self.old_room[2:]] + [self.live_room.pk])
+        body = self.client.get(body['next']).json()
+        self.assertEqual([m['id'] for m in body['results']], [m.pk for m in self.old_room[:2]])
+        self.assertIsNone(body['next'])
+        self.assertEqual(body['results'][0]['sender']['username'], 'bob')
+        self.assertEqual(body['results'][0]['attachments'][0]['attachment_type'], 'image')
+
+        # Forward from a message, as a resumed socket does
+        body = self.client.get(url, {'after': self.old_room[2].pk, 'page_size': 1}).json()
+        self.assertEqual([m['id'] for m in body['results']], [self.old_room[3].pk])
+        body = self.client.get(body['next']).json()
+        self.assertEqual([m['id'] for m in body['results']], [self.old_room[4].pk])
+        body = self.client.get(body['next']).json()
+        self.assertEqual([m['id'] for m in body['results']], [self.live_room.pk])
+        self.assertIsNone(body['next'])
+
+        body = self.client.get(f'/chat/chat/private/{self.bob.pk}/messages/').json()
+        self.assertEqual([m['id'] for m in body['results']], [m.pk for m in self.old_private] + [self.live_private.pk])
+        self.assertEqual(body['results'][0]['content'], 'old 0')
@@ -0,0 +1,71 @@
+"""
+A tutor's active bookings never overlap: saves raise BookingConflict and the API answers 409.
+
+These run on SQLite, so they cover the in-transaction check that stands in
+for the PostgreSQL exclusion constraint.
+"""
+from datetime import date, time, timedelta
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ..models.tutoring import Booking, BookingConflict, CustomUser, StudentProfile, Subject, TutorProfile
+
+DAY = date.today() + timedelta(days=7)
+
+
+class BookingOverlapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tutor = CustomUser.objects.create_user(username='tutor', email='tutor@example.com', password='x')
+        TutorProfile.objects.create(user=cls.tutor, phone_number=123, hourly_rate=100)
+        cls.student = CustomUser.objects.create_user(username='student', email='student@example.com', password='x')
+        StudentProfile.objects.create(user=cls.student)
+        cls.subject = Subject.objects.create(name='Maths')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def book(self, start, end, **fields):
+        return Booking.objects.create(
+            student=self.student, tutor=self.tutor, subject=self.subject,
+            date=DAY, start_time=start, end_time=end, hourly_rate=100, **fields,
+        )
+
+    def post(self, start, end=None):
+        data = {
+            'tutor_id': self.tutor.pk, 'subject_id': self.subject.pk, 'hourly_rate': '100.00',
+            'date': DAY.isoformat(), 'start_time': start,
+        }
+        if end:
+            data['end_time'] = end
+        return self.client.post('/tutoring/bookings/', data, format='json')
+
+    def test_overlapping_active_bookings_are_rejected(self):
+        self.book(time(10), time(11))
+        with self.assertRaises(BookingConflict):
+            self.book(time(10, 30), time(11, 30))
+        # Touching slots don't overlap
+        self.book(time(11), time(12))
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_inactive_bookings_free_the_slot(self):
+        cancelled = self.book(time(10), time(11), status='cancelled')
+        self.book(time(10), time(11))
+        # Reactivating the cancelled one would overlap
+        cancelled.status = 'pending'
+        with self.assertRaises(BookingConflict):
+            cancelled.save()
+
+    def test_api_answers_conflict_with_409(self):
+        self.assertEqual(self.post('10:00', '11:00').status_code, 201)
+        response = self.post('10:30', '11:30')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['detail'].code, 'booking_conflict')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_default_end_time_stops_at_midnight(self):
+        response = self.post('23:30')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Booking.objects.get().end_time, time.max)
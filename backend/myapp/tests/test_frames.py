@@ -0,0 +1,18 @@
+import json
+
+from django.test import SimpleTestCase
+
+from ..frames import broadcast_event, frame_text, with_stream
+
+
+class FrameTests(SimpleTestCase):
+    def test_broadcast_event_is_encoded_once_and_tagged_without_decoding(self):
+        payload = {'type': 'message', 'id': 5, 'text': 'héllo "there"', 'sender': {'id': 1}}
+        event = broadcast_event('chat_message', 'chat_1', payload, id=5)
+        self.assertEqual(event['id'], 5)
+        self.assertEqual(json.loads(frame_text(event)), payload)
+        self.assertEqual(json.loads(with_stream(frame_text(event), 'room:1')), {**payload, 'stream': 'room:1'})
+        self.assertEqual(json.loads(with_stream('{}', 'room:1')), {'stream': 'room:1'})
+
+    def test_events_without_text_are_encoded_on_receipt(self):
+        self.assertEqual(json.loads(frame_text({'message': {'type': 'typing'}})), {'type': 'typing'})
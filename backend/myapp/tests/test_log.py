@@ -0,0 +1,56 @@
+import json
+import logging
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..log import JsonFormatter, QueueingHandler, log_sampled
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class LoggingTests(SimpleTestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('myapp.tests.log')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def attach(self, queue_size=100):
+        handler = QueueingHandler(target='myapp.tests.test_log.CollectingHandler', queue_size=queue_size)
+        handler.setFormatter(JsonFormatter())
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        return handler
+
+    def test_records_are_written_as_json_by_the_writer_thread(self):
+        handler = self.attach()
+        value = ['before']
+        self.logger.info("Frame %s from %s", 'typing', value, extra={'user_id': 7})
+        value.append('after')  # The message was rendered when logged
+        handler.close()
+
+        entry = json.loads(handler.target.lines[0])
+        self.assertEqual(entry['message'], "Frame typing from ['before']")
+        self.assertEqual((entry['level'], entry['logger'], entry['user_id']), ('INFO', 'myapp.tests.log', 7))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = self.attach(queue_size=1)
+        with mock.patch.object(handler, '_ensure_listener'):
+            for n in range(5):
+                self.logger.warning("Record %s", n)
+        self.assertEqual(handler.dropped, 4)
+        handler.close()
+
+    def test_sampling_is_decided_before_the_record_exists(self):
+        with mock.patch.object(self.logger, 'log') as log:
+            log_sampled(self.logger, logging.INFO, "skipped", rate=0)
+            log_sampled(self.logger, logging.DEBUG, "below level", rate=1)
+            log_sampled(self.logger, logging.INFO, "kept %s", 1, rate=1, extra={'room_id': 3})
+        log.assert_called_once_with(logging.INFO, "kept %s", 1, extra={'room_id': 3, 'sample_rate': 1})
@@ -0,0 +1,126 @@
+"""
+Outbox emails are queued in the caller's transaction and delivered with retries.
+
+Django's test runner swaps in the locmem email backend, so sent messages land
+in ``mail.outbox``.
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..mail import SENDING_LEASE, deliver_pending, queue_email
+from ..models import OutboundEmail
+from ..tasks import deliver_outbound_email
+
+
+def failing_send(self, messages):
+    raise OSError("SMTP is down")
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_BASE=30, EMAIL_OUTBOX_RETRY_MAX=45)
+class OutboxTests(TestCase):
+    def queue(self, **kwargs):
+        return queue_email('Hello', 'Plain body', ['to@example.com'], **kwargs)
+
+    def assertDueIn(self, email, seconds):
+        email.refresh_from_db()
+        delay = (email.next_attempt_at - timezone.now()).total_seconds()
+        self.assertAlmostEqual(delay, seconds, delta=5)
+
+    def test_queueing_stores_the_row_and_publishes_after_commit(self):
+        with mock.patch.object(deliver_outbound_email, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                email = self.queue(html_message='<p>Hi</p>')
+                self.assertFalse(apply_async.called)
+        self.assertEqual(len(callbacks), 1)
+        apply_async.assert_called_once_with(args=[[email.pk]], retry=False)
+        self.assertEqual((email.status, email.attempts, email.to), ('pending', 0, ['to@example.com']))
+        self.assertEqual(mail.outbox, [])
+
+    def test_publish_failure_leaves_the_row_for_the_sweep(self):
+        with mock.patch.object(deliver_outbound_email, 'apply_async', side_effect=ConnectionError), \
+                self.assertLogs('myapp.mail', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                email = self.queue()
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'pending')
+
+    def test_delivery_sends_and_marks_sent(self):
+        email = self.queue(html_message='<p>Hi</p>')
+        self.assertEqual(deliver_pending(), {'sent': 1, 'retry': 0, 'failed': 0, 'retry_in': None})
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual((message.subject, message.to), ('Hello', ['to@example.com']))
+        self.assertEqual(message.alternatives[0][0], '<p>Hi</p>')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ('sent', 1, ''))
+        self.assertIsNotNone(email.sent_at)
+        # Sent rows are never claimed again
+        self.assertEqual(deliver_pending()['sent'], 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_claiming_skips_leased_and_future_rows(self):
+        leased = self.queue()
+        OutboundEmail.objects.filter(pk=leased.pk).update(
+            status='sending', next_attempt_at=timezone.now() + SENDING_LEASE,
+        )
+        later = self.queue()
+        OutboundEmail.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+        other = self.queue()
+
+        self.assertEqual(deliver_pending(ids=[leased.pk, later.pk])['sent'], 0)
+        self.assertEqual(deliver_pending()['sent'], 1)
+        self.assertEqual(mail.outbox[0].to, ['to@example.com'])
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'sent')
+
+        # A worker that died mid-send loses its lease
+        OutboundEmail.objects.filter(pk=leased.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliver_pending()['sent'], 1)
+
+    def test_claims_lock_rows_with_skip_locked(self):
+        self.queue()
+        with mock.patch('django.db.models.QuerySet.select_for_update', autospec=True,
+                        side_effect=lambda queryset, **kwargs: queryset) as select_for_update:
+            deliver_pending()
+        self.assertEqual(select_for_update.call_args.kwargs, {'skip_locked': True})
+
+    def test_failures_back_off_then_give_up(self):
+        email = self.queue()
+        with mock.patch.object(EmailBackend, 'send_messages', failing_send):
+            stats = deliver_pending()
+            self.assertEqual(stats, {'sent': 0, 'retry': 1, 'failed': 0, 'retry_in': 30})
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), ('pending', 1, 'SMTP is down'))
+            self.assertDueIn(email, 30)
+
+            # Not due yet
+            self.assertEqual(deliver_pending()['retry'], 0)
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(deliver_pending()['retry_in'], 45)  # 60, capped
+            self.assertDueIn(email, 45)
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            with self.assertLogs('myapp.mail', 'ERROR'):
+                self.assertEqual(deliver_pending()['failed'], 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 3))
+        self.assertIsNone(email.sent_at)
+        self.assertEqual(mail.outbox, [])
+
+    def test_task_retries_its_rows_until_they_are_sent(self):
+        email = self.queue()
+        with mock.patch.object(EmailBackend, 'send_messages', failing_send), \
+                mock.patch.object(deliver_outbound_email, 'retry', side_effect=RuntimeError('retry')) as retry:
+            with self.assertRaisesMessage(RuntimeError, 'retry'):
+                deliver_outbound_email.run([email.pk])
+        retry.assert_called_once_with(countdown=30)
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_outbound_email.run([email.pk])['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,99 @@
+"""
+One multiplexed socket carries several rooms and private chats.
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..membership import join_group
+from ..models import ChatMessage, ConnectionRequest, CustomUser, GroupChat, PrivateMessage
+from ..routing import websocket_urlpatterns
+from .test_query_budgets import TEST_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, METRICS_SAMPLE_RATE=0)
+class MultiplexConsumerTests(TestCase):
+    application = URLRouter(websocket_urlpatterns)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='x')
+        cls.carol = CustomUser.objects.create_user(username='carol', email='carol@example.com', password='x')
+        shared = GroupChat.objects.create(name='Shared')
+        join_group(shared, cls.alice)
+        join_group(shared, cls.bob)
+        cls.room = shared.chat_room
+        cls.closed_room = GroupChat.objects.create(name='Closed').chat_room
+        ConnectionRequest.objects.create(from_user=cls.alice, to_user=cls.bob, status='accepted')
+
+    async def connect(self, user):
+        token = RefreshToken.for_user(user).access_token
+        communicator = WebsocketCommunicator(self.application, f'/ws/multiplex/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        greeting = await communicator.receive_json_from()
+        self.assertEqual(greeting['type'], 'connection_established')
+        return communicator
+
+    async def subscribe(self, communicator, **ids):
+        await communicator.send_json_to({'type': 'subscribe', **ids})
+        return await communicator.receive_json_from()
+
+    def test_subscriptions_are_checked_and_frames_carry_their_stream(self):
+        async def run():
+            alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+            reply = await self.subscribe(
+                alice, room_ids=[self.room.pk, self.closed_room.pk], user_ids=[self.bob.pk, self.carol.pk]
+            )
+            await self.subscribe(bob, room_ids=[self.room.pk], user_ids=[self.alice.pk])
+
+            await bob.send_json_to({'type': 'message', 'stream': f'room:{self.room.pk}', 'content': 'to the room'})
+            room_message = await alice.receive_json_from()
+            await bob.send_json_to({'type': 'message', 'stream': f'private:{self.alice.pk}', 'content': 'to alice'})
+            private_message = await alice.receive_json_from()
+            await alice.send_json_to({'type': 'message', 'stream': f'room:{self.closed_room.pk}', 'content': 'x'})
+            error = await alice.receive_json_from()
+            await bob.send_json_to({'type': 'typing', 'stream': f'room:{self.room.pk}'})
+            typing = await alice.receive_json_from()
+
+            await alice.disconnect()
+            await bob.disconnect()
+            return reply, room_message, private_message, error, typing
+
+        reply, room_message, private_message, error, typing = async_to_sync(run)()
+        self.assertEqual(reply['streams'], [f'room:{self.room.pk}', f'private:{self.bob.pk}'])
+        self.assertEqual(reply['rejected'], [f'room:{self.closed_room.pk}', f'private:{self.carol.pk}'])
+        self.assertEqual(room_message['stream'], f'room:{self.room.pk}')
+        self.assertEqual(room_message['text'], 'to the room')
+        self.assertEqual(private_message['stream'], f'private:{self.bob.pk}')
+        self.assertEqual(private_message['content'], 'to alice')
+        self.assertEqual(error['type'], 'error')
+        self.assertEqual((typing['type'], typing['is_typing'], typing['stream']), ('typing', True, f'room:{self.room.pk}'))
+        self.assertEqual(ChatMessage.objects.filter(room=self.room).count(), 1)
+        self.assertEqual(PrivateMessage.objects.count(), 1)
+
+    def test_unsubscribed_stream_stops_delivery(self):
+        async def run():
+            alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+            await self.subscribe(alice, room_ids=[self.room.pk])
+            await self.subscribe(bob, room_ids=[self.room.pk])
+            await alice.send_json_to({'type': 'unsubscribe', 'streams': [f'room:{self.room.pk}']})
+            unsubscribed = await alice.receive_json_from()
+            await bob.send_json_to({'type': 'message', 'stream': f'room:{self.room.pk}', 'content': 'hello'})
+            await bob.receive_json_from()
+            try:
+                leaked = await alice.receive_json_from(timeout=0.2)
+            except asyncio.TimeoutError:
+                leaked = None
+            await alice.disconnect()
+            await bob.disconnect()
+            return unsubscribed, leaked
+
+        unsubscribed, leaked = async_to_sync(run)()
+        self.assertEqual(unsubscribed['streams'], [f'room:{self.room.pk}'])
+        self.assertIsNone(leaked)
@@ -0,0 +1,65 @@
+"""
+Presence counts sockets: a user stays online, and in a room, until their
+last socket there closes, and silent sockets age out after the TTL.
+"""
+from django.test import SimpleTestCase, override_settings
+
+from ..presence import (
+    LocalPresence, local_presence, online_user_ids, room_online_counts, user_connected, user_disconnected,
+)
+from .test_query_budgets import TEST_CACHES
+
+TTL = 60
+
+
+class LocalPresenceTests(SimpleTestCase):
+    def setUp(self):
+        self.presence = LocalPresence()
+
+    def test_user_stays_in_the_room_until_their_last_socket_closes(self):
+        self.presence.connect(1, 5, 0, TTL)
+        self.presence.connect(1, 5, 0, TTL)
+        self.presence.connect(2, 5, 0, TTL)
+
+        self.presence.disconnect(1, 5, 1, TTL)
+        self.assertEqual(self.presence.room_counts([5], 1, TTL), {5: 2})
+        self.assertEqual(self.presence.online([1, 2], 1, TTL), {1, 2})
+
+        self.presence.disconnect(1, 5, 2, TTL)
+        self.assertEqual(self.presence.room_counts([5], 2, TTL), {5: 1})
+        self.assertEqual(self.presence.online([1, 2], 2, TTL), {2})
+
+    def test_sockets_in_other_rooms_are_counted_separately(self):
+        self.presence.connect(1, 5, 0, TTL)
+        self.presence.connect(1, 6, 0, TTL)
+        self.presence.disconnect(1, 5, 1, TTL)
+        self.assertEqual(self.presence.room_counts([5, 6, 7], 1, TTL), {5: 0, 6: 1, 7: 0})
+        self.assertEqual(self.presence.online([1], 1, TTL), {1})
+
+    def test_silent_sockets_expire_after_the_ttl(self):
+        self.presence.connect(1, 5, 0, TTL)
+        self.presence.connect(2, 5, 0, TTL)
+        self.presence.heartbeat(2, 5, 30, TTL)
+
+        self.assertEqual(self.presence.online([1, 2], TTL, TTL), {1, 2})
+        self.assertEqual(self.presence.online([1, 2], TTL + 1, TTL), {2})
+        self.assertEqual(self.presence.room_counts([5], TTL + 1, TTL), {5: 1})
+        self.assertEqual(self.presence.room_counts([5], 30 + TTL + 1, TTL), {5: 0})
+
+
+@override_settings(CACHES=TEST_CACHES, PRESENCE_TTL=TTL)
+class PresenceFunctionTests(SimpleTestCase):
+    def setUp(self):
+        local_presence.clear()
+        self.addCleanup(local_presence.clear)
+
+    def test_closing_one_of_two_sockets_keeps_the_room_count(self):
+        user_connected(1, 5)
+        user_connected(1, 5)
+        user_disconnected(1, 5)
+        self.assertEqual(room_online_counts([5]), {5: 1})
+        self.assertEqual(online_user_ids([1]), {1})
+
+        user_disconnected(1, 5)
+        self.assertEqual(room_online_counts([5]), {5: 0})
+        self.assertEqual(online_user_ids([1]), set())
@@ -0,0 +1,202 @@
+"""
+Query-count and response-size budgets.
+
+Each list endpoint in myapp/urls/*.py and each WebSocket handshake runs
+against the seeded dataset (thousands of rows, see ``seed``). The test
+fails when it issues more SQL queries or returns more bytes than its
+budget. A per-row query reintroduced into a serializer multiplies the
+count by the page size and fails here long before it reaches production.
+
+Budgets are cold-cache numbers: caches are cleared before every request.
+Raise a budget only together with the change that needs it.
+"""
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..cache import local_cache
+from ..consumers import connected_user_ids
+from ..membership import room_members, rooms_for_user
+from ..models import ChatRoom, CustomUser
+from ..routing import websocket_urlpatterns
+from ..search import search_index
+from .seed import seed
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TEST_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+# (label, account, path, max queries, max response KiB); paths are formatted with the dataset
+LIST_ENDPOINT_BUDGETS = [
+    # auth/
+    ('suggested users', 'student', '/auth/suggested-users/', 4, 4),
+    ('incoming requests', 'student', '/auth/incoming-requests/', 2, 3),
+    ('outgoing requests', 'student', '/auth/outgoing-requests/', 2, 5),
+    ('connections', 'student', '/auth/connections/', 3, 8),
+    ('mutual connections', 'student', '/auth/mutual-connections/{other_student.pk}/', 6, 3),
+    # events/
+    ('events', 'student', '/events/events/', 4, 21),
+    ('my events', 'student', '/events/events/?participating=true', 4, 21),
+    ('event comments', 'student', '/events/events/{event.pk}/comments/', 3, 1),
+    ('event media', 'student', '/events/events/{event.pk}/media/', 3, 1),
+    ('event tags', 'student', '/events/events/tags/', 2, 1),
+    ('upcoming events', 'student', '/events/events/upcoming/', 3, 6),
+    ('recommended events', 'student', '/events/events/recommended/', 3, 11),
+    # groups/
+    ('joined groups', 'student', '/groups/groups/joined/', 4, 6),
+    ('joinable groups', 'student', '/groups/groups/joinable/', 4, 6),
+    ('groups', 'student', '/groups/groups/', 4, 6),
+    ('dynamic groups', 'student', '/groups/groups/dynamic/', 5, 5),
+    ('institution groups', 'student', '/groups/groups/my-institution/', 5, 7),
+    ('city hobby groups', 'student', '/groups/groups/my-city-hobbies/', 6, 3),
+    ('group suggestions', 'student', '/groups/groups/suggestions/', 4, 5),
+    # chat/
+    ('chat rooms', 'student', '/chat/chat/rooms/', 4, 7),
+    ('room messages', 'student', '/chat/chat/rooms/{room.pk}/messages/', 3, 11),
+    ('private chats', 'student', '/chat/chat/private/', 4, 13),
+    ('private messages', 'student', '/chat/chat/private/{other_student.pk}/messages/', 6, 4),
+    ('chat users', 'student', '/chat/chat/users/', 4, 7),
+    ('presence', 'student', '/chat/chat/presence/?user_ids={other_student.pk},{tutor.pk}&room_ids={room.pk}', 1, 1),
+    ('message search', 'student', '/chat/chat/search/?q=message', 5, 6),
+    # tutoring/
+    ('tutors', 'student', '/tutoring/tutors/', 4, 7),
+    ('tutors by subject', 'student', '/tutoring/tutors/?subject=Math&ordering=hourly_rate', 4, 7),
+    ('students', 'tutor', '/tutoring/students/', 3, 5),
+    ('student bookings', 'tutor', '/tutoring/students/{student.pk}/bookings/', 3, 12),
+    ('subjects', 'student', '/tutoring/subjects/', 2, 2),
+    ('bookings as student', 'student', '/tutoring/bookings/', 3, 12),
+    ('bookings as tutor', 'tutor', '/tutoring/bookings/', 3, 7),
+    ('booking calendar', 'student', '/tutoring/bookings/calendar/', 3, 4),
+    ('booking calendar ics', 'student', '/tutoring/bookings/calendar/ics/', 5, 110),
+    ('available slots', 'student', '/tutoring/bookings/available_slots/?tutor_id={tutor.pk}&date=2030-01-01', 3, 1),
+    ('reviews', 'student', '/tutoring/reviews/', 2, 5),
+    ('my earnings', 'tutor', '/tutoring/tutors/my-earnings/', 3, 1),
+]
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, METRICS_SAMPLE_RATE=0)
+class QueryBudgetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed()
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        search_index.clear()
+
+    def token_for(self, account):
+        return str(RefreshToken.for_user(getattr(self.data, account)).access_token)
+
+
+def read_body(response):
+    if not response.streaming:
+        return response.content
+    if response.is_async:
+        # Streamed as under ASGI; async_to_sync keeps the database calls on this thread
+        async def collect():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(collect)()
+    return b''.join(response.streaming_content)
+
+
+class ListEndpointBudgetTests(QueryBudgetTestCase):
+    def test_list_endpoints_stay_within_budget(self):
+        client = APIClient()
+        for label, account, path, max_queries, max_kib in LIST_ENDPOINT_BUDGETS:
+            path = path.format(**vars(self.data))
+            with self.subTest(label, path=path):
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token_for(account)}')
+                cache.clear()
+                local_cache.clear()
+                search_index.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(path)
+                    body = read_body(response)
+                self.assertEqual(response.status_code, 200, body[:500])
+                self.assertLessEqual(
+                    len(queries), max_queries,
+                    f'{label}: {len(queries)} queries, budget {max_queries}\n'
+                    + '\n'.join(q['sql'][:200] for q in queries.captured_queries),
+                )
+                self.assertLessEqual(
+                    len(body), max_kib * 1024,
+                    f'{label}: {len(body) / 1024:.1f} KiB, budget {max_kib} KiB',
+                )
+
+    def test_chat_rooms_carry_member_counts_not_members(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token_for("student")}')
+        rooms = client.get('/chat/chat/rooms/').json()['results']
+        self.assertTrue(rooms)
+        members = {room.pk: room_members(room).count() for room in ChatRoom.objects.filter(pk__in=[r['id'] for r in rooms])}
+        for room in rooms:
+            self.assertNotIn('members', room)
+            self.assertEqual(room['member_count'], members[room['id']])
+
+
+class HandshakeBudgetTests(QueryBudgetTestCase):
+    # WebsocketCommunicator runs the consumer's database calls on this thread,
+    # inside the test transaction, so the seeded rows are visible and counted
+    application = URLRouter(websocket_urlpatterns)
+
+    def handshake(self, path):
+        async def run():
+            communicator = WebsocketCommunicator(self.application, path)
+            connected, _ = await communicator.connect()
+            greeting = await communicator.receive_json_from() if connected else None
+            await communicator.disconnect()
+            return connected, greeting
+
+        with CaptureQueriesContext(connection) as queries:
+            connected, greeting = async_to_sync(run)()
+        return connected, greeting, len(queries)
+
+    def test_chat_room_handshake(self):
+        connected, greeting, queries = self.handshake(
+            f'/ws/chat/{self.data.room.pk}/?token={self.token_for("student")}'
+        )
+        self.assertTrue(connected)
+        self.assertEqual(greeting['type'], 'connection_established')
+        self.assertLessEqual(queries, 3)
+
+    def test_private_chat_handshake(self):
+        connected, greeting, queries = self.handshake(
+            f'/ws/private/{self.data.other_student.pk}/?token={self.token_for("student")}'
+        )
+        self.assertTrue(connected)
+        self.assertEqual(greeting['type'], 'connection_established')
+        self.assertLessEqual(queries, 3)
+
+    def test_multiplex_handshake_and_subscribe(self):
+        # One socket for every room and private chat costs one query to open
+        # and one per kind of stream to subscribe, whatever the counts
+        student = self.data.student
+        room_ids = list(rooms_for_user(student).values_list('pk', flat=True))
+        user_ids = sorted(connected_user_ids(student.pk, list(CustomUser.objects.values_list('pk', flat=True))))
+
+        async def run():
+            communicator = WebsocketCommunicator(self.application, f'/ws/multiplex/?token={self.token_for("student")}')
+            connected, _ = await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({'type': 'subscribe', 'room_ids': room_ids, 'user_ids': user_ids})
+            reply = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, reply
+
+        with CaptureQueriesContext(connection) as queries:
+            connected, reply = async_to_sync(run)()
+        self.assertTrue(connected)
+        self.assertEqual(len(reply['streams']), len(room_ids) + len(user_ids))
+        self.assertGreater(len(reply['streams']), 10)
+        self.assertLessEqual(len(queries), 3)
+
+    def test_rejected_handshake_is_cheap(self):
+        connected, _, queries = self.handshake(f'/ws/chat/{self.data.room.pk}/?token=invalid')
+        self.assertFalse(connected)
+        self.assertLessEqual(queries, 0)
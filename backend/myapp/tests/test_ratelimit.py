@@ -0,0 +1,85 @@
+"""
+Oversized and too frequent frames are shed before any database work.
+"""
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..membership import join_group
+from ..models import ChatMessage, CustomUser, GroupChat
+from ..ratelimit import TokenBucket, _utf8_size_over, local_buckets
+from ..routing import websocket_urlpatterns
+from .test_query_budgets import TEST_CACHES, TEST_CHANNEL_LAYERS
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_refills_at_rate_up_to_burst(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        now = bucket.updated
+        self.assertEqual([bucket.take(now=now) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(now=now), 0.5)
+        self.assertEqual(bucket.take(now=now + 0.5), 0)
+        bucket.take(now=now + 100)
+        self.assertEqual(bucket.tokens, 2)
+
+
+class FrameSizeTests(SimpleTestCase):
+    def test_frame_size_counts_utf8_bytes(self):
+        self.assertFalse(_utf8_size_over('x' * 1000, 1000))
+        self.assertTrue(_utf8_size_over('x' * 1001, 1000))
+        # 600 characters, 1200 bytes
+        self.assertTrue(_utf8_size_over('é' * 600, 1000))
+        self.assertFalse(_utf8_size_over('é' * 500, 1000))
+        self.assertTrue(_utf8_size_over('😀' * 251, 1000))
+
+
+@override_settings(
+    CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, METRICS_SAMPLE_RATE=0,
+    WS_MAX_FRAME_BYTES=1000, WS_MAX_MESSAGE_LENGTH=50, WS_CONNECTION_RATE=0.01, WS_CONNECTION_BURST=8,
+    WS_USER_RATE=0.01, WS_USER_BURST=3, WS_MAX_VIOLATIONS=6,
+)
+class ConsumerLimitTests(TestCase):
+    application = URLRouter(websocket_urlpatterns)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        group = GroupChat.objects.create(name='Limits')
+        join_group(group, cls.alice)
+        cls.room = group.chat_room
+
+    def setUp(self):
+        local_buckets.clear()
+
+    def test_frames_beyond_the_limits_get_error_codes_and_then_a_close(self):
+        token = RefreshToken.for_user(self.alice).access_token
+
+        async def run():
+            communicator = WebsocketCommunicator(self.application, f'/ws/chat/{self.room.pk}/?token={token}')
+            await communicator.connect()
+            await communicator.receive_json_from()
+            replies = []
+            frames = [
+                {'type': 'message', 'content': 'x' * 2000},
+                {'type': 'message', 'content': 'x' * 51},
+            ] + [{'type': 'message', 'content': f'hello {n}'} for n in range(4)]
+            for frame in frames:
+                await communicator.send_json_to(frame)
+                replies.append(await communicator.receive_json_from())
+            # The oversized frame was shed before the bucket, so three frames are left
+            for _ in range(10):
+                await communicator.send_json_to({'type': 'ping'})
+            while True:
+                output = await communicator.receive_output()
+                if output['type'] == 'websocket.close':
+                    return replies, output['code']
+                replies.append(output)
+
+        replies, close_code = async_to_sync(run)()
+        codes = [reply.get('code') for reply in replies[:6]]
+        self.assertEqual(codes, ['frame_too_large', 'message_too_long', None, None, None, 'rate_limited'])
+        self.assertGreater(replies[5]['retry_after'], 0)
+        self.assertEqual(ChatMessage.objects.filter(room=self.room).count(), 3)
+        self.assertEqual(close_code, 4029)
@@ -0,0 +1,79 @@
+"""
+Reconnecting sockets replay only what they missed, capped, before live messages.
+"""
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..consumers import private_chat_between
+from ..membership import join_group
+from ..models import ChatMessage, ConnectionRequest, CustomUser, GroupChat, PrivateMessage
+from ..routing import websocket_urlpatterns
+from .test_query_budgets import TEST_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, RESUME_MAX_MESSAGES=3, METRICS_SAMPLE_RATE=0)
+class ResumeTests(TestCase):
+    application = URLRouter(websocket_urlpatterns)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='x')
+        group = GroupChat.objects.create(name='Resume')
+        join_group(group, cls.alice)
+        join_group(group, cls.bob)
+        cls.room = group.chat_room
+        cls.room_messages = [
+            ChatMessage.objects.create(room=cls.room, sender=cls.bob, text=f'room {n}') for n in range(6)
+        ]
+        ConnectionRequest.objects.create(from_user=cls.alice, to_user=cls.bob, status='accepted')
+        chat = private_chat_between(cls.alice.pk, cls.bob.pk)
+        cls.private_messages = [
+            PrivateMessage.objects.create(chat=chat, sender=cls.bob, content=f'private {n}') for n in range(2)
+        ]
+
+    def frames(self, path, after_connect=None):
+        token = RefreshToken.for_user(self.alice).access_token
+        separator = '&' if '?' in path else '?'
+
+        async def run():
+            communicator = WebsocketCommunicator(self.application, f'{path}{separator}token={token}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            frames = [await communicator.receive_json_from()]
+            if after_connect:
+                await communicator.send_json_to(after_connect)
+            while frames[-1]['type'] != 'resume_complete':
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return frames
+
+        return async_to_sync(run)()
+
+    def test_room_replays_missed_messages_up_to_the_cap(self):
+        last_seen = self.room_messages[1].pk
+        frames = self.frames(f'/ws/chat/{self.room.pk}/?last_id={last_seen}')
+        replayed = [frame for frame in frames if frame['type'] == 'message']
+        self.assertEqual([frame['id'] for frame in replayed], [m.pk for m in self.room_messages[2:5]])
+        self.assertEqual(frames[-1]['last_id'], self.room_messages[4].pk)
+        self.assertTrue(frames[-1]['truncated'])
+
+        frames = self.frames(f'/ws/chat/{self.room.pk}/?last_id={self.room_messages[4].pk}')
+        self.assertEqual([frame['text'] for frame in frames if frame['type'] == 'message'], ['room 5'])
+        self.assertFalse(frames[-1]['truncated'])
+
+    def test_private_chat_and_multiplex_resume(self):
+        frames = self.frames(f'/ws/private/{self.bob.pk}/?last_id={self.private_messages[0].pk}')
+        self.assertEqual([frame['content'] for frame in frames if frame['type'] == 'message'], ['private 1'])
+
+        stream = f'private:{self.bob.pk}'
+        frames = self.frames('/ws/multiplex/', {
+            'type': 'subscribe', 'user_ids': [self.bob.pk], 'last_ids': {stream: self.private_messages[1].pk},
+        })
+        self.assertEqual(frames[-1], {
+            'type': 'resume_complete', 'last_id': self.private_messages[1].pk,
+            'replayed': 0, 'truncated': False, 'stream': stream,
+        })
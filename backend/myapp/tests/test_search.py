@@ -0,0 +1,102 @@
+"""
+Message search returns only what the caller can read, best match first, in
+keyset pages that neither repeat nor skip results.
+"""
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ..consumers import private_chat_between
+from ..membership import join_group
+from ..models import ChatMessage, ConnectionRequest, CustomUser, GroupChat, PrivateMessage
+from ..search import search_index
+
+
+class MessageSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='x')
+        cls.carol = CustomUser.objects.create_user(username='carol', email='carol@example.com', password='x')
+        joined = GroupChat.objects.create(name='Joined')
+        join_group(joined, cls.alice)
+        join_group(joined, cls.bob)
+        other = GroupChat.objects.create(name='Other')
+        join_group(other, cls.carol)
+        cls.room, cls.other_room = joined.chat_room, other.chat_room
+        ConnectionRequest.objects.create(from_user=cls.alice, to_user=cls.bob, status='accepted')
+        cls.chat = private_chat_between(cls.alice.pk, cls.bob.pk)
+
+    def setUp(self):
+        # Rebuilt from this test's rows on first search
+        search_index.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def search(self, **params):
+        response = self.client.get('/chat/chat/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_results_are_scoped_ranked_and_marked(self):
+        loose = ChatMessage.objects.create(room=self.room, sender=self.bob, text='the exam is on friday, bring pencils and a calculator')
+        exact = ChatMessage.objects.create(room=self.room, sender=self.bob, text='exam <notes>: exam')
+        private = PrivateMessage.objects.create(chat=self.chat, sender=self.bob, content='good luck on the exam')
+        ChatMessage.objects.create(room=self.other_room, sender=self.carol, text='exam answers')
+        ChatMessage.objects.create(room=self.room, sender=self.bob, text='nothing to see')
+
+        body = self.search(q='exam')
+        self.assertEqual([(r['kind'], r['id']) for r in body['results']],
+                         [('room', exact.pk), ('private', private.pk), ('room', loose.pk)])
+        self.assertIsNone(body['next_cursor'])
+        self.assertEqual(body['results'][0]['snippet'], '<mark>exam</mark> &lt;notes&gt;: <mark>exam</mark>')
+        self.assertEqual(body['results'][1]['other_user_id'], self.bob.pk)
+
+        self.assertEqual([r['id'] for r in self.search(q='exam', scope='private')['results']], [private.pk])
+        self.assertEqual(self.search(q='exam', room_id=self.other_room.pk)['results'], [])
+
+    def test_keyset_pages_cover_every_match_once(self):
+        ids = {ChatMessage.objects.create(room=self.room, sender=self.bob, text='same words').pk for _ in range(5)}
+        ids.add(PrivateMessage.objects.create(chat=self.chat, sender=self.bob, content='same words').pk)
+        seen, cursor = [], None
+        while True:
+            body = self.search(q='same words', page_size=2, **({'cursor': cursor} if cursor else {}))
+            seen += [(r['kind'], r['id']) for r in body['results']]
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+    @skipUnless(connection.vendor == 'postgresql', "ranks come from ts_rank")
+    def test_equal_ts_rank_pages_neither_repeat_nor_skip(self):
+        # ts_rank values aren't exact doubles; ties are only found again if the
+        # cursor's rank is compared at the precision it was read at
+        ids = {('room', ChatMessage.objects.create(room=self.room, sender=self.bob, text='exam notes').pk)
+               for _ in range(5)}
+        ids |= {('private', PrivateMessage.objects.create(chat=self.chat, sender=self.bob, content='exam notes').pk)
+                for _ in range(2)}
+        seen, ranks, cursor = [], set(), None
+        while True:
+            body = self.search(q='exam notes', page_size=2, **({'cursor': cursor} if cursor else {}))
+            seen += [(r['kind'], r['id']) for r in body['results']]
+            ranks |= {r['rank'] for r in body['results']}
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(ranks), 1)
+        self.assertEqual(len(seen), len(ids))
+        self.assertEqual(set(seen), ids)
+
+    def test_new_and_deleted_messages_update_the_index(self):
+        self.assertEqual(self.search(q='rescheduled')['results'], [])
+        message = ChatMessage.objects.create(room=self.room, sender=self.bob, text='meeting rescheduled')
+        self.assertEqual([r['id'] for r in self.search(q='rescheduled')['results']], [message.pk])
+        message.delete()
+        self.assertEqual(self.search(q='rescheduled')['results'], [])
+
+    def test_bad_requests(self):
+        for params in ({'q': 'a'}, {'q': 'exam', 'scope': 'nope'}, {'q': 'exam', 'cursor': 'garbage'}):
+            self.assertEqual(self.client.get('/chat/chat/search/', params).status_code, 400, params)
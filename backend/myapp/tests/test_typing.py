@@ -0,0 +1,81 @@
+"""
+Typing indicators are coalesced per sender and never echoed to the sender.
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..membership import join_group
+from ..models import CustomUser, GroupChat
+from ..routing import websocket_urlpatterns
+from .test_query_budgets import TEST_CHANNEL_LAYERS
+
+WINDOW = 0.3
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, TYPING_WINDOW=WINDOW, METRICS_SAMPLE_RATE=0)
+class TypingIndicatorTests(TestCase):
+    application = URLRouter(websocket_urlpatterns)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='x')
+        group = GroupChat.objects.create(name='Typing')
+        join_group(group, cls.alice)
+        join_group(group, cls.bob)
+        cls.room = group.chat_room
+
+    async def connect(self, user):
+        token = RefreshToken.for_user(user).access_token
+        communicator = WebsocketCommunicator(self.application, f'/ws/chat/{self.room.pk}/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        return communicator
+
+    async def typing_events(self, communicator, timeout):
+        events = []
+        while True:
+            try:
+                event = await communicator.receive_json_from(timeout=timeout)
+            except asyncio.TimeoutError:
+                return events
+            if event['type'] == 'typing':
+                events.append(event)
+
+    def test_burst_of_frames_becomes_one_start_and_one_stop(self):
+        async def run():
+            alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+            for _ in range(20):
+                await alice.send_json_to({'type': 'typing'})
+            received = await self.typing_events(bob, timeout=WINDOW * 3)
+            echoed = await self.typing_events(alice, timeout=0.05)
+            await alice.disconnect()
+            await bob.disconnect()
+            return received, echoed
+
+        received, echoed = async_to_sync(run)()
+        self.assertEqual([event['is_typing'] for event in received], [True, False])
+        self.assertEqual(received[0]['sender']['id'], self.alice.pk)
+        self.assertEqual(received[0]['room_id'], str(self.room.pk))
+        self.assertEqual(echoed, [])
+
+    def test_message_and_explicit_stop_end_typing(self):
+        async def run():
+            alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+            await alice.send_json_to({'type': 'typing'})
+            await alice.send_json_to({'type': 'typing', 'is_typing': False})
+            await alice.send_json_to({'type': 'typing'})
+            await alice.send_json_to({'type': 'message', 'content': 'hi'})
+            received = await self.typing_events(bob, timeout=WINDOW * 2)
+            await alice.disconnect()
+            await bob.disconnect()
+            return received
+
+        received = async_to_sync(run)()
+        self.assertEqual([event['is_typing'] for event in received], [True, False, True, False])
@@ -0,0 +1,102 @@
+"""
+Typing indicators with bounded channel-layer traffic.
+
+Clients send a ``typing`` frame on every keystroke or so. Each socket
+turns those frames into one start/stop state instead of forwarding them:
+- The first frame broadcasts ``is_typing: true``.
+- Further frames only push the deadline back. While they keep coming, the
+  start is repeated at most once per ``TYPING_WINDOW`` seconds, so
+  receivers can expire a stale indicator on their own.
+- A window without frames, an explicit ``{"type": "typing", "is_typing":
+  false}``, a sent message or a disconnect broadcasts ``is_typing: false``.
+
+A sender therefore causes at most one group_send per window plus one stop,
+however fast the client emits frames. Receivers drop events from their own
+user, so the sender's sockets never see their own indicator.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from .frames import broadcast_event, frame_text
+
+logger = logging.getLogger(__name__)
+
+
+class TypingConsumerMixin:
+    """
+    Needs ``self.user``, ``self.channel_layer``, ``self.room_group_name``
+    and ``typing_context()``: the fields that tell receivers where the
+    typing happens. The holder doesn't have to be a consumer; the multiplex
+    consumer keeps one per subscription.
+    """
+    _typing_active = False
+    _typing_last_frame = 0.0
+    _typing_last_sent = 0.0
+    _typing_task = None
+
+    def typing_context(self):
+        return {}
+
+    async def typing_frame(self, data):
+        if data.get('is_typing', True) is False:
+            await self.typing_stop()
+            return
+        now = time.monotonic()
+        self._typing_last_frame = now
+        if not self._typing_active or now - self._typing_last_sent >= settings.TYPING_WINDOW:
+            self._typing_active = True
+            await self._typing_broadcast(True)
+        if self._typing_task is None or self._typing_task.done():
+            self._typing_task = asyncio.create_task(self._typing_expire())
+
+    async def typing_stop(self):
+        if not self._typing_active:
+            return
+        self._typing_active = False
+        await self._typing_broadcast(False)
+
+    async def typing_disconnect(self):
+        task, self._typing_task = self._typing_task, None
+        if task is not None and not task.done():
+            task.cancel()
+        await self.typing_stop()
+
+    async def _typing_expire(self):
+        try:
+            while self._typing_active:
+                remaining = self._typing_last_frame + settings.TYPING_WINDOW - time.monotonic()
+                if remaining <= 0:
+                    await self.typing_stop()
+                    return
+                await asyncio.sleep(remaining)
+        except Exception as e:
+            logger.error("Error expiring typing state: %s", e)
+
+    async def _typing_broadcast(self, is_typing):
+        self._typing_last_sent = time.monotonic()
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            broadcast_event(
+                'typing_notification',
+                self.room_group_name,
+                {
+                    'type': 'typing',
+                    'is_typing': is_typing,
+                    'sender': {
+                        'id': self.user.id,
+                        'username': self.user.username
+                    },
+                    **self.typing_context(),
+                },
+                sender_id=self.user.id
+            )
+        )
+
+    async def typing_notification(self, event):
+        """Send another user's typing state to this WebSocket"""
+        if event.get('sender_id') == self.user.id:
+            return
+        await self.send(text_data=frame_text(event))
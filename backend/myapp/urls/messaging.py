@@ -16,5 +16,7 @@ urlpatterns = [
     path('chat/private/<int:user_id>/messages/', views.PrivateMessageListView.as_view(), name='private-messages'),
     path('chat/private/<int:user_id>/send/', views.SendPrivateMessageView.as_view(), name='send-private-message'),
     path('chat/users/', views.UserChatsListView.as_view(), name='user-chats-list'),
+    path('chat/presence/', views.PresenceView.as_view(), name='presence'),
+    path('chat/search/', views.MessageSearchView.as_view(), name='message-search'),
 ]
 
@@ -14,8 +14,9 @@ router.register(r'bookings', BookingViewSet)
 router.register(r'reviews', ReviewViewSet)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    # Before the router, whose tutors/<pk>/ route would otherwise match it
     path('tutors/my-earnings/', TutorViewSet.as_view({'get': 'my_earnings'}), name='my-earnings'),
+    path('', include(router.urls)),
     path('user/student/<int:user_id>/', StudentUserDetailView.as_view(), name='student-user-detail'),
     path('user/tutor/<int:user_id>/', TutorDetailView.as_view(), name='tutor-user-detail'),
 ]
\ No newline at end of file
@@ -1,8 +1,8 @@
-from django.core.mail import send_mail
 from django.conf import settings
 import jwt
 import datetime
-from django.contrib.auth.models import Group
+
+from .mail import queue_email
 
 
 def create_temp_jwt(payload, expires_in=300):  # 5 minutes default
@@ -28,13 +28,7 @@ def send_otp_email(email, otp):
     from_email = settings.DEFAULT_FROM_EMAIL
     recipient_list = [email]
     
-    return send_mail(
-        subject,
-        message,
-        from_email,
-        recipient_list,
-        fail_silently=False,
-    )
+    return queue_email(subject, message, recipient_list, from_email=from_email)
 
 def send_booking_confirmation(booking):
     """
@@ -49,7 +43,7 @@ def send_booking_confirmation(booking):
     
     Details:
     Subject: {booking.subject}
-    Date: {booking.start_time.strftime('%A, %B %d, %Y')}
+    Date: {booking.date.strftime('%A, %B %d, %Y')}
     Time: {booking.start_time.strftime('%I:%M %p')} - {booking.end_time.strftime('%I:%M %p')}
     
     Meeting link: {booking.meeting_link}
@@ -57,13 +51,7 @@ def send_booking_confirmation(booking):
     Thank you for using our platform!
     """
     
-    send_mail(
-        student_subject,
-        student_message,
-        settings.DEFAULT_FROM_EMAIL,
-        [booking.student.email],
-        fail_silently=False,
-    )
+    queue_email(student_subject, student_message, [booking.student.email])
     
     # Tutor email
     tutor_subject = f"New Booking: {booking.subject}"
@@ -75,7 +63,7 @@ def send_booking_confirmation(booking):
     Details:
     Student: {booking.student.username}
     Subject: {booking.subject}
-    Date: {booking.start_time.strftime('%A, %B %d, %Y')}
+    Date: {booking.date.strftime('%A, %B %d, %Y')}
     Time: {booking.start_time.strftime('%I:%M %p')} - {booking.end_time.strftime('%I:%M %p')}
     
     Meeting link: {booking.meeting_link}
@@ -83,25 +71,4 @@ def send_booking_confirmation(booking):
     Thank you for using our platform!
     """
     
-    send_mail(
-        tutor_subject,
-        tutor_message,
-        settings.DEFAULT_FROM_EMAIL,
-        [booking.tutor.email],
-        fail_silently=False,
-    )
-
-def assign_user_to_dynamic_group(user, role, city, institution=None, qualification=None):
-    if role == "student" and institution and city:
-        group_name = f"Students in {city} at {institution}"
-    elif role == "tutor" and city :
-        group_name = f"Tutors in {city}"
-    elif role == "service provider" and city:
-        group_name = f"Jobseekers in {city}"
-    elif role == "hs student" and city:
-        group_name = f"High School Students in {city}"
-    else:
-        group_name = f"{role.title()}s in {city}" 
-
-    group, _ = Group.objects.get_or_create(name=group_name)
-    user.groups.add(group)  
\ No newline at end of file
+    queue_email(tutor_subject, tutor_message, [booking.tutor.email])
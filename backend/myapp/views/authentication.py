@@ -8,14 +8,13 @@ import uuid
 from django.db.models import Q
 
 
-from django.contrib.auth import authenticate, login, logout
-from django.core.mail import send_mail
+from django.contrib.auth import authenticate, logout
+from django.contrib.auth.models import update_last_login
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_str
 from django.conf import settings
-from django.contrib.auth.models import Group
 from django.contrib.auth.tokens import default_token_generator
 
 from rest_framework import status
@@ -28,11 +27,14 @@ from rest_framework import status
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from ..models.messaging import ChatRoom
 from ..models.authentication import  ConnectionRequest
 from myapp.utils import  create_temp_jwt
-from .groups import assign_user_to_dynamic_group
-from ..models import CustomUser, StudentProfile, TutorProfile, HStudents, ServiceProvider,JobSeeker,GroupChat
+from ..membership import assign_user_to_dynamic_group
+from ..mail import queue_email
+from ..pagination import NewestFirstCursorPagination, paginate
+from ..presence import online_user_ids
+from ..profiles import get_profile, get_role_profiles, normalize_role, with_profiles
+from ..models import CustomUser, StudentProfile, TutorProfile, HStudents, ServiceProvider,JobSeeker
 from ..serializers.authentication import ConnectionRequestSerializer, PublicUserSerializer, StudentProfileSerializer, TutorProfileSerializer, UserSerializer, UserRegistrationSerializer
 import logging
 from django.db.models import Q
@@ -188,19 +190,12 @@ class StudentUserDetailView(APIView):
     
     def get(self, request, user_id):
         try:
-            user = CustomUser.objects.get(id=user_id)
+            user = with_profiles().get(id=user_id)
             
             # Get student profile if exists
-            student_profile = None
-            if hasattr(user, 'student_profile'):
-                student_profile = user.student_profile
-                student_id = student_profile.id
-            elif hasattr(user, 'student_profile'):
-                    student_profile = user.student_profile
-                    student_id = student_profile.id
-            else:
-            # If no separate student profile, use user's pk
-                    student_id = user.pk
+            student_profile = get_profile(user, 'student')
+            # StudentProfile is keyed by the user, so its pk is the user's pk either way
+            student_id = student_profile.pk if student_profile else user.pk
 
             # Prepare response data
             return Response({
@@ -210,7 +205,7 @@ class StudentUserDetailView(APIView):
                 'first_name': user.first_name,
                 'last_name': user.last_name,
                 'student_id': student_id,  # Add this field
-                'student_profile': student_profile.id if student_profile else None
+                'student_profile': student_profile.pk if student_profile else None
             })            
             return Response(response_data, status=status.HTTP_200_OK)
         
@@ -225,12 +220,10 @@ class TutorViewSet(APIView):
     
     def get(self, request, user_id):
         try:
-            user = CustomUser.objects.get(id=user_id)
+            user = with_profiles().get(id=user_id)
             
-            # Get student profile if exists
-            tutor_profile = None
-            if hasattr(user, 'tutor_profile'):
-                tutor_profile = user.tutor_profile
+            # Get tutor profile if exists
+            tutor_profile = get_profile(user, 'tutor')
             
             # Prepare response data
             response_data = {
@@ -292,19 +285,9 @@ class SignUpView(APIView):
         Your Ispani Team
         """
 
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
-            )
-            return Response({"message": "Verification code sent to your email"}, 
-                          status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"error": f"Failed to send email: {str(e)}"}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        queue_email(subject, message, [email])
+        return Response({"message": "Verification code sent to your email"}, 
+                      status=status.HTTP_200_OK)
 
 
 class VerifyOTPView(APIView):
@@ -349,55 +332,6 @@ class VerifyOTPView(APIView):
             "temp_token": temp_token,
         }, status=status.HTTP_200_OK)
 
-def assign_user_to_dynamic_group(user, role, city, institution=None, qualification=None):
-    """Create and assign user to dynamic groups based on their role and location"""
-    if role == "student" and institution and city:
-        group_name = f"Students in {city} at {institution}"
-    elif role == "tutor" and city:
-        group_name = f"Tutors in {city}"
-    elif role == "service provider" and city:
-        group_name = f"Service Providers in {city}"
-    elif role == "jobseeker" and city:
-        group_name = f"Jobseekers in {city}"
-    elif role == "hs student" and city:
-        group_name = f"High School Students in {city}"
-    else:
-        group_name = f"{role.title()}s in {city}" 
-
-    try:
-        # Create Django auth group (for permissions)
-        auth_group, created = Group.objects.get_or_create(name=group_name)
-        user.groups.add(auth_group)
-        
-        # Create or get corresponding GroupChat
-        group_chat, created = GroupChat.objects.get_or_create(
-            name=group_name,
-            city=city,
-            institution=institution if role == "student" else "",
-            defaults={
-                'created_by': user,
-                'is_dynamic': True,  # Mark as dynamic group
-            }
-        )
-        
-        # Add user to the group chat
-        group_chat.members.add(user)
-        
-        # Create corresponding ChatRoom for WebSocket functionality
-        chat_room, created = ChatRoom.objects.get_or_create(
-            id=group_chat.id,
-            defaults={'name': group_name}
-        )
-        chat_room.members.add(user)
-        
-        print(f"Successfully added user {user.username} to dynamic group: {group_name}")
-        return group_chat
-        
-    except Exception as e:
-        print(f"Error creating dynamic group for user {user.username}: {str(e)}")
-        return None
-
-
 class CompleteRegistrationView(APIView):
     permission_classes = [AllowAny]
 
@@ -555,7 +489,9 @@ class LoginView(APIView):
             authenticated_user = authenticate(username=user.username, password=password)
 
             if authenticated_user and authenticated_user.is_active:
-                login(request, authenticated_user)
+                # Token-only: no server-side session is created for API logins,
+                # so last_login is not updated by login() either
+                update_last_login(None, authenticated_user)
                 refresh = RefreshToken.for_user(authenticated_user)
 
                 return Response({
@@ -618,21 +554,9 @@ class ForgotPasswordView(APIView):
         Your Ispani Team
         """
 
-        # Send the email
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
-            )
-            return Response({"message": "Password reset link sent to your email."}, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response(
-                {"error": f"Failed to send email: {str(e)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        # Queue the email; the outbox worker delivers it
+        queue_email(subject, message, [email])
+        return Response({"message": "Password reset link sent to your email."}, status=status.HTTP_200_OK)
 
 class ResetPasswordView(APIView):
     permission_classes = [AllowAny]
@@ -718,12 +642,10 @@ class ResetPasswordView(APIView):
         </html>
         """
         
-        send_mail(
-            subject=subject,
-            message="",  # Empty message since we're using html_message
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            fail_silently=False,
+        queue_email(
+            subject,
+            "",  # Empty message since we're using html_message
+            [email],
             html_message=message,
         )
 
@@ -784,16 +706,8 @@ class SwitchRoleView(APIView):
         user = request.user
 
         # Check which roles this user actually has
-        user_roles = []
-
-        if hasattr(user, 'student_profile'):
-            user_roles.append('student')
-        if hasattr(user, 'tutor_profile'):
-            user_roles.append('tutor')
-        if hasattr(user, 'hstudents'):
-            user_roles.append('jobseeker')
-        if hasattr(user, 'serviceprovider'):
-            user_roles.append('service_provider')
+        user_roles = list(get_role_profiles(user))
+        new_role = normalize_role(new_role)
 
         # If the user has only one role, don't allow switching
         if len(user_roles) <= 1:
@@ -812,8 +726,10 @@ class SwitchRoleView(APIView):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Optionally: store role in session 
-        request.session["active_role"] = new_role
+        # Persist on the user so every client and token sees the same active role
+        if user.active_role != new_role:
+            user.active_role = new_role
+            user.save(update_fields=['active_role'])
 
         # Or just return the active role in the response
         return Response(
@@ -849,16 +765,9 @@ class SuggestedUsersView(APIView):
 
             candidates = CustomUser.objects.exclude(id__in=exclude_ids)
 
-            # Scoring
-            suggestions = []
-            for candidate in candidates:
-                score = 0
-                if user_city and getattr(candidate, 'city', None) == user_city:
-                    score += 1
-                suggestions.append((score, candidate))
-
-            suggestions.sort(key=lambda x: x[0], reverse=True)
-            top_users = [user for score, user in suggestions if score > 0][:10]
+            # Same-city users score; pick the top ten in the database instead of
+            # loading every candidate
+            top_users = list(candidates.filter(city=user_city).order_by('id')[:10]) if user_city else []
             
             if not top_users:
                 top_users = list(CustomUser.objects.exclude(id=user.id).order_by('?')[:10])
@@ -874,6 +783,7 @@ class SuggestedUsersView(APIView):
 class IncomingRequestsView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ConnectionRequestSerializer
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
         return ConnectionRequest.objects.filter(
@@ -888,7 +798,7 @@ class IncomingRequestsView(ListAPIView):
     
     def list(self, request, *args, **kwargs):
         try:
-            queryset = self.get_queryset()
+            queryset = self.paginate_queryset(self.get_queryset())
             
             # Filter out any requests with null users
             valid_requests = []
@@ -899,16 +809,17 @@ class IncomingRequestsView(ListAPIView):
                     logger.warning(f"Found connection request with null user: {req.id}")
             
             serializer = self.get_serializer(valid_requests, many=True)
-            return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
             
         except Exception as e:
             logger.error(f"Error in IncomingRequestsView: {str(e)}")
-            return Response([], status=200)  # Return empty array instead of error
+            return Response({'next': None, 'previous': None, 'results': []}, status=200)  # Empty page instead of error
 
 
 class OutgoingRequestsView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ConnectionRequestSerializer
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
         return ConnectionRequest.objects.filter(
@@ -923,7 +834,7 @@ class OutgoingRequestsView(ListAPIView):
     
     def list(self, request, *args, **kwargs):
         try:
-            queryset = self.get_queryset()
+            queryset = self.paginate_queryset(self.get_queryset())
             
             # Filter out any requests with null users
             valid_requests = []
@@ -934,11 +845,11 @@ class OutgoingRequestsView(ListAPIView):
                     logger.warning(f"Found connection request with null user: {req.id}")
             
             serializer = self.get_serializer(valid_requests, many=True)
-            return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
             
         except Exception as e:
             logger.error(f"Error in OutgoingRequestsView: {str(e)}")
-            return Response([], status=200)  # Return empty array instead of error
+            return Response({'next': None, 'previous': None, 'results': []}, status=200)  # Empty page instead of error
 
 
 class SendConnectionRequestView(APIView):
@@ -1042,20 +953,27 @@ class ConnectionsListView(APIView):
             connections = ConnectionRequest.objects.filter(
                 Q(from_user=user) | Q(to_user=user),
                 status='accepted'
-            ).select_related('from_user', 'to_user')
-
-            connected_users = []
-            for conn in connections:
-                other_user = conn.to_user if conn.from_user == user else conn.from_user
-                if other_user:  # Ensure user exists
-                    connected_users.append(other_user)
-
-            serializer = UserSerializer(connected_users, many=True, context={'request': request})
-            return Response(serializer.data)
+            ).select_related('from_user', 'to_user').order_by('-created_at', '-id')
+
+            def serialize(page):
+                connected_users = []
+                for conn in page:
+                    other_user = conn.to_user if conn.from_user == user else conn.from_user
+                    if other_user:  # Ensure user exists
+                        connected_users.append(other_user)
+
+                serializer = UserSerializer(connected_users, many=True, context={'request': request})
+                online = online_user_ids(other.id for other in connected_users)
+                data = serializer.data
+                for item in data:
+                    item['is_online'] = item['id'] in online
+                return data
+
+            return paginate(request, connections, serialize)
             
         except Exception as e:
             logger.error(f"Error in ConnectionsListView: {str(e)}")
-            return Response([], status=200)
+            return paginate(request, [], lambda page: page)
 
 # 6. Mutual Connections
 class MutualConnectionsView(APIView):
@@ -1073,18 +991,17 @@ class MutualConnectionsView(APIView):
                 status='accepted'
             )
             ids = set()
-            for conn in connections:
-                ids.add(conn.to_user.id if conn.from_user == u else conn.from_user.id)
+            for from_id, to_id in connections.values_list('from_user_id', 'to_user_id'):
+                ids.add(to_id if from_id == u.id else from_id)
             return ids
 
         user_connections = get_connected_ids(user)
         target_connections = get_connected_ids(target)
 
         mutual_ids = user_connections.intersection(target_connections)
-        mutual_users = CustomUser.objects.filter(id__in=mutual_ids)
+        mutual_users = CustomUser.objects.filter(id__in=mutual_ids).order_by('id')
 
-        serializer = UserSerializer(mutual_users, many=True)
-        return Response(serializer.data)
+        return paginate(request, mutual_users, lambda page: UserSerializer(page, many=True).data)
     
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
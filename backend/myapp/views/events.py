@@ -1,7 +1,8 @@
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Exists, OuterRef
+from django.db.models.functions import Lower
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -10,9 +11,11 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 
 
-from ..models import EventComment, EventMedia, EventParticipant, EventTag
-from ..serializers.events import EventCommentSerializer, EventDetailSerializer, EventMediaSerializer, EventParticipantSerializer, EventSerializer, EventTagSerializer
+from ..models import Event, EventComment, EventMedia, EventParticipant, EventTag, Hobby
+from ..serializers.events import EventCommentSerializer, EventDetailSerializer, EventMediaSerializer, EventParticipantSerializer, EventSerializer, EventTagSerializer, with_event_stats
 from ..models import CustomUser
+from ..cache import POPULAR_TAGS_CACHE_KEY, cached_lookup
+from ..pagination import NewestFirstCursorPagination, OldestFirstCursorPagination, paginate
 
 class EventListCreateView(APIView):
     permission_classes = [IsAuthenticated]
@@ -70,10 +73,12 @@ class EventListCreateView(APIView):
             queryset = queryset.filter(start_time__lte=date_to)
         
         # Order by start time (upcoming first)
-        queryset = queryset.filter(end_time__gte=timezone.now()).order_by('start_time')
+        queryset = queryset.filter(end_time__gte=timezone.now()).order_by('start_time', 'id')
         
-        serializer = EventSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return paginate(
+            request, with_event_stats(queryset, request.user),
+            lambda page: EventSerializer(page, many=True, context={'request': request}).data,
+        )
     
     def post(self, request):
         """Create a new event"""
@@ -239,9 +244,11 @@ class EventCommentView(APIView):
     def get(self, request, pk):
         """Get comments for an event"""
         event = get_object_or_404(Event, pk=pk)
-        comments = EventComment.objects.filter(event=event).order_by('created_at')
-        serializer = EventCommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        comments = EventComment.objects.filter(event=event).select_related('user')
+        return paginate(
+            request, comments, lambda page: EventCommentSerializer(page, many=True).data,
+            pagination_class=OldestFirstCursorPagination,
+        )
     
     def post(self, request, pk):
         """Add a comment to an event"""
@@ -270,9 +277,11 @@ class EventMediaView(APIView):
     def get(self, request, pk):
         """Get media for an event"""
         event = get_object_or_404(Event, pk=pk)
-        media = EventMedia.objects.filter(event=event)
-        serializer = EventMediaSerializer(media, many=True)
-        return Response(serializer.data)
+        media = EventMedia.objects.filter(event=event).select_related('uploaded_by')
+        return paginate(
+            request, media, lambda page: EventMediaSerializer(page, many=True).data,
+            pagination_class=NewestFirstCursorPagination,
+        )
     
     def post(self, request, pk):
         """Add media to an event"""
@@ -302,12 +311,13 @@ class EventTagsView(APIView):
     
     def get(self, request):
         """Get popular event tags"""
-        tags = EventTag.objects.annotate(
-            usage_count=Count('events')
-        ).order_by('-usage_count')[:20]  # Top 20 tags
+        def popular_tags():
+            tags = EventTag.objects.annotate(
+                usage_count=Count('events')
+            ).order_by('-usage_count', 'id')[:20]  # Top 20 tags
+            return EventTagSerializer(tags, many=True).data
         
-        serializer = EventTagSerializer(tags, many=True)
-        return Response(serializer.data)
+        return Response(cached_lookup(POPULAR_TAGS_CACHE_KEY, popular_tags))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -352,9 +362,9 @@ def upcoming_events(request):
         event__start_time__gt=now
     ).values_list('event_id', flat=True)
     
-    events = Event.objects.filter(
+    events = with_event_stats(Event.objects.filter(
         id__in=user_events
-    ).order_by('start_time')[:5]  # Get next 5 events
+    ), request.user).order_by('start_time')[:5]  # Get next 5 events
     
     serializer = EventSerializer(events, many=True, context={'request': request})
     return Response(serializer.data)
@@ -383,20 +393,19 @@ def recommended_events(request):
         id__in=past_events
     ).values_list('tags__name', flat=True).distinct()
     
-    # Find upcoming events that match user interests
-    if hasattr(user, 'student_profile'):
-        hobbies = user.student_profile.hobbies
-    else:
-        hobbies = ""
+    # Find upcoming events that match user interests: tags named like one of the user's hobbies
+    hobby_names = Hobby.objects.filter(userhobby__user=user).annotate(lname=Lower('name')).values('lname')
+    hobby_tags = Event.tags.through.objects.annotate(
+        lname=Lower('eventtag__name')
+    ).filter(event_id=OuterRef('pk'), lname__in=hobby_names)
     
-    recommended = Event.objects.filter(
+    recommended = with_event_stats(Event.objects, user).filter(
         Q(is_public=True) &
         Q(end_time__gt=now) &
         (
             Q(event_type__in=event_types) |
             Q(tags__name__in=tags) |
-            Q(description__icontains=hobbies) |
-            Q(title__icontains=hobbies)
+            Exists(hobby_tags)
         )
     ).exclude(
         participants__user=user  # Exclude events user is already participating in
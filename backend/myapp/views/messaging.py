@@ -3,11 +3,30 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics, status
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import F, OuterRef, Q, Subquery
 
 from ..models.authentication import ConnectionRequest
 from ..models import CustomUser,ChatRoom, ChatMessage, PrivateChat, PrivateMessage
-from ..serializers.messaging import ChatMessageSerializer, ChatRoomSerializer,PrivateChatSerializer, PrivateMessageSerializer
+from ..presence import online_user_ids, room_online_counts
+from ..pagination import MessageHistoryPagination, paginate
+from ..search import search_messages
+from ..serializers.messaging import ChatMessageSerializer, ChatRoomSerializer,PrivateChatSerializer, PrivateMessageSerializer, with_chat_summary, with_room_summary
+
+
+class MessageHistoryMixin:
+    """Keyset pages of a room's or chat's history, archived messages included"""
+    pagination_class = MessageHistoryPagination
+    archive_kind = None
+
+    def archive_key(self):
+        """Room or chat id whose archive to read, or None for none"""
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        messages = self.get_queryset()
+        page = self.paginator.paginate(request, messages, self.archive_kind, self.archive_key())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 class ChatRoomListCreateView(generics.ListCreateAPIView):
     queryset = ChatRoom.objects.all()
@@ -15,24 +34,24 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        """Override to add last message info"""
-        rooms = ChatRoom.objects.all()
-        return rooms
+        """Rooms with recent messages first, with their last message"""
+        newest = ChatMessage.objects.filter(room=OuterRef('pk')).order_by('-id').values('created_at')[:1]
+        return with_room_summary(
+            ChatRoom.objects.annotate(last_message_at=Subquery(newest))
+        ).order_by(F('last_message_at').desc(nulls_last=True), '-id')
 
     def list(self, request, *args, **kwargs):
         """Override list to include last message for each room"""
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        rooms = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(rooms, many=True)
+        online_counts = room_online_counts(room.id for room in rooms)
         
         # Add last message info to each room
         rooms_data = []
-        for room_data in serializer.data:
-            room_id = room_data['id']
-            
-            # Get last message for this room
-            last_message = ChatMessage.objects.filter(
-                room_id=room_id
-            ).order_by('-created_at').first()
+        for room, room_data in zip(rooms, serializer.data):
+            room_data['online_count'] = online_counts.get(room.id, 0)
+            # Newest message, prefetched by with_room_summary
+            last_message = room.latest_messages[0] if room.latest_messages else None
             
             if last_message:
                 room_data['last_message'] = {
@@ -45,21 +64,23 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
                 
             rooms_data.append(room_data)
         
-        # Sort by last message timestamp (rooms with recent messages first)
-        rooms_data.sort(
-            key=lambda x: x['last_message']['created_at'] if x['last_message'] else '', 
-            reverse=True
-        )
-        
-        return Response(rooms_data)
+        return self.get_paginated_response(rooms_data)
 
-class ChatMessageListView(generics.ListAPIView):
+class ChatMessageListView(MessageHistoryMixin, generics.ListAPIView):
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
+    archive_kind = 'room'
+
+    def archive_key(self):
+        return self.kwargs['room_id']
 
     def get_queryset(self):
         room_id = self.kwargs['room_id']
-        return ChatMessage.objects.filter(room_id=room_id).order_by('created_at')
+        return (
+            ChatMessage.objects.filter(room_id=room_id)
+            .select_related('sender')
+            .prefetch_related('attachments')
+        )
 
 class SendMessageView(APIView):
     permission_classes = [IsAuthenticated]
@@ -82,12 +103,13 @@ class PrivateChatListCreateView(APIView):
     def get(self, request):
         """Get all chats for the current user"""
         user = request.user
-        chats = PrivateChat.objects.filter(
+        chats = with_chat_summary(PrivateChat.objects.filter(
             Q(user1=user) | Q(user2=user)
-        ).order_by('created_at')
+        ), user).order_by('created_at', 'id')
         
-        serializer = PrivateChatSerializer(chats, many=True, context={'request': request})
-        return Response(serializer.data)
+        return paginate(
+            request, chats, lambda page: PrivateChatSerializer(page, many=True, context={'request': request}).data,
+        )
 
     def post(self, request):
         """Create a new chat or return existing one"""
@@ -207,9 +229,15 @@ class CreatePrivateChatView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class PrivateMessageListView(generics.ListAPIView):
+class PrivateMessageListView(MessageHistoryMixin, generics.ListAPIView):
     serializer_class = PrivateMessageSerializer
     permission_classes = [IsAuthenticated]
+    archive_kind = 'private'
+    chat = None
+
+    def archive_key(self):
+        # Set by get_queryset once the users are known to be connected
+        return self.chat.pk if self.chat else None
 
     def get_queryset(self):
         other_user_id = self.kwargs['user_id']
@@ -234,7 +262,8 @@ class PrivateMessageListView(generics.ListAPIView):
         if not chat:
             return PrivateMessage.objects.none()
             
-        return PrivateMessage.objects.filter(chat=chat).order_by('created_at')
+        self.chat = chat
+        return PrivateMessage.objects.filter(chat=chat).select_related('sender')
 
 
 class SendPrivateMessageView(APIView):
@@ -294,37 +323,46 @@ class UserChatsListView(APIView):
         connections = ConnectionRequest.objects.filter(
             Q(from_user=current_user) | Q(to_user=current_user),
             status='accepted'
-        )
+        ).select_related('from_user', 'to_user')
+        other_users = [
+            connection.to_user if connection.from_user_id == current_user.id else connection.from_user
+            for connection in connections
+        ]
+        
+        # Existing chats with those users and their last messages, in two queries
+        other_ids = [other_user.id for other_user in other_users]
+        chats = with_chat_summary(PrivateChat.objects.filter(
+            Q(user1=current_user, user2_id__in=other_ids) |
+            Q(user1_id__in=other_ids, user2=current_user)
+        ), current_user).order_by('id')
+        chat_by_user = {}
+        for chat in chats:
+            chat_by_user.setdefault(chat.user2_id if chat.user1_id == current_user.id else chat.user1_id, chat)
         
+        online = online_user_ids(other_ids)
         connected_users = []
-        for connection in connections:
-            other_user = connection.to_user if connection.from_user == current_user else connection.from_user
-            
-            # Check if chat already exists
-            existing_chat = PrivateChat.objects.filter(
-                Q(user1=current_user, user2=other_user) |
-                Q(user1=other_user, user2=current_user)
-            ).first()
+        for other_user in other_users:
+            existing_chat = chat_by_user.get(other_user.id)
             
             # Get last message if chat exists
             last_message = None
-            if existing_chat:
-                last_msg = PrivateMessage.objects.filter(chat=existing_chat).order_by('-created_at').first()
-                if last_msg:
-                    last_message = {
-                        'content': last_msg.content,
-                        'sender': last_msg.sender.username,
-                        'created_at': last_msg.created_at.isoformat()
-                    }
+            if existing_chat and existing_chat.latest_messages:
+                last_msg = existing_chat.latest_messages[0]
+                last_message = {
+                    'content': last_msg.content,
+                    'sender': last_msg.sender.username,
+                    'created_at': last_msg.created_at.isoformat()
+                }
             
             user_data = {
                 'id': other_user.id,
                 'username': other_user.username,
                 'display_name': getattr(other_user, 'display_name', other_user.username),
+                'is_online': other_user.id in online,
                 'has_existing_chat': bool(existing_chat),
                 'chat_id': existing_chat.id if existing_chat else None,
                 'last_message': last_message,
-                'created_at': existing_chat.updated_at.isoformat() if existing_chat else None
+                'created_at': existing_chat.created_at.isoformat() if existing_chat else None
             }
             connected_users.append(user_data)
         
@@ -332,4 +370,81 @@ class UserChatsListView(APIView):
         # FIXED: there was a typo in the original code (' created_at' with space)
         connected_users.sort(key=lambda x: x['created_at'] or '', reverse=True)
         
-        return Response(connected_users)
\ No newline at end of file
+        return paginate(request, connected_users, lambda page: page)
+
+
+class PresenceView(APIView):
+    """
+    Batched presence lookup: ?user_ids=1,2,3 returns which of those users are
+    online and ?room_ids=4,5 how many users are online in each room. Served
+    from the presence store; no database queries.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user_ids = self._ids(request, 'user_ids')
+            room_ids = self._ids(request, 'room_ids')
+        except ValueError:
+            return Response({'error': 'user_ids and room_ids must be comma-separated integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) + len(room_ids) > settings.PRESENCE_MAX_BATCH:
+            return Response({'error': f'At most {settings.PRESENCE_MAX_BATCH} ids per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        online = online_user_ids(user_ids)
+        return Response({
+            'online': [user_id for user_id in user_ids if user_id in online],
+            'rooms': {str(room_id): count for room_id, count in room_online_counts(room_ids).items()},
+        })
+
+    def _ids(self, request, name):
+        value = request.query_params.get(name, '')
+        return list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+
+
+class MessageSearchView(APIView):
+    """
+    Full-text search of the caller's room and private messages, best match
+    first (see myapp.search).
+
+    ?q=<words> (required), ?scope=all|rooms|private, ?room_id= or ?user_id=
+    to search one room or one private chat, ?page_size= and ?cursor= with the
+    next_cursor of the previous page.
+    """
+    permission_classes = [IsAuthenticated]
+    scopes = {'all': ('room', 'private'), 'rooms': ('room',), 'private': ('private',)}
+
+    def get(self, request):
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({'error': 'q must be at least 2 characters'}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = self.scopes.get(params.get('scope', 'all'))
+        if kinds is None:
+            return Response({'error': 'scope must be one of all, rooms, private'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            room_id = self._optional_int(params, 'room_id')
+            other_user_id = self._optional_int(params, 'user_id')
+            page_size = self._optional_int(params, 'page_size') or settings.SEARCH_PAGE_SIZE
+        except ValueError:
+            return Response({'error': 'room_id, user_id and page_size must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if room_id is not None:
+            kinds = tuple(kind for kind in kinds if kind == 'room')
+        if other_user_id is not None:
+            kinds = tuple(kind for kind in kinds if kind == 'private')
+
+        try:
+            results, next_cursor = search_messages(
+                request.user, query, kinds=kinds, room_id=room_id, other_user_id=other_user_id,
+                cursor=params.get('cursor'), limit=max(1, min(page_size, settings.SEARCH_MAX_PAGE_SIZE)),
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results, 'next_cursor': next_cursor})
+
+    def _optional_int(self, params, name):
+        value = params.get(name)
+        return int(value) if value else None
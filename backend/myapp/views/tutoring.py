@@ -2,47 +2,177 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import APIException
 from django.contrib.auth import authenticate
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Count, Exists, Max, OuterRef
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.utils import timezone
-from datetime import datetime, time, timedelta
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+from asgiref.sync import sync_to_async
+from decimal import Decimal, InvalidOperation
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers as drf_serializers
+import hashlib
 
-from ..models.tutoring  import CustomUser, TutorProfile, StudentProfile, Subject, Booking, TutorAvailability, Review
+from ..models.tutoring  import CustomUser, TutorProfile, StudentProfile, Subject, Booking, BookingConflict, TutorAvailability, Review
 from ..serializers.tutoring import (
     TutorProfileSerializer, StudentProfileSerializer, SubjectSerializer,
-    BookingSerializer, ReviewSerializer
+    BookingSerializer, ReviewSerializer, cached_subjects
 )
+from ..models.events import Event, EventParticipant
+from ..pagination import NewestFirstCursorPagination, TutorSearchPagination, paginate
+from ..profiles import get_profile, has_role, with_profiles
+from .. import ics
+
+
+CALENDAR_MAX_RANGE_DAYS = 366
+
+
+def _parse_calendar_range(params, default_days, default_start=None):
+    """Parse start_date/end_date (YYYY-MM-DD) and bound the span the feed may cover"""
+    try:
+        start_date = params.get('start_date')
+        start_date = (datetime.strptime(start_date, '%Y-%m-%d').date() if start_date
+                      else default_start or timezone.now().date())
+        end_date = params.get('end_date')
+        end_date = (datetime.strptime(end_date, '%Y-%m-%d').date() if end_date
+                    else start_date + timedelta(days=default_days))
+    except ValueError:
+        raise drf_serializers.ValidationError({'error': 'Invalid date format. Use YYYY-MM-DD'})
+
+    if end_date < start_date:
+        raise drf_serializers.ValidationError({'error': 'end_date must not be before start_date'})
+    if (end_date - start_date).days > CALENDAR_MAX_RANGE_DAYS:
+        raise drf_serializers.ValidationError(
+            {'error': f'Date range cannot exceed {CALENDAR_MAX_RANGE_DAYS} days'}
+        )
+    return start_date, end_date
+
+
+def _calendar_etag(bookings, variant, start_date, end_date, events=None):
+    """
+    Weak validator for a calendar feed built from one aggregate query per source.
+
+    Any create, update or delete inside the range changes the row count or the
+    latest updated_at, so clients polling with If-None-Match get a cheap 304.
+    """
+    parts = [variant, start_date.isoformat(), end_date.isoformat()]
+    for queryset in (bookings, events):
+        if queryset is None:
+            continue
+        stats = queryset.order_by().aggregate(total=Count('pk'), latest=Max('updated_at'))
+        parts += [str(stats['total']), stats['latest'].isoformat() if stats['latest'] else '']
+    return 'W/"%s"' % hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match requires
+    candidates = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+    return '*' in candidates or etag.removeprefix('W/') in candidates
+
+
+def _session_end(start_time, length):
+    """End of a session of ``length`` starting at ``start_time``, cut off at midnight since bookings are same-day"""
+    start = datetime.combine(datetime.min, start_time)
+    end = start + length
+    return end.time() if end.date() == start.date() else time.max
+
+
+async def _stream_in_batches(chunks, batch_size=200):
+    """
+    Async iterator over a sync iterator that reads the database, for
+    StreamingHttpResponse. Under ASGI, Django reads a sync iterator to the
+    end before sending anything; this sends each batch as it is read.
+    Batches run in the request's thread, like the view, so a server-side
+    cursor stays on its connection.
+    """
+    chunks = iter(chunks)
+    next_batch = sync_to_async(lambda: ''.join(islice(chunks, batch_size)))
+    while batch := await next_batch():
+        yield batch
+
+
+def _not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+class BookingConflictError(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The tutor already has a booking at this time'
+    default_code = 'booking_conflict'
+
 
 class TutorViewSet(viewsets.ModelViewSet):
     queryset = TutorProfile.objects.select_related('user').prefetch_related('subjects').all()
     serializer_class = TutorProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TutorSearchPagination
+
+    ORDERING_FIELDS = {'rating', '-rating', 'hourly_rate', '-hourly_rate'}
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        subject = self.request.query_params.get('subject')
-        booking_type = self.request.query_params.get('booking_type')
-        
-        if subject and subject != 'All':
-            queryset = queryset.filter(subjects__name__icontains=subject)
+        params = self.request.query_params
+        subject = params.get('subject')
+        subject_ids = params.get('subject_id')
+        booking_type = params.get('booking_type')
+        city = params.get('city')
+        min_rate = params.get('min_rate')
+        max_rate = params.get('max_rate')
+        ordering = params.get('ordering')
+
+        # Match subjects through an EXISTS on the M2M table so tutors are never
+        # duplicated and no DISTINCT over the whole result is needed
+        tutor_subjects = TutorProfile.subjects.through.objects.filter(tutorprofile_id=OuterRef('pk'))
+
+        if subject_ids:
+            try:
+                ids = [int(i) for i in subject_ids.split(',') if i.strip()]
+            except ValueError:
+                raise drf_serializers.ValidationError({'subject_id': 'Expected comma separated subject IDs'})
+            queryset = queryset.filter(Exists(tutor_subjects.filter(subject_id__in=ids)))
+        elif subject and subject != 'All':
+            # Served by the trigram index on subject names under PostgreSQL
+            queryset = queryset.filter(Exists(tutor_subjects.filter(subject__name__icontains=subject)))
         
         if booking_type == 'online':
             queryset = queryset.filter(is_available_online=True)
         elif booking_type == 'physical':
             queryset = queryset.filter(is_available_physical=True)
-        
-        return queryset.distinct()
+
+        if city:
+            queryset = queryset.filter(city=city)
+
+        try:
+            if min_rate:
+                queryset = queryset.filter(hourly_rate__gte=Decimal(min_rate))
+            if max_rate:
+                queryset = queryset.filter(hourly_rate__lte=Decimal(max_rate))
+        except InvalidOperation:
+            raise drf_serializers.ValidationError({'rate': 'min_rate and max_rate must be numbers'})
+
+        if ordering in self.ORDERING_FIELDS:
+            # user_id breaks ties so pages stay stable
+            queryset = queryset.order_by(ordering, 'user_id')
+        else:
+            queryset = queryset.order_by('-rating', 'user_id')
+
+        return queryset
 
     @action(detail=False, methods=['get'])
     def my_earnings(self, request):
         """Get earnings for the authenticated tutor"""
-        if not hasattr(request.user, 'tutor_profile'):
+        if not has_role(request.user, 'tutor'):
             return Response({'error': 'User is not a tutor'}, status=status.HTTP_403_FORBIDDEN)
         
-        tutor = request.user.tutor_profile
-        completed_bookings = Booking.objects.filter(tutor=tutor, status='completed')
+        completed_bookings = Booking.objects.filter(tutor=request.user, status='completed')
         
         total_earnings = sum(booking.total_cost or 0 for booking in completed_bookings)
         total_hours = completed_bookings.count()  # Simplified calculation
@@ -54,26 +184,34 @@ class TutorViewSet(viewsets.ModelViewSet):
         })
 
 class StudentViewSet(viewsets.ModelViewSet):
-    queryset = StudentProfile.objects.all()
+    queryset = StudentProfile.objects.order_by('pk')
     serializer_class = StudentProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=True, methods=['get'])
     def bookings(self, request, pk=None):
         student = self.get_object()
-        bookings = Booking.objects.filter(student=student)
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data)
+        bookings = Booking.objects.filter(student_id=student.pk).select_related('tutor', 'student', 'subject')
+        return paginate(
+            request, bookings, lambda page: BookingSerializer(page, many=True).data,
+            pagination_class=NewestFirstCursorPagination,
+        )
 
 class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        # The subject catalogue is read on every booking and search screen but rarely changes
+        return paginate(request, cached_subjects(), lambda page: page)
+
 class BookingViewSet(viewsets.ModelViewSet):
-    queryset = Booking.objects.all()
+    # BookingSerializer reads the tutor, student and subject names
+    queryset = Booking.objects.select_related('tutor', 'student', 'subject')
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -102,11 +240,11 @@ class BookingViewSet(viewsets.ModelViewSet):
                 return queryset.none()
         elif user_id:
             try:
-                target_user = CustomUser.objects.get(id=user_id)
+                target_user = with_profiles().get(id=user_id)
                 # Filter based on what profile the user has
-                if hasattr(target_user, 'tutor_profile'):
+                if has_role(target_user, 'tutor'):
                     queryset = queryset.filter(tutor=target_user)
-                elif hasattr(target_user, 'student_profile'):
+                elif has_role(target_user, 'student'):
                     # Assuming student field expects the user, not the profile
                     queryset = queryset.filter(student=target_user)
                 else:
@@ -115,10 +253,10 @@ class BookingViewSet(viewsets.ModelViewSet):
                 return queryset.none()
         else:
             # Default behavior: Filter bookings based on current user type
-            if hasattr(user, 'tutor_profile'):
+            if has_role(user, 'tutor'):
                 # Filter by the user, not the tutor_profile
                 queryset = queryset.filter(tutor=user)
-            elif hasattr(user, 'student_profile'):
+            elif has_role(user, 'student'):
                 # Filter by the user, not the student_profile
                 queryset = queryset.filter(student=user)
             else:
@@ -150,12 +288,12 @@ class BookingViewSet(viewsets.ModelViewSet):
                 # Get the user associated with this student profile
                 student_user = student_profile.user
             except StudentProfile.DoesNotExist:
-                if hasattr(self.request.user, 'student_profile'):
+                if has_role(self.request.user, 'student'):
                     student_user = self.request.user
                 else:
                     raise drf_serializers.ValidationError("Invalid student_id provided and user has no student profile")
         else:
-            if hasattr(self.request.user, 'student_profile'):
+            if has_role(self.request.user, 'student'):
                 student_user = self.request.user
             else:
                 raise drf_serializers.ValidationError("User must have a student profile to create bookings")
@@ -224,20 +362,37 @@ class BookingViewSet(viewsets.ModelViewSet):
                 start_time_obj = datetime.strptime(start_time_str, '%H:%M').time()
             except ValueError:
                 raise drf_serializers.ValidationError("Invalid start_time format. Use HH:MM")
-        
-        serializer.save(
-            student=student_user,
-            tutor=tutor_user,
-            subject=subject,
-            total_cost=total_cost,
-            platform=platform,
-            notes=notes,
-            date=booking_date,
-            start_time=start_time_obj,
-            booking_type=booking_type,
-            hourly_rate=hourly_rate,
-            status='pending'
-        )
+
+        # Parse end time, defaulting to a one hour session so the slot is known
+        end_time_obj = None
+        if start_time_obj:
+            if end_time_str:
+                try:
+                    end_time_obj = datetime.strptime(end_time_str, '%H:%M').time()
+                except ValueError:
+                    raise drf_serializers.ValidationError("Invalid end_time format. Use HH:MM")
+            else:
+                end_time_obj = _session_end(start_time_obj, timedelta(hours=1))
+            if end_time_obj <= start_time_obj:
+                raise drf_serializers.ValidationError("End time must be after start time")
+
+        try:
+            serializer.save(
+                student=student_user,
+                tutor=tutor_user,
+                subject=subject,
+                total_cost=total_cost,
+                platform=platform,
+                notes=notes,
+                date=booking_date,
+                start_time=start_time_obj,
+                end_time=end_time_obj,
+                booking_type=booking_type,
+                hourly_rate=hourly_rate,
+                status='pending'
+            )
+        except BookingConflict:
+            raise BookingConflictError()
         
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
@@ -377,17 +532,10 @@ class BookingViewSet(viewsets.ModelViewSet):
                 
                 # Get tutor profile to calculate new cost
                 try:
-                    if hasattr(booking.tutor, 'tutor_profile'):
-                        tutor_profile = booking.tutor.tutor_profile
+                    tutor_profile = get_profile(booking.tutor, 'tutor')
+                    # Keep existing cost if tutor profile not found
+                    if tutor_profile is not None:
                         new_total_cost = duration_hours * float(tutor_profile.hourly_rate)
-                    else:
-                        # Try to get tutor profile by user_id
-                        try:
-                            tutor_profile = TutorProfile.objects.get(user=booking.tutor)
-                            new_total_cost = duration_hours * float(tutor_profile.hourly_rate)
-                        except TutorProfile.DoesNotExist:
-                            # Keep existing cost if tutor profile not found
-                            pass
                 except (AttributeError, ValueError):
                     # Keep existing cost if calculation fails
                     pass
@@ -398,20 +546,6 @@ class BookingViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Check for scheduling conflicts with the tutor
-        conflicting_bookings = Booking.objects.filter(
-            tutor=booking.tutor,
-            date=new_date_obj,
-            start_time=new_start_time_obj,
-            status__in=['pending', 'confirmed']
-        ).exclude(id=booking.id)
-        
-        if conflicting_bookings.exists():
-            return Response(
-                {'error': 'The tutor already has a booking at this time'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Additional validation: Check if the new time is during reasonable hours
         if new_start_time_obj.hour < 6 or new_start_time_obj.hour > 22:
             return Response(
@@ -433,6 +567,11 @@ class BookingViewSet(viewsets.ModelViewSet):
             if new_end_time_obj:
                 booking.end_time = new_end_time_obj
                 booking.total_cost = new_total_cost
+            elif original_start_time and original_end_time and original_end_time > original_start_time:
+                # Keep the original session length when only the start moves
+                length = (datetime.combine(datetime.min, original_end_time)
+                          - datetime.combine(datetime.min, original_start_time))
+                booking.end_time = _session_end(new_start_time_obj, length)
             
             # Add reschedule information
             booking.rescheduled_at = timezone.now()
@@ -445,12 +584,17 @@ class BookingViewSet(viewsets.ModelViewSet):
                 # Clear meeting link if it exists, as it might need to be regenerated
                 booking.meeting_link = ''
             
-            # Save the updated booking
+            # Save the updated booking; overlapping slots are rejected on save
             booking.save()
             
             # You might want to send notifications here
             # send_reschedule_notification(booking, original_date, original_start_time)
             
+        except BookingConflict:
+            return Response(
+                {'error': BookingConflictError.default_detail},
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
             return Response(
                 {'error': f'Failed to update booking: {str(e)}'}, 
@@ -481,36 +625,74 @@ class BookingViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def calendar(self, request):
         """Get bookings for calendar view"""
-        user = request.user
-        start_date = request.query_params.get('start_date', timezone.now().date())
-        end_date = request.query_params.get('end_date', timezone.now().date() + timedelta(days=14))
+        start_date, end_date = _parse_calendar_range(request.query_params, default_days=14)
         
         # Check for user_id parameter for flexibility
         user_id = request.query_params.get('user_id')
         if user_id:
-            try:
-                target_user = CustomUser.objects.get(id=user_id)
-                if hasattr(target_user, 'tutor_profile'):
-                    bookings = Booking.objects.filter(
-                        tutor=target_user,  # Use the user, not the profile
-                        date__range=[start_date, end_date]
-                    )
-                else:
-                    bookings = Booking.objects.none()
-            except CustomUser.DoesNotExist:
-                bookings = Booking.objects.none()
+            if not user_id.isdigit():
+                return Response({'error': 'Invalid user_id'}, status=status.HTTP_400_BAD_REQUEST)
+            # Another user's calendar only exposes their tutoring schedule
+            bookings = Booking.objects.filter(tutor_id=user_id, tutor__tutor_profile__isnull=False)
         else:
-            # Default behavior
-            if hasattr(user, 'tutor_profile'):
-                bookings = Booking.objects.filter(
-                    tutor=user,  # Use the user, not the profile
-                    date__range=[start_date, end_date]
-                )
-            else:
-                bookings = Booking.objects.none()
-        
+            # Default behavior: everything the current user teaches or attends
+            bookings = Booking.objects.filter(Q(tutor=request.user) | Q(student=request.user))
+
+        bookings = bookings.filter(date__range=[start_date, end_date])
+        etag = _calendar_etag(bookings, 'json', start_date, end_date)
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+
+        bookings = bookings.select_related('tutor', 'student', 'subject').order_by('date', 'start_time')
         serializer = self.get_serializer(bookings, many=True)
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['get'], url_path='calendar/ics')
+    def calendar_ics(self, request):
+        """Stream the current user's bookings and events as an iCalendar feed"""
+        today = timezone.now().date()
+        start_date, end_date = _parse_calendar_range(
+            request.query_params, default_days=120, default_start=today - timedelta(days=30)
+        )
+        user = request.user
+
+        bookings = Booking.objects.filter(
+            Q(tutor=user) | Q(student=user),
+            date__range=[start_date, end_date],
+        )
+        range_start = datetime.combine(start_date, time.min, tzinfo=dt_timezone.utc)
+        range_end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+        attending = EventParticipant.objects.filter(
+            event=OuterRef('pk'), user=user
+        ).exclude(status='declined')
+        events = Event.objects.filter(
+            Q(creator=user) | Q(Exists(attending)),
+            start_time__lt=range_end,
+            end_time__gte=range_start,
+        )
+
+        etag = _calendar_etag(bookings, 'ics', start_date, end_date, events)
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+
+        bookings = bookings.select_related('tutor', 'student', 'subject').order_by('date', 'start_time')
+        events = events.order_by('start_time')
+
+        def components():
+            for booking in bookings.iterator(chunk_size=500):
+                yield ics.booking_vevent(booking, user)
+            for event in events.iterator(chunk_size=500):
+                yield ics.event_vevent(event)
+
+        response = StreamingHttpResponse(
+            _stream_in_batches(ics.iter_calendar(components(), name=f'Ispani - {user.username}')),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = 'attachment; filename="ispani.ics"'
+        return response
 
     @action(detail=False, methods=['get'])
     def available_slots(self, request):
@@ -534,11 +716,10 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
         
         # Get existing bookings for this tutor on this date
-        existing_bookings = Booking.objects.filter(
+        existing_bookings = list(Booking.objects.filter(
             tutor=tutor,
             date=date_obj,
-            status__in=['pending', 'confirmed']
-        ).values_list('start_time', flat=True)
+        ).active().values_list('start_time', 'end_time'))
         
         # Generate available time slots (you can customize this logic)
         # This example shows hourly slots from 8 AM to 6 PM
@@ -547,9 +728,11 @@ class BookingViewSet(viewsets.ModelViewSet):
         end_hour = 18
         
         for hour in range(start_hour, end_hour):
-            slot_time = time(hour, 0)
-            if slot_time not in existing_bookings:
-                available_slots.append(slot_time.strftime('%H:%M'))
+            slot_start = time(hour, 0)
+            slot_end = time(hour + 1, 0)
+            # A slot is taken if any active booking overlaps it, not just one starting on the hour
+            if not any(start < slot_end and end > slot_start for start, end in existing_bookings):
+                available_slots.append(slot_start.strftime('%H:%M'))
         
         return Response({'available_slots': available_slots})
     
@@ -559,6 +742,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -585,8 +769,8 @@ class TutorDetailView(APIView):
     
     def get(self, request, user_id):
         try:
-            user = CustomUser.objects.get(id=user_id)
-            if hasattr(user, 'tutor_profile'):
+            user = with_profiles().get(id=user_id)
+            if has_role(user, 'tutor'):
                 serializer = TutorProfileSerializer(user.tutor_profile)
                 return Response(serializer.data)
             else:
@@ -599,8 +783,8 @@ class StudentUserDetailView(APIView):
     
     def get(self, request, user_id):
         try:
-            user = CustomUser.objects.get(id=user_id)
-            if hasattr(user, 'student_profile'):
+            user = with_profiles().get(id=user_id)
+            if has_role(user, 'student'):
                 serializer = StudentProfileSerializer(user.student_profile)
                 return Response(serializer.data)
             else: